@@ -1,24 +1,63 @@
 #!/usr/bin/env python3
+import time
+# Początek startu aplikacji - punkt odniesienia dla pomiaru czasu startu
+_STARTUP_T0 = time.perf_counter()
+
 import os
+import sys
 import json
+import threading
 import tkinter as tk
 from tkinter import (
     ttk, scrolledtext, messagebox, 
     filedialog, simpledialog
 )
 from datetime import datetime
-from threading import Thread
-import google.generativeai as genai
-from google.api_core import retry
-import matplotlib.pyplot as plt
-import re
-import io
-from PIL import Image, ImageTk 
 from pathlib import Path
 import uuid 
+import multiprocessing
 
 # Importuj moduł do zarządzania motywem
 import theme_manager 
+from conversation_store import ConversationStore
+from sqlite_store import SQLiteConversationStore
+from write_behind import WriteBehindWriter, ConversationWrites, atomic_write_json
+from conversation_list_model import ConversationListModel
+from streaming import StreamingReply, split_message_text
+from request_executor import RequestExecutor
+from latex_cache import LatexImageCache, make_key
+from latex_renderer import LatexRenderPool
+from chat_transcript import ChatTranscript
+from context_builder import ContextBuilder, with_token_count, make_summary, build_summary_prompt, estimate_tokens
+from chat_sessions import ChatSessionCache
+from context_cache import ContextCacheManager, GeminiCacheBackend, LocalCacheBackend
+from model_backend import create_backend
+from rate_limiter import RateLimiter, quota_key
+from instrumentation import Tracer, traced
+import exporters
+import importer
+from response_cache import (
+    ResponseCache, request_key, make_record as make_response_record,
+    MODES as RESPONSE_CACHE_MODES, MODE_OFF, MODE_CACHE, MODE_RECORD, MODE_REPLAY
+)
+# SDK Gemini, matplotlib i PIL są importowane dopiero przy pierwszym użyciu
+import gemini_sdk
+
+_STARTUP_IMPORTS_DONE = time.perf_counter()
+
+# Liczba wiadomości wczytywanych naraz z dysku przy przewijaniu w górę
+HISTORY_PAGE_SIZE = 100
+# Ile wiadomości jest naraz wyświetlonych w oknie czatu i ile dorysowuje się przy krawędzi
+TRANSCRIPT_WINDOW = 60
+TRANSCRIPT_MARGIN = 20
+# Co ile milisekund wątek Tk dopisuje do okna fragmenty odpowiedzi strumieniowej
+STREAM_DRAIN_INTERVAL_MS = 50
+# Model Gemini używany, gdy config.json nie podaje innego ("model")
+DEFAULT_MODEL_NAME = "gemini-1.5-flash"
+# Rozdzielczość renderowanych wzorów LaTeX
+LATEX_DPI = 300
+# Ustawiona (np. przez startup_benchmark.py): zmierz czas startu, wypisz wynik i zakończ
+STARTUP_BENCHMARK = bool(os.environ.get("GEMINI_CHAT_STARTUP_BENCHMARK"))
 
 class GeminiChatApp:
     def __init__(self, root):
@@ -29,36 +68,118 @@ class GeminiChatApp:
         
         # Inicjalizacja ścieżek konfiguracyjnych
         self.init_paths()
+
+        # Wątek zapisu w tle - żaden zapis na dysk nie blokuje wątku Tk
+        self.writer = WriteBehindWriter(on_error=self._on_background_write_error)
+        self._persistence_closed = False
+        # Importy archiwów w tle: (wątek, zdarzenie przerwania) - zamknięcie czeka na nie przed zamknięciem magazynu
+        self._imports = []
         
         # Wczytanie konfiguracji aplikacji (w tym stanu dark mode)
         # To musi być PRZED setup_ui, ponieważ setup_ui może używać wartości z config
         self.init_config() 
 
+        # Pomiary czasu gorących ścieżek (okno Diagnostyka, ślad w trace.jsonl)
+        self.tracer = Tracer(
+            self.trace_file,
+            enabled=self.trace_enabled.get(),
+            max_bytes=self.config.get('trace_max_mb', 5) * 1024 * 1024
+        )
+
+        # Magazyn konwersacji (pliki lub baza SQLite, zależnie od config.json)
+        self.init_store()
+        # Zapisy konwersacji w tle; odczyt widzi je od razu, bez czekania na dysk
+        self.conversation_writes = ConversationWrites(self.writer, self.store, tracer=self.tracer)
+
+        # Pamięć podręczna wyrenderowanych wzorów (RAM + pliki PNG w latex_cache)
+        self.latex_cache = LatexImageCache(
+            self.latex_cache_dir,
+            memory_budget=self.config.get('latex_cache_memory_mb', 64) * 1024 * 1024,
+            disk_budget=self.config.get('latex_cache_disk_mb', 256) * 1024 * 1024
+        )
+
+        # Wzory renderowane w osobnych procesach ("latex_workers" w config.json)
+        self.latex_pool = LatexRenderPool(max_workers=self.config.get('latex_workers', 2))
+        # Renderowania w toku: klucz obrazu -> lista (tag zastępnika, block_mode, generacja)
+        self._latex_pending = {}
+        self._latex_placeholder_seq = 0
+
+        # Składanie kontekstu zapytań w limicie tokenów wejściowych ("context_budget_tokens")
+        self.context_builder = ContextBuilder(
+            budget_tokens=self.config.get('context_budget_tokens', 32000),
+            summary_tokens=self.config.get('context_summary_tokens', 800)
+        )
+
+        # Backend modelu: Gemini API albo lokalny model testowy ("model_backend": "mock")
+        self.backend = create_backend(self.config)
+        self.model_name = self.config.get('model', DEFAULT_MODEL_NAME)
+        # Klucz API, z którym skonfigurowano backend (konfiguracja leniwa - _ensure_backend)
+        self._backend_key = None
+        self._backend_lock = threading.Lock()
+        # Wspólne limity zapytań i tokenów na minutę dla klucza API i modelu ("rate_limit" w config.json)
+        self.rate_limiter = RateLimiter.from_config(self.config.get('rate_limit'))
+
+        # Żywe sesje czatu kolejnych konwersacji (limit: "chat_sessions" w config.json)
+        self.chat_sessions = ChatSessionCache(self.backend.open_chat, max_sessions=self.config.get('chat_sessions', 8))
+
+        # Długi, stały początek kontekstu (prompt + wcześniejsze wiadomości) zapisywany
+        # po stronie modelu - kolejne zapytania wysyłają tylko nowe wiadomości
+        self.context_cache = None
+        if self.config.get('context_cache', True):
+            self.context_cache = ContextCacheManager(
+                GeminiCacheBackend() if self.backend.requires_api_key else LocalCacheBackend(self.backend.open_chat),
+                min_tokens=self.config.get('context_cache_min_tokens', 32768),
+                ttl_seconds=self.config.get('context_cache_ttl', 600)
+            )
+
+        # Zapamiętane odpowiedzi modelu (cache / nagrania do odtwarzania offline)
+        self.response_cache = ResponseCache(
+            self.response_cache_dir,
+            max_bytes=self.config.get('response_cache_mb', 64) * 1024 * 1024
+        )
+
+        # Pula wątków zapytań do modelu (liczba wątków: "request_workers" w config.json)
+        self.request_executor = RequestExecutor(
+            max_workers=self.config.get('request_workers', 2),
+            on_finished=lambda handle: self._call_in_ui(self._on_request_finished, handle)
+        )
+
         # Zmienne stanu
         self.conversation_history = []
+        # Liczba starszych wiadomości bieżącej konwersacji, które nie są jeszcze wczytane
+        self.history_start = 0
+        # Streszczenie starszych wiadomości bieżącej konwersacji (context_builder.make_summary) lub None
+        self.context_summary = None
         self.current_conversation_id = None 
-        self.conversations_metadata = [] 
-        self.rendered_images = [] 
-        self.model = None 
+        # Wzory wyświetlone w oknie czatu: klucz cache -> (PhotoImage, maska), ponownie używane przy przewijaniu
+        self.rendered_images = {} 
+        # Zwiększana przy każdym czyszczeniu okna czatu - spóźnione obrazy wzorów są porzucane
+        self.display_generation = 0
         self.api_key = None 
+        # Zapytania w toku: ID konwersacji -> (RequestHandle, StreamingReply lub None).
+        # Każda konwersacja może mieć własne zapytanie - odpowiedź trafia do niej,
+        # nawet jeśli w międzyczasie otwarto inną
+        self.inflight = {}
+        # Konwersacje w tle, do których przyszła nieprzeczytana odpowiedź
+        self.unread_conversations = set()
+        # Odpowiedź strumieniowa wyświetlana właśnie w oknie czatu lub None
+        self.displayed_reply = None
         # Ustaw początkowy limit tokenów z config.json lub domyślnie 65536
         self.max_output_tokens_limit = tk.IntVar(value=self.config.get('max_output_tokens', 65536))
 
         # Inicjalizacja interfejsu (pasek statusu musi być przed init_gemini)
         self.setup_ui()
+        self._refresh_quota_status()
         
-        # Konfiguracja Gemini API (po ustawieniu paska statusu)
-        self.init_gemini()
+        # Klucz API (po ustawieniu paska statusu); SDK ładuje się w tle po wyświetleniu okna
+        self.init_gemini(warm_up=False)
         
-        # Po załadowaniu UI i danych, upewnij się, że jest jakaś aktywna konwersacja
-        self.load_conversation_list() 
-        if not self.conversations_metadata:
-            self.create_new_conversation(initial_load=True) 
-        elif self.current_conversation_id is None or not any(c['id'] == self.current_conversation_id for c in self.conversations_metadata):
-            self.current_conversation_id = self.conversations_metadata[0]['id']
-            self.load_conversation_history(self.current_conversation_id)
-            self.display_current_conversation_messages()
-            self.update_conversations_listbox_selection()
+        # Lista konwersacji jest wczytywana w tle dopiero po pokazaniu okna
+        self.startup_marks = {
+            "imports": _STARTUP_IMPORTS_DONE - _STARTUP_T0,
+        }
+        self._first_map_done = False
+        self.root.bind("<Map>", self._on_first_map, add="+")
 
         # Ustaw początkowy motyw po załadowaniu konfiguracji i stworzeniu widżetów
         # Zbieramy wszystkie widżety, które chcemy stylizować dynamicznie
@@ -74,15 +195,87 @@ class GeminiChatApp:
             "chat_display": self.chat_display,
             "user_input": self.user_input,
             "system_prompt": self.system_prompt,
-            "status_bar": self.status_bar 
+            "status_bar": self.status_bar,
+            "quota_bar": self.quota_bar
         }
         # POPRAWIONA LINIA: Przekazujemy self.root jako pierwszy argument
         theme_manager.apply_theme_colors(self.root, self.all_app_widgets, "dark" if self.dark_mode_enabled.get() else "light")
 
 
+    # === Start aplikacji ===
+    def _mark_startup(self, name):
+        """Zapisuje czas (od początku importu modułu) etapu startu."""
+        self.startup_marks.setdefault(name, time.perf_counter() - _STARTUP_T0)
+
+    def _on_first_map(self, event):
+        """Okno zostało pokazane - dalsza inicjalizacja nie opóźnia już pierwszego rysowania."""
+        if event.widget is not self.root or self._first_map_done:
+            return
+        self._first_map_done = True
+        self._mark_startup("window_mapped")
+        self.root.after_idle(self._after_first_paint)
+
+    def _after_first_paint(self):
+        self._mark_startup("first_paint")
+        self.status_var.set("Wczytywanie listy konwersacji...")
+        threading.Thread(target=self._load_initial_conversations, name="conversation-list", daemon=True).start()
+
+    def _load_initial_conversations(self):
+        """Wczytuje indeks konwersacji (w wątku pomocniczym) i przekazuje wynik do wątku Tk."""
+        try:
+            entries, error = self.store.list_conversations(refresh=True), None
+        except Exception as e:
+            entries, error = None, e
+        self._call_in_ui(self._on_initial_conversations, entries, error)
+
+    def _on_initial_conversations(self, entries, error):
+        """Wypełnia listę konwersacji i otwiera pierwszą z nich (wątek Tk)."""
+        if error is not None:
+            messagebox.showwarning(
+                "Ostrzeżenie",
+                f"Nie można wczytać listy konwersacji:\n{str(error)}"
+            )
+            entries = self.store.list_conversations(refresh=False)
+        metas = ({"id": e["id"], "name": e["name"]} for e in entries)
+        if len(self.conversation_list):
+            # Użytkownik zdążył już coś utworzyć - nie usuwaj tego, tylko dopisz resztę
+            for meta in metas:
+                self.conversation_list.upsert(meta)
+        else:
+            self.conversation_list.sync(metas)
+        self._mark_startup("conversations_loaded")
+        self._update_api_status()
+
+        if STARTUP_BENCHMARK:
+            self._finish_startup_benchmark()
+            return
+
+        # Upewnij się, że jest jakaś aktywna konwersacja
+        if not len(self.conversation_list):
+            self.create_new_conversation(initial_load=True) 
+        elif self.current_conversation_id not in self.conversation_list:
+            self.current_conversation_id = self.conversation_list.first_id()
+            self.load_conversation_history(self.current_conversation_id)
+        self.update_conversations_listbox_selection()
+
+        # SDK Gemini ładuje się w tle, żeby pierwsze wysłanie nie czekało na import
+        self._warm_up_gemini()
+
+    def _finish_startup_benchmark(self):
+        """Tryb pomiaru startu: wypisuje czasy etapów (JSON) i zamyka aplikację."""
+        result = dict(self.startup_marks)
+        result["conversations"] = len(self.conversation_list)
+        result["sdk_loaded"] = gemini_sdk.is_loaded()
+        print("STARTUP_BENCHMARK " + json.dumps(result), flush=True)
+        self.shutdown_requests()
+        self.latex_pool.shutdown()
+        self.shutdown_persistence()
+        self.root.destroy()
+
     def init_paths(self):
         """Inicjalizuje ścieżki do plików konfiguracyjnych"""
-        self.app_data_dir = Path(__file__).parent
+        # GEMINI_CHAT_DATA_DIR pozwala uruchomić aplikację na osobnym katalogu danych (np. pomiary)
+        self.app_data_dir = Path(os.environ.get("GEMINI_CHAT_DATA_DIR") or Path(__file__).parent)
         os.makedirs(self.app_data_dir, exist_ok=True)
         
         self.preprompts_file = os.path.join(
@@ -94,6 +287,11 @@ class GeminiChatApp:
             "conversations"
         )
         os.makedirs(self.conversations_dir, exist_ok=True)
+        self.conversation_index_file = os.path.join(self.app_data_dir, "conversations_index.json")
+        self.sqlite_db_file = os.path.join(self.app_data_dir, "conversations.db")
+        self.latex_cache_dir = os.path.join(self.app_data_dir, "latex_cache")
+        self.response_cache_dir = os.path.join(self.app_data_dir, "response_cache")
+        self.trace_file = os.path.join(self.app_data_dir, "trace.jsonl")
         self.api_key_file = os.path.join(self.app_data_dir, "api_key.txt")
         self.config_file = os.path.join(self.app_data_dir, "config.json") # Plik konfiguracyjny
 
@@ -112,47 +310,277 @@ class GeminiChatApp:
         
         # Inicjalizacja zmiennej dla trybu ciemnego
         self.dark_mode_enabled = tk.BooleanVar(value=self.config.get('dark_mode', False))
+        # Odpowiedzi modelu wyświetlane na bieżąco (stream=True)
+        self.streaming_enabled = tk.BooleanVar(value=self.config.get('streaming', True))
+        # Tryb cache odpowiedzi bieżącej konwersacji (zapisywany w jej nagłówku);
+        # "response_cache_mode" w config.json to tryb dla nowych konwersacji
+        self.response_cache_mode = tk.StringVar(value=self.default_response_cache_mode())
+        # Pomiary czasu operacji (Ustawienia -> Diagnostyka...)
+        self.trace_enabled = tk.BooleanVar(value=self.config.get('trace', False))
         # trace_add("write", ...) zostanie dodane po utworzeniu self.status_var
         # Upewnij się, że max_output_tokens_limit jest również zapisywany
         
+    def default_response_cache_mode(self):
+        mode = self.config.get('response_cache_mode', MODE_OFF)
+        return mode if mode in RESPONSE_CACHE_MODES else MODE_OFF
+
+    def init_store(self):
+        """
+        Tworzy magazyn konwersacji wybrany w config.json:
+        "storage_backend": "sqlite" - baza SQLite z wyszukiwaniem pełnotekstowym,
+        w przeciwnym razie pliki w katalogu conversations ("storage_mode": "journal" lub "json").
+        """
+        if self.config.get('storage_backend') == 'sqlite':
+            self.store = SQLiteConversationStore(self.sqlite_db_file)
+            if not self.store.get_meta("json_import_done"):
+                # Jednorazowy import istniejących plików konwersacji do bazy
+                imported = self.store.import_conversation_files(self.conversations_dir)
+                print(f"Zaimportowano {imported} konwersacji do bazy SQLite.")
+        else:
+            self.store = ConversationStore(
+                self.conversations_dir,
+                self.conversation_index_file,
+                mode=self.config.get('storage_mode', 'journal')
+            )
+
     def save_config(self, *args): # Dodajemy *args, bo trace_add przekazuje argumenty
-        """Zapisuje konfigurację aplikacji do pliku."""
+        """Zapisuje konfigurację aplikacji do pliku (w tle, kolejne zapisy są łączone)."""
         try:
             self.config['dark_mode'] = self.dark_mode_enabled.get()
             self.config['max_output_tokens'] = self.max_output_tokens_limit.get() # Zapisz limit tokenów
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(
-                    self.config, 
-                    f, 
-                    indent=2, 
-                    ensure_ascii=False
-                )
+            self.config['streaming'] = self.streaming_enabled.get()
+            self.config['trace'] = self.trace_enabled.get()
+            snapshot = dict(self.config)
+            self.writer.submit('config', lambda: atomic_write_json(self.config_file, snapshot))
         except Exception as e:
             print(f"Błąd zapisu konfiguracji: {e}") # Do debugowania
 
-    def init_gemini(self):
-        """Konfiguruje połączenie z Gemini API i ładuje klucz API"""
-        self.api_key = None 
-        self.model = None 
+    def _on_background_write_error(self, key, error):
+        """Wywoływane w wątku zapisu - pokazuje błąd w wątku Tk."""
+        self._call_in_ui(
+            messagebox.showerror,
+            "Błąd zapisu",
+            f"Nie można zapisać danych ({key}):\n{str(error)}"
+        )
+
+    def _call_in_ui(self, func, *args):
+        """Zleca wywołanie funkcji w wątku Tk (bezpieczne także po zamknięciu okna)."""
+        try:
+            self.root.after(0, func, *args)
+        except (RuntimeError, tk.TclError):
+            pass
+
+    def show_write_stats(self):
+        """Pokazuje statystyki zapisu w tle (głębokość kolejki, czas zapisu)."""
+        stats = self.writer.stats()
+        messagebox.showinfo(
+            "Statystyki zapisu",
+            f"Zadania w kolejce: {stats['queue_depth']}\n"
+            f"Zleconych zapisów: {stats['submitted']}\n"
+            f"Wykonanych zapisów: {stats['written']}\n"
+            f"Połączonych zapisów: {stats['coalesced']}\n"
+            f"Błędów: {stats['failed']}\n"
+            f"Czas ostatniego zapisu: {stats['last_latency_ms']:.1f} ms\n"
+            f"Średni czas zapisu: {stats['avg_latency_ms']:.1f} ms\n"
+            f"Najdłuższy zapis: {stats['max_latency_ms']:.1f} ms"
+        )
+
+    def show_latex_cache_stats(self):
+        """Pokazuje trafienia i zajętość pamięci podręcznej wzorów LaTeX."""
+        stats = self.latex_cache.stats()
+        if messagebox.askyesno(
+            "Statystyki cache LaTeX",
+            f"Trafienia w pamięci: {stats['memory_hits']}\n"
+            f"Trafienia na dysku: {stats['disk_hits']}\n"
+            f"Chybienia: {stats['misses']}\n"
+            f"Skuteczność: {stats['hit_rate'] * 100:.1f}%\n"
+            f"Obrazy w pamięci: {stats['memory_items']} ({stats['memory_bytes'] / 1024 / 1024:.1f} MB)\n"
+            f"Obrazy na dysku: {stats['disk_items']} ({stats['disk_bytes'] / 1024 / 1024:.1f} MB)\n\n"
+            "Wyczyścić pamięć podręczną?"
+        ):
+            self.latex_cache.clear()
+            self.status_var.set("Wyczyszczono cache LaTeX.")
+
+    def on_response_cache_mode_changed(self):
+        """Zapisuje w konwersacji wybrany tryb cache odpowiedzi."""
+        if self.current_conversation_id:
+            self.save_conversation()
+        self.status_var.set(f"Cache odpowiedzi: {self.response_cache_mode.get()}")
+
+    def show_response_cache_stats(self):
+        """Pokazuje trafienia i zajętość pamięci podręcznej odpowiedzi modelu."""
+        stats = self.response_cache.stats()
+        if messagebox.askyesno(
+            "Statystyki cache odpowiedzi",
+            f"Trafienia: {stats['hits']}\n"
+            f"Chybienia: {stats['misses']}\n"
+            f"Zapisane odpowiedzi: {stats['items']} ({stats['bytes'] / 1024 / 1024:.1f} MB)\n\n"
+            "Wyczyścić pamięć podręczną (także nagrania)?"
+        ):
+            self.response_cache.clear()
+            self.status_var.set("Wyczyszczono cache odpowiedzi.")
+
+    def show_diagnostics_window(self):
+        """
+        Okno z percentylami czasów operacji (z ostatnich pomiarów Tracer),
+        odświeżane co sekundę, oraz stanem kolejek i pamięci podręcznych.
+        """
+        window = tk.Toplevel(self.root)
+        window.title("Diagnostyka")
+        window.geometry("720x460")
+
+        top_frame = ttk.Frame(window)
+        top_frame.pack(fill=tk.X, padx=10, pady=10)
+
+        def on_trace_toggled():
+            self.tracer.enabled = self.trace_enabled.get()
+            self.save_config()
+
+        ttk.Checkbutton(
+            top_frame, text="Mierz czasy operacji (zapis do trace.jsonl)",
+            variable=self.trace_enabled, command=on_trace_toggled
+        ).pack(side=tk.LEFT)
+        ttk.Button(top_frame, text="Wyczyść", command=self.tracer.reset).pack(side=tk.RIGHT)
+
+        columns = ("count", "p50", "p95", "p99", "max")
+        tree = ttk.Treeview(window, columns=columns, height=12)
+        tree.heading("#0", text="Operacja")
+        tree.column("#0", width=230)
+        for column, title in zip(columns, ("Liczba", "p50 [ms]", "p95 [ms]", "p99 [ms]", "max [ms]")):
+            tree.heading(column, text=title)
+            tree.column(column, width=85, anchor=tk.E)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10)
+
+        stats_var = tk.StringVar()
+        ttk.Label(window, textvariable=stats_var, justify=tk.LEFT).pack(fill=tk.X, padx=10, pady=10)
+
+        def refresh():
+            if not window.winfo_exists():
+                return
+            tree.delete(*tree.get_children())
+            for name, p in self.tracer.percentiles().items():
+                tree.insert("", tk.END, text=name, values=(
+                    p["count"], f"{p['p50']:.1f}", f"{p['p95']:.1f}", f"{p['p99']:.1f}", f"{p['max']:.1f}"
+                ))
+            if not self.tracer.enabled:
+                tree.insert("", tk.END, text="(pomiary wyłączone)")
+            writes = self.writer.stats()
+            latex = self.latex_cache.stats()
+            sessions = self.chat_sessions.stats()
+            responses = self.response_cache.stats()
+            limits = self.rate_limiter.stats()
+            lines = [
+                f"Zapytania w toku: {len(self.request_executor.active())}   "
+                f"Zapisy w kolejce: {writes['queue_depth']}   "
+                f"Wzory w renderowaniu: {len(self._latex_pending)}",
+                f"Cache LaTeX: {latex['hit_rate'] * 100:.0f}% trafień   "
+                f"Sesje czatu: {sessions['sessions']} (ponownie użyte {sessions['hits']}, nowe {sessions['misses']})   "
+                f"Cache odpowiedzi: {responses['hits']} trafień / {responses['misses']} chybień",
+            ]
+            lines.append(
+                f"Limity API: {limits['waits']} oczekiwań ({limits['waited']:.0f} s)   "
+                f"ponowienia: {limits['retries']}   błędy 429: {limits['quota_errors']}"
+            )
+            if self.context_cache is not None:
+                context = self.context_cache.stats()
+                lines.append(f"Cache kontekstu: {context['entries']} zapisów, ~{context['cached_tokens']} tok.")
+            stats_var.set("\n".join(lines))
+            window.after(1000, refresh)
+
+        refresh()
+
+    def shutdown_requests(self, timeout=5):
+        """Przerywa zapytania do modelu i czeka na zakończenie wątków puli."""
+        if not self.request_executor.shutdown(timeout):
+            print("Nie wszystkie zapytania zakończyły się przed zamknięciem.")
+
+    def shutdown_persistence(self, timeout=10):
+        """Przerywa importy w tle, zapisuje wszystko, co czeka w kolejce, i zamyka magazyn konwersacji."""
+        if self._persistence_closed:
+            return
+        self._persistence_closed = True
+        deadline = time.monotonic() + timeout
+        for _, cancel_event in self._imports:
+            cancel_event.set()
+        for thread, _ in self._imports:
+            # Przerwany import zapisuje jeszcze bieżącą partię
+            thread.join(max(0.0, deadline - time.monotonic()))
+            if thread.is_alive():
+                print("Import konwersacji nie zakończył się przed zamknięciem.")
+        if not self.writer.shutdown(timeout):
+            print("Nie wszystkie dane zdążyły się zapisać przed zamknięciem.")
+        self.store.close()
+        self.tracer.close()
+
+    def init_gemini(self, warm_up=True):
+        """
+        Wczytuje klucz API. Sam backend (i SDK Gemini) jest konfigurowany leniwie przez
+        _ensure_backend - w tle (warm_up=True) lub przy pierwszym zapytaniu.
+        """
+        with self._backend_lock:
+            self.api_key = None 
+        self.chat_sessions.invalidate()
+        if self.context_cache is not None:
+            self.context_cache.invalidate()
 
         if os.path.exists(self.api_key_file):
             try:
                 with open(self.api_key_file, 'r') as f:
                     self.api_key = f.read().strip()
-                if self.api_key:
-                    genai.configure(api_key=self.api_key) 
-                    self.model = genai.GenerativeModel("gemini-1.5-flash") # Updated model to 1.5-flash
-                    self.status_var.set("Połączono z Gemini API.")
-                else:
-                    self.status_var.set("Brak klucza API w pliku. Ustaw w menu Ustawienia.")
             except Exception as e:
                 messagebox.showerror(
                     "Błąd inicjalizacji API", 
                     f"Nie można wczytać klucza API z pliku:\n{str(e)}"
                 )
                 self.status_var.set("Błąd ładowania klucza API z pliku.")
+                return
+        self._update_api_status()
+        if warm_up:
+            self._warm_up_gemini()
+
+    def _update_api_status(self):
+        """Pokazuje na pasku statusu stan klucza API i połączenia."""
+        if not self.backend.requires_api_key:
+            self.status_var.set(f"Lokalny model testowy ({self.backend.name}).")
+        elif self.api_key and self._backend_key == self.api_key:
+            self.status_var.set("Połączono z Gemini API.")
+        elif self.api_key:
+            self.status_var.set("Gotowy.")
+        elif os.path.exists(self.api_key_file):
+            self.status_var.set("Brak klucza API w pliku. Ustaw w menu Ustawienia.")
         else:
             self.status_var.set("Plik klucza API nie istnieje. Ustaw w menu Ustawienia.")
+
+    def _ensure_backend(self):
+        """
+        Zwraca backend gotowy do zapytań (lub None bez klucza API), przy pierwszym
+        wywołaniu konfigurując go kluczem (Gemini: import SDK). Dowolny wątek.
+        """
+        with self._backend_lock:
+            if not self.backend.requires_api_key:
+                return self.backend
+            if not self.api_key:
+                return None
+            if self._backend_key != self.api_key:
+                self.backend.configure(self.api_key) 
+                self._backend_key = self.api_key
+            return self.backend
+
+    def _warm_up_gemini(self):
+        """Ładuje SDK i konfiguruje model w wątku pomocniczym."""
+        if not self.api_key or not self.backend.requires_api_key:
+            return
+
+        def warm_up():
+            try:
+                self._ensure_backend()
+            except Exception as e:
+                print(f"Błąd konfiguracji Gemini API: {e}")
+                self._call_in_ui(self.status_var.set, "Błąd konfiguracji Gemini API.")
+                return
+            self._call_in_ui(self._update_api_status)
+
+        threading.Thread(target=warm_up, name="gemini-warm-up", daemon=True).start()
         
     def setup_ui(self):
         """Konfiguruje cały interfejs użytkownika"""
@@ -191,10 +619,23 @@ class GeminiChatApp:
             label="Zmień nazwę konwersacji",
             command=self.rename_current_conversation 
         )
+        file_menu.add_command(
+            label="Szukaj w konwersacjach...",
+            command=self.show_search_window,
+            accelerator="Ctrl+F"
+        )
         file_menu.add_command(
             label="Eksportuj jako...", 
             command=self.export_conversation
         )
+        file_menu.add_command(
+            label="Eksportuj wszystkie konwersacje...",
+            command=self.export_all_conversations
+        )
+        file_menu.add_command(
+            label="Importuj konwersacje...",
+            command=self.import_conversations
+        )
         file_menu.add_separator()
         file_menu.add_command(
             label="Zakończ", 
@@ -224,11 +665,46 @@ class GeminiChatApp:
             label="Ustaw limit tokenów wyjściowych...",
             command=self.open_token_limit_settings 
         )
+        settings_menu.add_command(
+            label="Statystyki zapisu...",
+            command=self.show_write_stats
+        )
+        settings_menu.add_command(
+            label="Statystyki cache LaTeX...",
+            command=self.show_latex_cache_stats
+        )
+        settings_menu.add_command(
+            label="Diagnostyka...",
+            command=self.show_diagnostics_window
+        )
+        settings_menu.add_checkbutton(
+            label="Odpowiedzi strumieniowe",
+            variable=self.streaming_enabled,
+            command=self.save_config
+        )
         settings_menu.add_checkbutton( # Opcja dla trybu ciemnego
             label="Tryb Ciemny",
             variable=self.dark_mode_enabled,
             command=self.toggle_dark_mode # Wywołaj funkcję przełączającą
         )
+        response_cache_menu = tk.Menu(settings_menu, tearoff=0)
+        for label, mode in (
+            ("Wyłączony", MODE_OFF),
+            ("Używaj i zapamiętuj", MODE_CACHE),
+            ("Nagrywaj odpowiedzi", MODE_RECORD),
+            ("Odtwarzaj nagrania (offline)", MODE_REPLAY),
+        ):
+            response_cache_menu.add_radiobutton(
+                label=label, value=mode,
+                variable=self.response_cache_mode,
+                command=self.on_response_cache_mode_changed
+            )
+        response_cache_menu.add_separator()
+        response_cache_menu.add_command(
+            label="Statystyki cache odpowiedzi...",
+            command=self.show_response_cache_stats
+        )
+        settings_menu.add_cascade(label="Cache odpowiedzi (ta konwersacja)", menu=response_cache_menu)
         menubar.add_cascade(label="Ustawienia", menu=settings_menu)
         
         self.root.config(menu=menubar)
@@ -236,6 +712,7 @@ class GeminiChatApp:
         # Skróty klawiaturowe
         self.root.bind("<Control-n>", lambda e: self.create_new_conversation()) 
         self.root.bind("<Control-s>", lambda e: self.save_conversation())
+        self.root.bind("<Control-f>", lambda e: self.show_search_window())
 
     def setup_main_frames(self):
         """Konfiguruje główne obszary interfejsu"""
@@ -264,6 +741,8 @@ class GeminiChatApp:
             selectmode=tk.SINGLE
         )
         self.conversation_listbox.pack(fill=tk.X)
+        # Model listy: ID <-> wiersz, do widżetu trafiają tylko zmiany
+        self.conversation_list = ConversationListModel(self.conversation_listbox, format_label=self._conversation_label)
         self.conversation_listbox.bind(
             "<<ListboxSelect>>", 
             self.on_conversation_select
@@ -351,6 +830,15 @@ class GeminiChatApp:
             state='disabled'
         )
         self.chat_display.pack(fill=tk.BOTH, expand=True)
+        # W oknie jest tylko fragment rozmowy wokół widoku; przewijanie dorysowuje resztę
+        self.transcript = ChatTranscript(
+            self.chat_display,
+            self.chat_display.vbar,
+            render_message=self._display_history_message,
+            fetch_messages=self._get_history_range,
+            window=TRANSCRIPT_WINDOW,
+            margin=TRANSCRIPT_MARGIN
+        )
         
         # Konfiguracja tagów - kolory będą ustawiane przez apply_theme_colors
         self.chat_display.tag_config('user_prefix', font=('Arial', 11, 'bold'))
@@ -358,6 +846,8 @@ class GeminiChatApp:
         self.chat_display.tag_config('bot_prefix', font=('Arial', 11, 'bold'))
         self.chat_display.tag_config('bot_text', font=('Arial', 11))
         self.chat_display.tag_config('error', font=('Arial', 11))
+        self.chat_display.tag_config('search_hit') # Kolor ustawia apply_theme_colors
+        self.chat_display.tag_config('latex_pending', foreground='gray')
         
         input_frame = ttk.Frame(self.right_panel)
         input_frame.pack(fill=tk.X, pady=(10, 0))
@@ -383,6 +873,15 @@ class GeminiChatApp:
             lambda e: self.send_message()
         )
         
+        self.stop_button = ttk.Button(
+            input_frame,
+            text="Zatrzymaj",
+            command=self.stop_requests,
+            state='disabled'
+        )
+        self.stop_button.pack(side=tk.RIGHT, padx=(5, 0))
+        self.root.bind("<Escape>", lambda e: self.stop_requests())
+
         ttk.Button(
             input_frame,
             text="Wyślij",
@@ -394,13 +893,46 @@ class GeminiChatApp:
         self.status_var = tk.StringVar()
         self.status_var.set("Gotowy")
         
+        status_frame = ttk.Frame(self.root)
+        status_frame.pack(fill=tk.X)
         self.status_bar = ttk.Label( # Zapisz jako atrybut instancji
-            self.root,
+            status_frame,
             textvariable=self.status_var,
             relief=tk.SUNKEN,
             anchor=tk.W
         )
-        self.status_bar.pack(fill=tk.X)
+        self.status_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
+
+        # Zapas limitów API (RateLimiter), odświeżany co sekundę
+        self.quota_var = tk.StringVar()
+        self.quota_bar = ttk.Label(
+            status_frame,
+            textvariable=self.quota_var,
+            relief=tk.SUNKEN,
+            anchor=tk.E
+        )
+        self.quota_bar.pack(side=tk.RIGHT)
+
+    def _quota_key(self):
+        """Klucz limitów bieżącego klucza API (None - lokalny model testowy, bez limitów)."""
+        return quota_key(self.api_key) if self.backend.requires_api_key else None
+
+    def _refresh_quota_status(self):
+        """Pokazuje na pasku statusu zapas zapytań i tokenów na minutę."""
+        try:
+            self.quota_var.set(self.rate_limiter.describe(self._quota_key(), self.model_name))
+            self.root.after(1000, self._refresh_quota_status)
+        except tk.TclError:
+            pass
+
+    def _on_rate_limit_wait(self, conv_id, seconds):
+        """Zapytanie czeka na limit API (wywoływane w wątku zapytania)."""
+        self.tracer.record("request.rate_limit_wait", seconds)
+        self._call_in_ui(self._show_rate_limit_wait, conv_id, seconds)
+
+    def _show_rate_limit_wait(self, conv_id, seconds):
+        if conv_id == self.current_conversation_id:
+            self.status_var.set(f"Limit zapytań API - wysłanie za {seconds:.0f} s...")
 
     # === Metody zarządzania prepromptami ===
     def load_preprompts(self):
@@ -421,15 +953,10 @@ class GeminiChatApp:
             self.preprompt_listbox.insert(tk.END, name)
 
     def save_preprompts(self):
-        """Zapisuje preprompty do pliku"""
+        """Zapisuje preprompty do pliku (w tle; błąd zapisu zgłasza wątek zapisu)"""
         try:
-            with open(self.preprompts_file, 'w', encoding='utf-8') as f:
-                json.dump(
-                    self.preprompts, 
-                    f, 
-                    indent=2, 
-                    ensure_ascii=False
-                )
+            snapshot = dict(self.preprompts)
+            self.writer.submit('preprompts', lambda: atomic_write_json(self.preprompts_file, snapshot))
             return True
         except Exception as e:
             messagebox.showerror(
@@ -605,51 +1132,37 @@ class GeminiChatApp:
             )
 
     # === Metody zarządzania konwersacjami ===
-    def load_conversation_list(self):
+    def load_conversation_list(self, refresh=True):
         """
-        Wczytuje listę zapisanych konwersacji (ID i nazwy)
-        na podstawie plików w katalogu conversations_dir.
+        Wczytuje listę zapisanych konwersacji (ID i nazwy) z indeksu konwersacji.
+        refresh=True sprawdza indeks z plikami w conversations_dir (parsowane są
+        tylko pliki zmienione od ostatniego razu); refresh=False tylko
+        odświeża Listbox na podstawie indeksu aktualizowanego przy zapisie.
+        Listbox nie jest czyszczony - model nanosi wyłącznie różnice.
         """
-        self.conversations_metadata = []
         try:
-            for filename in os.listdir(self.conversations_dir):
-                if filename.endswith('.json'):
-                    file_id = os.path.splitext(filename)[0]
-                    filepath = os.path.join(self.conversations_dir, filename)
-                    try:
-                        with open(filepath, 'r', encoding='utf-8') as f:
-                            data = json.load(f)
-                            conversation_name = data.get("name", file_id) 
-                            self.conversations_metadata.append({"id": file_id, "name": conversation_name})
-                    except json.JSONDecodeError as e:
-                        print(f"Błąd odczytu pliku JSON: {filename} - {e}")
-                        self.status_var.set(f"Błąd odczytu: {filename}")
-                    except Exception as e:
-                        print(f"Nieoczekiwany błąd podczas ładowania {filename}: {e}")
-                        self.status_var.set(f"Błąd: {filename}")
+            entries = self.store.list_conversations(refresh=refresh)
         except Exception as e:
             messagebox.showwarning(
                 "Ostrzeżenie",
                 f"Nie można wczytać listy konwersacji:\n{str(e)}"
             )
-        
-        self.conversations_metadata.sort(key=lambda x: x['name'].lower())
-        
-        self.conversation_listbox.delete(0, tk.END)
-        for conv_meta in self.conversations_metadata:
-            self.conversation_listbox.insert(tk.END, conv_meta['name'])
-        
+            entries = self.store.list_conversations(refresh=False)
+
+        self.conversation_list.sync({"id": e["id"], "name": e["name"]} for e in entries)
         self.update_conversations_listbox_selection()
 
+    def _conversation_label(self, meta):
+        """Tekst wiersza listy: ⏳ - trwa generowanie odpowiedzi, ● - nieprzeczytana odpowiedź."""
+        if meta['id'] in self.inflight:
+            return f"⏳ {meta['name']}"
+        if meta['id'] in self.unread_conversations:
+            return f"● {meta['name']}"
+        return meta['name']
+
     def update_conversations_listbox_selection(self):
         """Zaznacza aktywną konwersację w Listboxie."""
-        self.conversation_listbox.selection_clear(0, tk.END)
-        if self.current_conversation_id:
-            for i, conv_meta in enumerate(self.conversations_metadata):
-                if conv_meta['id'] == self.current_conversation_id:
-                    self.conversation_listbox.selection_set(i)
-                    self.conversation_listbox.see(i) 
-                    break
+        self.conversation_list.select(self.current_conversation_id)
 
     def create_new_conversation(self, initial_load=False): 
         """
@@ -678,32 +1191,27 @@ class GeminiChatApp:
 
         new_id = str(uuid.uuid4()) 
 
-        filepath = os.path.join(self.conversations_dir, f"{new_id}.json")
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump({
-                    "id": new_id,
-                    "name": new_conv_name,
-                    "system_prompt": self.system_prompt.get(),
-                    "history": [],
-                    "created_at": datetime.now().isoformat(),
-                    "last_modified": datetime.now().isoformat()
-                }, f, indent=2, ensure_ascii=False)
+            header = {
+                "name": new_conv_name,
+                "system_prompt": self.system_prompt.get()
+            }
+            self.conversation_writes.save(new_id, header, [])
         except Exception as e:
             messagebox.showerror("Błąd", f"Nie udało się utworzyć nowej konwersacji: {e}")
             return
             
         self.conversation_history = []
+        self.history_start = 0
+        self.context_summary = None
+        self.response_cache_mode.set(self.default_response_cache_mode())
         self.current_conversation_id = new_id
-        self.chat_display.config(state='normal')
-        self.chat_display.delete('1.0', tk.END)
-        self.chat_display.config(state='disabled')
+        self.conversation_list.upsert({"id": new_id, "name": new_conv_name})
+        self.update_conversations_listbox_selection()
+        self.display_current_conversation_messages()
         self.status_var.set(f"Nowa konwersacja: '{new_conv_name}'")
-        self.rendered_images = [] 
-        
-        self.load_conversation_list() 
-        self.update_conversations_listbox_selection() 
 
+    @traced("save_conversation")
     def save_conversation(self):
         """
         Zapisuje aktualnie aktywną konwersację do pliku JSON.
@@ -734,30 +1242,31 @@ class GeminiChatApp:
             self.current_conversation_id = new_id
             conversation_name = new_conv_name
             
-            self.conversations_metadata.append({"id": new_id, "name": conversation_name})
-            self.conversations_metadata.sort(key=lambda x: x['name'].lower()) 
+            self.conversation_list.upsert({"id": new_id, "name": conversation_name})
             self.update_conversations_listbox_selection() 
         
-        filename = f"{self.current_conversation_id}.json"
-        filepath = os.path.join(self.conversations_dir, filename)
-        
         try:
-            created_at = self._get_creation_date_from_file(filepath)
-
-            data = {
-                "id": self.current_conversation_id,
+            # Zapis idzie do wątku w tle na kopii danych; magazyn sam pamięta
+            # created_at i dopisuje tylko nowe wiadomości
+            conv_id = self.current_conversation_id
+            header = {
                 "name": conversation_name, 
-                "system_prompt": self.system_prompt.get(),
-                "history": self.conversation_history,
-                "created_at": created_at,
-                "last_modified": datetime.now().isoformat()
+                "system_prompt": self.system_prompt.get()
             }
-            
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-            
-            self.status_var.set(f"Konwersacja '{conversation_name}' zapisana.")
-            self.load_conversation_list() 
+            if self.context_summary is not None:
+                header["context_summary"] = self.context_summary
+            header["response_cache"] = self.response_cache_mode.get()
+            history = list(self.conversation_history)
+            start = self.history_start
+
+            def on_saved():
+                self.status_var.set(f"Konwersacja '{conversation_name}' zapisana.")
+                self.conversation_list.upsert({"id": conv_id, "name": conversation_name})
+
+            self.conversation_writes.save(
+                conv_id, header, history, start=start,
+                on_done=lambda: self._call_in_ui(on_saved)
+            )
             return True
             
         except Exception as e:
@@ -767,103 +1276,208 @@ class GeminiChatApp:
             )
             return False
 
-    def _get_creation_date_from_file(self, filepath):
-        """Pobiera datę 'created_at' z istniejącego pliku, jeśli istnieje."""
-        if os.path.exists(filepath):
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    return data.get("created_at", datetime.now().isoformat())
-            except (json.JSONDecodeError, IOError):
-                pass
-        return datetime.now().isoformat()
-
     def load_selected_conversation(self):
         """Ładuje wybraną konwersację z Listboxa."""
-        selection_index = self.conversation_listbox.curselection()
-        if not selection_index:
+        if not self.conversation_listbox.curselection():
             messagebox.showwarning("Wybór konwersacji", "Proszę wybrać konwersację z listy.")
             return
 
-        index = selection_index[0]
-        selected_name_from_listbox = self.conversation_listbox.get(index)
-        
-        selected_conv_id = None
-        for conv_meta in self.conversations_metadata:
-            if conv_meta['name'] == selected_name_from_listbox:
-                selected_conv_id = conv_meta['id']
-                break
-
-        if selected_conv_id and self.current_conversation_id != selected_conv_id:
-            if self.conversation_history and messagebox.askyesno(
-                "Zapisz konwersację?",
-                "Czy chcesz zapisać obecną konwersację przed załadowaniem innej?"
-            ):
-                self.save_conversation() 
-
-            self.current_conversation_id = selected_conv_id
-            self.load_conversation_history(self.current_conversation_id)
-            self.display_current_conversation_messages()
-            self.status_var.set(f"Załadowano konwersację: '{selected_name_from_listbox}'")
-        elif not selected_conv_id:
+        selected_conv_id = self.conversation_list.selected_id()
+        if not selected_conv_id:
             messagebox.showerror("Błąd", "Nie znaleziono ID dla wybranej konwersacji.")
+            return
+        self.open_conversation(selected_conv_id)
 
+    @traced("load_conversation_history")
     def load_conversation_history(self, conv_id):
-        """Ładuje pełną historię i system_prompt dla danej konwersacji."""
-        filepath = os.path.join(self.conversations_dir, f"{conv_id}.json")
+        """
+        Ładuje system_prompt i ostatnie HISTORY_PAGE_SIZE wiadomości danej konwersacji.
+        Starsze wiadomości są doczytywane przy przewijaniu w górę (_get_history_range)
+        lub w całości przez get_full_history, gdy potrzebuje ich model.
+        """
         self.conversation_history = []
+        self.history_start = 0
+        self.context_summary = None
         self.system_prompt.delete(0, tk.END) 
         self.system_prompt.insert(0, "Jesteś pomocnym asystentem. Odpowiadaj w języku polskim.") 
 
-        if os.path.exists(filepath):
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.conversation_history = data.get("history", [])
-                    self.system_prompt.delete(0, tk.END)
-                    self.system_prompt.insert(0, data.get("system_prompt", "Jesteś pomocnym asystentem. Odpowiadaj w języku polskim."))
-                    self.status_var.set(f"Wczytano historię dla {self.get_conversation_name_by_id(conv_id)}.")
-                    # Usuń stare referencje do obrazów
-                    self.rendered_images = []
-            except json.JSONDecodeError as e:
-                messagebox.showerror("Błąd wczytywania", f"Błąd odczytu historii konwersacji z {filepath}: {e}")
-                self.status_var.set(f"Błąd wczytywania historii: {filepath}")
-            except Exception as e:
-                messagebox.showerror("Błąd", f"Nieoczekiwany błąd podczas ładowania historii: {e}")
+        if conv_id in self.unread_conversations:
+            self.unread_conversations.discard(conv_id)
+            self.conversation_list.refresh_label(conv_id)
+
+        try:
+            # Zapisy czekające jeszcze w kolejce są brane z pamięci
+            loaded = self.conversation_writes.load_tail(conv_id, HISTORY_PAGE_SIZE)
+        except json.JSONDecodeError as e:
+            loaded = None
+            messagebox.showerror("Błąd wczytywania", f"Błąd odczytu historii konwersacji {conv_id}: {e}")
+            self.status_var.set(f"Błąd wczytywania historii: {conv_id}")
+        except Exception as e:
+            loaded = None
+            messagebox.showerror("Błąd", f"Nieoczekiwany błąd podczas ładowania historii: {e}")
+
+        if loaded is not None:
+            header, history, start = loaded
+            self.conversation_history = history
+            self.history_start = start
+            self.context_summary = header.get("context_summary")
+            self.response_cache_mode.set(header.get("response_cache", self.default_response_cache_mode()))
+            self.system_prompt.delete(0, tk.END)
+            self.system_prompt.insert(0, header.get("system_prompt", "Jesteś pomocnym asystentem. Odpowiadaj w języku polskim."))
+            self.status_var.set(f"Wczytano historię dla {self.get_conversation_name_by_id(conv_id)}.")
         else:
-            self.status_var.set(f"Plik historii {filepath} nie istnieje. Rozpoczynanie nowej historii.")
+            self.status_var.set(f"Historia konwersacji {conv_id} nie istnieje. Rozpoczynanie nowej historii.")
             self.conversation_history = []
             self.system_prompt.delete(0, tk.END)
             self.system_prompt.insert(0, "Jesteś pomocnym asystentem. Odpowiadaj w języku polskim.")
-            self.rendered_images = [] 
         
         # Wyświetl historię po załadowaniu
         self.display_current_conversation_messages()
 
 
-    def display_current_conversation_messages(self):
-        """Odświeża okno czatu, wyświetlając całą historię konwersacji."""
-        self.chat_display.config(state='normal')
-        self.chat_display.delete('1.0', tk.END)
-        self.rendered_images = [] 
-        
-        for message in self.conversation_history:
-            sender = message['role']
-            for part in message['parts']:
-                if 'text' in part:
-                    # Używamy nowej, ulepszonej funkcji display_message
-                    self.display_message("user" if sender == "user" else "bot", part['text'], is_new_entry=False)
-        
-        self.chat_display.config(state='disabled')
-        self.chat_display.see(tk.END)
+    def display_current_conversation_messages(self, anchor_seq=None):
+        """
+        Odświeża okno czatu: wyświetla ostatnie wiadomości konwersacji
+        (albo okno wokół wiadomości anchor_seq). Reszta jest dorysowywana przy przewijaniu.
+        """
+        if self.displayed_reply is not None:
+            self._detach_streaming_reply()
+        self.rendered_images = {} 
+        self.display_generation += 1
+        self.transcript.reset(self.history_start + len(self.conversation_history), anchor_seq=anchor_seq)
+        # Odpowiedź tej konwersacji, która wciąż przychodzi, jest dalej dopisywana na końcu okna
+        _, reply = self.inflight.get(self.current_conversation_id, (None, None))
+        if reply is not None and not reply.done:
+            self._attach_streaming_reply(reply)
+
+    def _display_history_message(self, message, index=tk.END, seq=None):
+        """
+        Wyświetla jedną wiadomość z historii w podanym miejscu chat_display.
+        seq: Numer wiadomości w konwersacji - jej początek dostaje znacznik msg_<seq>.
+        """
+        if seq is not None:
+            self._mark_message_start(seq, index)
+        sender = message['role']
+        for part in message['parts']:
+            if 'text' in part:
+                # Używamy nowej, ulepszonej funkcji display_message
+                self.display_message("user" if sender == "user" else "bot", part['text'], is_new_entry=False, index=index)
+
+    def _mark_message_start(self, seq, index=tk.END):
+        """Ustawia znacznik msg_<seq> na początku wstawianej wiadomości."""
+        mark = f"msg_{seq}"
+        self.chat_display.mark_set(mark, f"{index}-1c" if index == tk.END else index)
+        self.chat_display.mark_gravity(mark, tk.LEFT)
+
+    def _get_history_range(self, start, end):
+        """
+        Zwraca wiadomości bieżącej konwersacji o numerach [start, end) dla okna czatu.
+        Brakujące starsze wiadomości są doczytywane z dysku stronami po HISTORY_PAGE_SIZE.
+        """
+        if start < self.history_start and self.current_conversation_id:
+            new_start = max(0, min(start, self.history_start - HISTORY_PAGE_SIZE))
+            try:
+                older = self.store.load_range(self.current_conversation_id, new_start, self.history_start)
+            except Exception as e:
+                self.status_var.set(f"Błąd wczytywania starszych wiadomości: {e}")
+                older = []
+            if len(older) == self.history_start - new_start:
+                self.conversation_history[0:0] = older
+                self.history_start = new_start
+        first = max(0, start - self.history_start)
+        return self.conversation_history[first:max(first, end - self.history_start)]
+
+    def get_full_history(self):
+        """
+        Zwraca pełną historię bieżącej konwersacji, doczytując z dysku
+        wiadomości, które nie zostały jeszcze wczytane stronami.
+        """
+        history = list(self.conversation_history)
+        if self.history_start > 0 and self.current_conversation_id:
+            history[0:0] = self.store.load_range(self.current_conversation_id, 0, self.history_start)
+        return history
+
+
+    def open_conversation(self, conv_id):
+        """Przełącza na konwersację o podanym ID (pyta o zapis bieżącej)."""
+        if self.current_conversation_id == conv_id:
+            return
+        if self.conversation_history and messagebox.askyesno(
+            "Zapisz konwersację?",
+            "Czy chcesz zapisać obecną konwersację przed załadowaniem innej?"
+        ):
+            self.save_conversation()
+        self.current_conversation_id = conv_id
+        self.load_conversation_history(conv_id)
+        self.update_conversations_listbox_selection()
+        self.status_var.set(f"Załadowano konwersację: '{self.get_conversation_name_by_id(conv_id)}'")
 
+    # === Wyszukiwanie ===
+    def show_search_window(self):
+        """Okno wyszukiwania pełnotekstowego we wszystkich konwersacjach (magazyn SQLite)."""
+        if not hasattr(self.store, "search"):
+            messagebox.showinfo(
+                "Wyszukiwanie",
+                "Wyszukiwanie we wszystkich konwersacjach wymaga magazynu SQLite.\n"
+                "Ustaw \"storage_backend\": \"sqlite\" w pliku config.json i uruchom aplikację ponownie."
+            )
+            return
+
+        window = tk.Toplevel(self.root)
+        window.title("Szukaj w konwersacjach")
+        window.geometry("700x400")
+
+        search_frame = ttk.Frame(window)
+        search_frame.pack(fill=tk.X, padx=10, pady=10)
+        query_entry = ttk.Entry(search_frame, font=('Arial', 11))
+        query_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
+        query_entry.focus_set()
+
+        results_listbox = tk.Listbox(window)
+        results_listbox.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+        hits = []
+
+        def run_search(event=None):
+            try:
+                hits[:] = self.store.search(query_entry.get(), limit=200)
+            except Exception as e:
+                messagebox.showerror("Błąd", f"Nie można wyszukać:\n{str(e)}", parent=window)
+                return
+            results_listbox.delete(0, tk.END)
+            for hit in hits:
+                snippet = " ".join(hit['snippet'].split())
+                results_listbox.insert(tk.END, f"{hit['name']}  —  {snippet}")
+            self.status_var.set(f"Znaleziono wyników: {len(hits)}")
+
+        def open_hit(event=None):
+            selection = results_listbox.curselection()
+            if selection:
+                hit = hits[selection[0]]
+                self.open_search_hit(hit['conversation_id'], hit['seq'])
+
+        ttk.Button(search_frame, text="Szukaj", command=run_search).pack(side=tk.RIGHT)
+        query_entry.bind("<Return>", run_search)
+        results_listbox.bind("<Double-Button-1>", open_hit)
+        results_listbox.bind("<Return>", open_hit)
+
+        theme_manager.apply_theme_colors(window, {"search_listbox": results_listbox},
+                                         "dark" if self.dark_mode_enabled.get() else "light")
+
+    def open_search_hit(self, conv_id, seq):
+        """Otwiera konwersację z trafieniem i przewija chat_display do wiadomości nr seq."""
+        self.open_conversation(conv_id)
+        self.transcript.jump_to(seq)
+        mark = f"msg_{seq}"
+        if mark not in self.chat_display.mark_names():
+            return
+        self.chat_display.tag_remove('search_hit', '1.0', tk.END)
+        self.chat_display.tag_add('search_hit', mark, f"{mark} lineend")
+        self.chat_display.yview(mark)
 
     def get_conversation_name_by_id(self, conv_id):
         """Zwraca przyjazną nazwę konwersacji na podstawie jej ID."""
-        for conv_meta in self.conversations_metadata:
-            if conv_meta['id'] == conv_id:
-                return conv_meta['name']
-        return conv_id 
+        meta = self.conversation_list.get(conv_id)
+        return meta['name'] if meta else conv_id 
 
     def rename_current_conversation(self):
         """Umożliwia zmianę nazwy aktywnej konwersacji."""
@@ -885,72 +1499,66 @@ class GeminiChatApp:
         if new_name and new_name.strip() != "" and new_name.strip() != current_name:
             new_name = new_name.strip()
             
-            for conv_meta in self.conversations_metadata:
-                if conv_meta['id'] == self.current_conversation_id:
-                    conv_meta['name'] = new_name
-                    break
-            
+            self.conversation_list.upsert({"id": self.current_conversation_id, "name": new_name})
             self.save_conversation() 
-
-            self.load_conversation_list() 
             self.status_var.set(f"Zmieniono nazwę konwersacji na '{new_name}'.")
         elif new_name is not None and new_name.strip() == "":
             messagebox.showwarning("Pusta nazwa", "Nazwa konwersacji nie może być pusta.")
 
     def delete_selected_conversation(self):
         """Usuwa wybraną konwersację i jej plik."""
-        selection_index = self.conversation_listbox.curselection()
-        if not selection_index:
+        if not self.conversation_listbox.curselection():
             messagebox.showwarning("Wybór konwersacji", "Proszę wybrać konwersację do usunięcia.")
             return
-        
-        index = selection_index[0]
-        selected_name_from_listbox = self.conversation_listbox.get(index)
 
-        selected_conv_id = None
-        for conv_meta in self.conversations_metadata:
-            if conv_meta['name'] == selected_name_from_listbox:
-                selected_conv_id = conv_meta['id']
-                break
-        
+        selected_conv_id = self.conversation_list.selected_id()
         if not selected_conv_id:
             messagebox.showerror("Błąd", "Nie znaleziono ID dla wybranej konwersacji do usunięcia.")
             return
+        selected_name = self.get_conversation_name_by_id(selected_conv_id)
 
         if messagebox.askyesno(
             "Potwierdzenie usunięcia", 
-            f"Czy na pewno chcesz usunąć konwersację '{selected_name_from_listbox}'?\n"
+            f"Czy na pewno chcesz usunąć konwersację '{selected_name}'?\n"
             "Spowoduje to trwałe usunięcie pliku."
         ):
-            filepath_to_delete = os.path.join(self.conversations_dir, f"{selected_conv_id}.json")
+            if (self.store.get_metadata(selected_conv_id) is None
+                    and not self.conversation_writes.is_pending(selected_conv_id)):
+                messagebox.showwarning("Błąd", "Plik konwersacji nie istnieje.")
+                return
             try:
-                if os.path.exists(filepath_to_delete):
-                    os.remove(filepath_to_delete)
-                    self.status_var.set(f"Usunięto konwersację: '{selected_name_from_listbox}'.")
-                    
-                    if self.current_conversation_id == selected_conv_id:
-                        self.conversation_history = []
-                        self.current_conversation_id = None
-                        self.chat_display.config(state='normal')
-                        self.chat_display.delete('1.0', tk.END)
-                        self.chat_display.config(state='disabled')
-                        self.rendered_images = []
-                    
-                    self.load_conversation_list() 
-
-                    if self.conversations_metadata and self.current_conversation_id is None:
-                        self.current_conversation_id = self.conversations_metadata[0]['id']
-                        self.load_conversation_history(self.current_conversation_id)
-                        self.display_current_conversation_messages()
-                        self.update_conversations_listbox_selection()
-                    elif not self.conversations_metadata:
-                        self.create_new_conversation(initial_load=True) 
-
-                else:
-                    messagebox.showwarning("Błąd", "Plik konwersacji nie istnieje.")
+                self._cancel_request(selected_conv_id)
+                if self.current_conversation_id == selected_conv_id:
+                    self.conversation_history = []
+                    self.history_start = 0
+                    self.context_summary = None
+                    self.current_conversation_id = None
+                    self.display_current_conversation_messages()
+                self.chat_sessions.invalidate(selected_conv_id)
+                if self.context_cache is not None:
+                    self.context_cache.invalidate(selected_conv_id)
+
+                # Usunięcie zastępuje ewentualny czekający zapis tej konwersacji
+                self.conversation_writes.delete(
+                    selected_conv_id,
+                    on_done=lambda: self._call_in_ui(self._after_conversation_deleted, selected_conv_id, selected_name)
+                )
             except Exception as e:
                 messagebox.showerror("Błąd", f"Nie można usunąć konwersacji:\n{str(e)}")
 
+    def _after_conversation_deleted(self, conv_id, name):
+        """Aktualizuje interfejs po usunięciu konwersacji w tle."""
+        self.status_var.set(f"Usunięto konwersację: '{name}'.")
+        self.conversation_list.remove(conv_id)
+        self.unread_conversations.discard(conv_id)
+
+        if len(self.conversation_list) and self.current_conversation_id is None:
+            self.current_conversation_id = self.conversation_list.first_id()
+            self.load_conversation_history(self.current_conversation_id)
+            self.update_conversations_listbox_selection()
+        elif not len(self.conversation_list):
+            self.create_new_conversation(initial_load=True) 
+
     def on_conversation_select(self, event):
         """Obsługuje wybór konwersacji z Listboxa."""
         selection_index = self.conversation_listbox.curselection()
@@ -972,8 +1580,9 @@ class GeminiChatApp:
                 with open(self.api_key_file, 'w') as f:
                     f.write(new_api_key.strip())
                 # Ponownie zainicjuj API, aby użyć nowego klucza
-                self.init_gemini() 
-                if self.model: # Sprawdź, czy model został poprawnie skonfigurowany
+                self.init_gemini(warm_up=False) 
+                if self._ensure_backend(): # Sprawdź, czy API zostało poprawnie skonfigurowane
+                    self._update_api_status()
                     messagebox.showinfo("Sukces", "Klucz API został pomyślnie ustawiony i API skonfigurowane.")
                 else:
                     messagebox.showwarning("Ostrzeżenie", "Klucz API został zapisany, ale nie udało się skonfigurować modelu Gemini. Sprawdź, czy klucz jest poprawny.")
@@ -1012,13 +1621,17 @@ class GeminiChatApp:
         is_dark = self.dark_mode_enabled.get()
         theme = "dark" if is_dark else "light"
         theme_manager.apply_theme_colors(self.root, self.all_app_widgets, theme)
+        self._recolor_latex_images()
         self.save_config() # Zapisz zmieniony stan trybu ciemnego
 
 
-    def display_message(self, sender, text, is_new_entry=True):
+    @traced("display_message")
+    def display_message(self, sender, text, is_new_entry=True, index=tk.END):
         """
         Wyświetla wiadomość z obsługą LaTeX.
         is_new_entry: True jeśli wiadomość jest nowa (z czatu), False jeśli ładowana z historii.
+        index: Miejsce wstawienia - tk.END albo znacznik (mark) z grawitacją w prawo,
+               który przesuwa się za wstawiany tekst.
         """
         self.chat_display.config(state='normal')
 
@@ -1029,92 +1642,145 @@ class GeminiChatApp:
             prefix_tag = 'error'
             message_tag = 'error'
 
-        self.chat_display.insert(tk.END, f"{sender.capitalize()}: ", prefix_tag)
-        
-        # Regex do dzielenia przez delimitery LaTeX ($...$ dla inline, $$...$$ dla bloku)
-        parts = re.split(r'(\$\$[^$]+\$\$|\$[^$]+\$)', text)
-
-        for part in parts:
-            if part.startswith('$$') and part.endswith('$$'):
-                latex_content = part[2:-2].strip()
-                self.insert_latex_image(latex_content, block_mode=True)
-            elif part.startswith('$') and part.endswith('$'):
-                latex_content = part[1:-1].strip()
-                self.insert_latex_image(latex_content, block_mode=False)
-            else:
-                self.chat_display.insert(tk.END, part, message_tag)
-        
-        self.chat_display.insert(tk.END, '\n\n') # Dodaj odstęp po każdej wiadomości
+        self.chat_display.insert(index, f"{sender.capitalize()}: ", prefix_tag)
+        # Podział przez delimitery LaTeX ($...$ dla inline, $$...$$ dla bloku)
+        self._insert_segments(split_message_text(text), message_tag, index)
+        self.chat_display.insert(index, '\n\n') # Dodaj odstęp po każdej wiadomości
         self.chat_display.config(state='disabled')
-        self.chat_display.see(tk.END)
+        if index == tk.END:
+            self.chat_display.see(tk.END)
 
 
-    def insert_latex_image(self, latex_expression, block_mode=False):
-        """Generates and inserts a LaTeX image into the chat display."""
-        try:
-            # Set matplotlib figure and axes colors based on current theme
-            is_dark_mode = self.dark_mode_enabled.get()
-            bg_color = theme_manager.DARK_THEME_COLORS["chat_bg"] if is_dark_mode else theme_manager.LIGHT_THEME_COLORS["chat_bg"]
-            text_color = theme_manager.DARK_THEME_COLORS["chat_fg"] if is_dark_mode else theme_manager.LIGHT_THEME_COLORS["chat_fg"]
+    def _insert_segments(self, segments, message_tag, index=tk.END):
+        """Wstawia segmenty tekstu i wyrażeń LaTeX (z split_message_text) w miejscu index."""
+        for segment in segments:
+            if segment[0] == 'latex':
+                self.insert_latex_image(segment[1], block_mode=segment[2], index=index)
+            else:
+                self.chat_display.insert(index, segment[1], message_tag)
 
-            # Create a temporary figure and axes
-            fig, ax = plt.subplots(figsize=(6, 0.5) if not block_mode else (8, 1))
-            
-            # Use `usetex=True` for LaTeX rendering. This requires a LaTeX distribution to be installed.
-            # Using `$$` for display mode equations or `$` for inline mode equations.
-            latex_text = f"$${latex_expression}$$" if block_mode else f"${latex_expression}$"
-            
-            # Add the text directly to the figure, not axes, for better control of background
-            text_obj = fig.text(0.5, 0.5, latex_text, ha='center', va='center', fontsize=12, color=text_color)
-            
-            # Set background color of the figure
-            fig.patch.set_facecolor(bg_color)
-            ax.set_facecolor(bg_color) # Ensure axes background also matches
+    @traced("insert_latex_image")
+    def insert_latex_image(self, latex_expression, block_mode=False, index=tk.END):
+        """
+        Wstawia obraz wzoru LaTeX w miejscu index. Obraz z pamięci podręcznej
+        trafia do okna od razu; w przeciwnym razie wstawiany jest zastępnik
+        (tekst wzoru), a renderowanie idzie do puli procesów i gotowy obraz
+        podmienia zastępnik w tym samym miejscu (_swap_latex_placeholder).
+        """
+        try:
+            key = make_key(latex_expression, block_mode, LATEX_DPI)
+            mask = self.latex_cache.get(key)
+            if mask is not None:
+                photo = self._latex_photo(key, mask)
+                if block_mode:
+                    self.chat_display.insert(index, '\n') # New line for block mode
+                    self.chat_display.image_create(index, image=photo, padx=10, pady=5)
+                    self.chat_display.insert(index, '\n') # New line after block mode image
+                else:
+                    self.chat_display.image_create(index, image=photo)
+                return
 
-            # Hide axes
-            ax.axis('off')
-            
-            # Get the bounding box of the rendered text
-            fig.canvas.draw()
-            bbox = text_obj.get_window_extent(renderer=fig.canvas.get_renderer())
-            
-            # Pad the bounding box slightly
-            bbox_padded = bbox.expanded(1.2, 1.2) # Add some padding around the text
-            
-            # Convert to image
-            buf = io.BytesIO()
-            # Use bbox_inches='tight' to crop the image to the content
-            fig.savefig(buf, format='png', bbox_inches=bbox_padded, dpi=300) 
-            buf.seek(0)
-            
-            image = Image.open(buf)
-            photo = ImageTk.PhotoImage(image)
-            
-            self.rendered_images.append(photo) # Keep a reference!
-            
-            # Insert image into Text widget
+            # Zastępnik z własnym tagiem - jego położenie śledzi Text, nawet gdy
+            # wyżej zostanie coś dopisane (np. starsze wiadomości)
+            self._latex_placeholder_seq += 1
+            tag = f"latex_pending_{self._latex_placeholder_seq}"
+            placeholder = f"$${latex_expression}$$" if block_mode else f"${latex_expression}$"
             if block_mode:
-                self.chat_display.insert(tk.END, '\n') # New line for block mode
-                self.chat_display.image_create(tk.END, image=photo, padx=10, pady=5)
-                self.chat_display.insert(tk.END, '\n') # New line after block mode image
-            else:
-                self.chat_display.image_create(tk.END, image=photo)
-            
-            plt.close(fig) # Close the figure to free up memory
+                self.chat_display.insert(index, '\n')
+            self.chat_display.insert(index, placeholder, ('latex_pending', tag))
+            if block_mode:
+                self.chat_display.insert(index, '\n')
+
+            waiter = (tag, block_mode, self.display_generation)
+            if key in self._latex_pending:
+                # Ten sam wzór już się renderuje - poczekaj na ten sam wynik
+                self._latex_pending[key].append(waiter)
+                return
+            self._latex_pending[key] = [waiter]
+            future = self.latex_pool.submit(latex_expression, block_mode, LATEX_DPI)
+            submitted_at = time.perf_counter()
+            future.add_done_callback(lambda f: self._on_latex_rendered(key, f, submitted_at))
 
         except Exception as e:
             error_message = f"Błąd renderowania LaTeX: {e}. Upewnij się, że masz zainstalowany LaTeX (np. MiKTeX/TeX Live) oraz pakiety `pdflatex` i `dvipng` w PATH."
-            self.chat_display.insert(tk.END, f"[Błąd renderowania LaTeX: {e}]\n", 'error')
+            self.chat_display.insert(index, f"[Błąd renderowania LaTeX: {e}]\n", 'error')
             print(error_message) # Print to console for debugging
 
+    def _latex_colors(self):
+        """(kolor tekstu, kolor tła) wzorów dla bieżącego motywu."""
+        return theme_manager.latex_colors("dark" if self.dark_mode_enabled.get() else "light")
+
+    def _latex_photo(self, key, mask):
+        """Zwraca PhotoImage wzoru w kolorach bieżącego motywu (jeden na klucz, ponownie używany)."""
+        entry = self.rendered_images.get(key)
+        if entry is not None:
+            return entry[0]
+        from PIL import ImageTk
+        photo = ImageTk.PhotoImage(self.latex_cache.colored(key, mask, *self._latex_colors()))
+        self.rendered_images[key] = (photo, mask) # Keep a reference!
+        return photo
+
+    def _recolor_latex_images(self):
+        """
+        Przemalowuje wyświetlone wzory na kolory bieżącego motywu w miejscu
+        (PhotoImage.paste) - bez renderowania i bez przebudowy okna czatu.
+        """
+        colors = self._latex_colors()
+        for key, (photo, mask) in self.rendered_images.items():
+            photo.paste(self.latex_cache.colored(key, mask, *colors))
+
+    def _on_latex_rendered(self, key, future, submitted_at=None):
+        """Odbiera wynik renderowania (w wątku puli): zapisuje go w cache i przekazuje do wątku Tk."""
+        if submitted_at is not None:
+            self.tracer.record("latex.render", time.perf_counter() - submitted_at)
+        image, error = None, None
+        try:
+            image = self.latex_cache.put(key, future.result())
+        except Exception as e:
+            error = e
+            print(f"Błąd renderowania LaTeX: {e}")
+        self._call_in_ui(self._swap_latex_placeholder, key, image, error)
+
+    def _swap_latex_placeholder(self, key, image, error):
+        """Podmienia zastępniki wzoru na gotowy obraz (wątek Tk). Zastępniki z wyczyszczonego okna są pomijane."""
+        waiters = self._latex_pending.pop(key, [])
+        photo = None
+        self.chat_display.config(state='normal')
+        for tag, block_mode, generation in waiters:
+            ranges = self.chat_display.tag_ranges(tag)
+            if generation != self.display_generation or not ranges:
+                self.chat_display.tag_delete(tag)
+                continue
+            start, end = ranges[0], ranges[-1]
+            if error is not None:
+                # Zostaw tekst wzoru, oznaczony jako błąd
+                self.chat_display.tag_add('error', start, end)
+            else:
+                if photo is None:
+                    photo = self._latex_photo(key, image)
+                if block_mode:
+                    self.chat_display.image_create(start, image=photo, padx=10, pady=5)
+                else:
+                    self.chat_display.image_create(start, image=photo)
+                self.chat_display.delete(f"{start}+1c", f"{end}+1c")
+            self.chat_display.tag_delete(tag)
+        self.chat_display.config(state='disabled')
+
+    @traced("send_message")
     def send_message(self):
         """Wysyła wiadomość do modelu Gemini w osobnym wątku."""
         user_text = self.user_input.get().strip()
         if not user_text: 
             return
+
+        if self.current_conversation_id in self.inflight:
+            self.status_var.set("Poczekaj na zakończenie odpowiedzi w tej konwersacji...")
+            return
         
-        # Sprawdź, czy model jest zainicjalizowany
-        if not self.model:
+        # Sprawdź, czy jest klucz API (sam model może się jeszcze ładować w tle);
+        # odtwarzanie nagranych odpowiedzi działa bez niego
+        if (not self.api_key and self.backend.requires_api_key
+                and self.response_cache_mode.get() != MODE_REPLAY):
             self.display_message("error", "Błąd: Model AI nie jest skonfigurowany. Proszę ustawić klucz API w menu 'Ustawienia'.")
             self.status_var.set("Błąd: brak klucza API")
             return
@@ -1123,83 +1789,619 @@ class GeminiChatApp:
             if not self.save_conversation():
                 return 
         
-        self.display_message("user", user_text) # Zmieniono sender na "user"
-        self.conversation_history.append({"role": "user", "parts": [{"text": user_text}]})
+        user_entry = with_token_count({"role": "user", "parts": [{"text": user_text}]})
+        self.conversation_history.append(user_entry)
+        self.transcript.append(user_entry, follow=True)
         
         self.save_conversation()
 
         self.status_var.set("Wysyłanie...")
-        Thread(target=self._get_gemini_response, args=(user_text,)).start()
+        # Wątek zapytania dostaje kopię danych - nie dotyka widżetów ani historii
+        request = {
+            "conversation_id": self.current_conversation_id,
+            "system_prompt": self.system_prompt.get().strip(),
+            "history": self.get_full_history(),
+            "summary": self.context_summary,
+            "max_output_tokens": self.max_output_tokens_limit.get(),
+            "response_cache": self.response_cache_mode.get(),
+        }
+        conv_id = self.current_conversation_id
+        reply = self._start_streaming_reply(conv_id) if self.streaming_enabled.get() else None
+        try:
+            # Etykieta uchwytu to ID konwersacji - według niej trafia odpowiedź
+            handle = self.request_executor.submit(
+                self._get_gemini_response, user_text, request, reply, label=conv_id
+            )
+        except RuntimeError as e:
+            if reply is not None:
+                reply.put_error(f"Nie można wysłać zapytania: {e}")
+            return
+        self.inflight[conv_id] = (handle, reply)
+        self.conversation_list.refresh_label(conv_id)
+        self._update_stop_button()
         
         self.user_input.delete(0, tk.END)
 
-    def _get_gemini_response(self, user_message):
-        """Pobiera odpowiedź od modelu Gemini."""
+    @traced("request")
+    def _get_gemini_response(self, handle, user_message, request, reply=None):
+        """
+        Pobiera odpowiedź od modelu Gemini (w wątku puli zapytań).
+        handle: RequestHandle - po anulowaniu odpowiedź jest porzucana.
+        request: Kopia danych z wątku Tk (conversation_id, system_prompt, history,
+                 summary, max_output_tokens, response_cache). Ostatnia wiadomość historii to user_message.
+        reply: StreamingReply - jeśli podany, odpowiedź jest pobierana strumieniowo,
+               a fragmenty trafiają do jego kolejki (wyświetla je _drain_streaming_reply).
+        """
+        if handle.started_at is not None:
+            self.tracer.record("request.queue_wait", handle.started_at - handle.submitted_at)
         try:
-            if not self.model:
-                self.root.after(0, self.display_message, "error", "Błąd: Model AI nie jest skonfigurowany. Sprawdź klucz API.")
-                self.root.after(0, self.status_var.set, "Błąd modelu AI")
-                return
-
-            chat_history_for_model = []
-            if self.system_prompt.get().strip():
-                chat_history_for_model.append({"role": "user", "parts": [{"text": self.system_prompt.get().strip()}]})
-                chat_history_for_model.append({"role": "model", "parts": [{"text": "Rozumiem."}]})
+            # Najnowsze wiadomości mieszczące się w limicie tokenów (także te jeszcze
+            # niewczytane do okna); starsze zastępuje streszczenie. Bieżąca wiadomość
+            # jest wysyłana przez send_message, więc nie trafia do historii czatu.
+            history = request["history"]
+            plan = self.context_builder.build(
+                history[:-1], pending=history[-1] if history else None,
+                system_prompt=request["system_prompt"], summary=request["summary"]
+            )
+            generation_params = {"max_output_tokens": request["max_output_tokens"]}
+
+            # Pamięć podręczna / nagrania odpowiedzi (tryb wybrany dla konwersacji)
+            cache_mode = request["response_cache"]
+            cache_key = None
+            if cache_mode != MODE_OFF:
+                cache_key = request_key(
+                    self.model_name, plan.system_prompt, plan.contents, user_message, generation_params
+                )
+                record = self.response_cache.get(cache_key) if cache_mode != MODE_RECORD else None
+                if record is not None:
+                    self._replay_response(handle, record, plan, reply)
+                    return
+                if cache_mode == MODE_REPLAY:
+                    raise LookupError("brak nagranej odpowiedzi na to zapytanie (tryb odtwarzania)")
 
-            for msg in self.conversation_history:
-                chat_history_for_model.append(msg)
-            
-            chat = self.model.start_chat(history=chat_history_for_model)
+            backend = self._ensure_backend()
+            if backend is None:
+                if reply is not None:
+                    reply.put_error("Błąd: Model AI nie jest skonfigurowany. Sprawdź klucz API.")
+                    return
+                self.root.after(0, self._show_request_error, handle.label, "Błąd: Model AI nie jest skonfigurowany. Sprawdź klucz API.")
+                return
 
-            generation_config = genai.types.GenerationConfig(
-                max_output_tokens=self.max_output_tokens_limit.get()
-            )
-            
-            response = chat.send_message(
-                user_message,
-                request_options={"retry": retry.Retry(predicate=retry.if_transient_error)},
-                generation_config=generation_config 
+            # Stały początek długiego kontekstu może już być zapisany po stronie modelu
+            conv_id = request["conversation_id"]
+            model_name, contents, model_factory = self.model_name, plan.contents, None
+            if self.context_cache is not None:
+                cache_plan = self.context_cache.prepare(
+                    conv_id, self.model_name, plan.system_prompt,
+                    history[plan.dropped_messages:-1], plan.dropped_messages
+                )
+                if cache_plan.cache_name:
+                    # Sesja z innym zapisem kontekstu nie może być użyta ponownie
+                    model_name, contents = cache_plan.cache_name, cache_plan.contents
+                    model_factory = cache_plan.model_factory
+                    plan.cached_tokens = cache_plan.cached_tokens
+
+            # Sesja czatu tej konwersacji z poprzedniego zapytania (prompt systemowy
+            # jako system_instruction) albo nowa, jeśli coś się zmieniło
+            session, _ = self.chat_sessions.checkout(
+                conv_id, model_name, plan.system_prompt,
+                history[:-1], plan.dropped_messages, contents, model_factory=model_factory
             )
+            chat = session.chat
             
-            ai_response = response.text
-            self.conversation_history.append({"role": "model", "parts": [{"text": ai_response}]})
-            self.root.after(0, self.display_message, "bot", ai_response) # Zmieniono sender na "bot"
-            self.root.after(0, self.status_var.set, "Gotowy")
-            
-            self.root.after(0, self.save_conversation)
+            sent_at = time.perf_counter()
+            if reply is not None:
+                reply.context = plan
+                chunks = []
+                result = self._stream_response(handle, chat, user_message, generation_params, reply, chunks)
+                if result is None:
+                    return
+                ai_response, token_count = result
+            else:
+                with self.tracer.span("request.api", streaming=False):
+                    result = self.rate_limiter.call(
+                        self._quota_key(), self.model_name,
+                        lambda: backend.send(chat, user_message, generation_params),
+                        tokens=plan.sent_tokens, cancelled=lambda: handle.cancelled,
+                        on_wait=lambda seconds: self._on_rate_limit_wait(conv_id, seconds)
+                    )
+                if result is None:
+                    return
+                ai_response, token_count = result.text, result.token_count
+                self.rate_limiter.charge(self._quota_key(), self.model_name, token_count)
+                chunks = [(time.perf_counter() - sent_at, ai_response)]
+                if handle.cancelled:
+                    return
+                if result.cached_tokens:
+                    plan.cached_tokens = result.cached_tokens
+                self.root.after(0, self._finish_response, handle, ai_response, plan, token_count)
+
+            self.chat_sessions.checkin(conv_id, session, {"role": "model", "parts": [{"text": ai_response}]})
+            if cache_key is not None:
+                self.response_cache.put(
+                    cache_key, make_response_record(cache_key, self.model_name, ai_response, chunks, token_count)
+                )
+
+            if plan.summarize_upto and not handle.cancelled:
+                self._summarize_context(backend, handle, request, plan)
 
         except Exception as e:
             error_message = f"Błąd komunikacji z Gemini API: {str(e)}"
-            self.root.after(0, self.display_message, "error", error_message) # Zmieniono sender na "error"
-            self.root.after(0, self.status_var.set, "Błąd API")
+            if reply is not None:
+                reply.put_error(error_message)
+                return
+            if handle.cancelled:
+                return
+            self.root.after(0, self._show_request_error, handle.label, error_message)
+
+    def _replay_response(self, handle, record, plan, reply=None):
+        """
+        Odtwarza zapamiętaną odpowiedź (w wątku zapytania). Odpowiedź strumieniowa
+        przychodzi fragmentami w nagranych odstępach ("response_replay_speed": 0 - od razu).
+        """
+        speed = self.config.get('response_replay_speed', 1.0)
+        if reply is None:
+            if not handle.cancelled:
+                self.root.after(0, self._finish_response, handle, record["text"], plan, record.get("token_count"))
+            return
+        reply.context = plan
+        started = time.perf_counter()
+        for offset, text in record.get("chunks") or [[0, record["text"]]]:
+            delay = started + offset * speed - time.perf_counter() if speed else 0
+            if delay > 0:
+                time.sleep(delay)
+            if handle.cancelled:
+                reply.put_cancelled()
+                return
+            reply.put_text(text)
+        reply.put_done(record.get("token_count"))
+
+    def _finish_response(self, handle, ai_response, plan=None, token_count=None):
+        """Dopisuje pełną (niestrumieniową) odpowiedź do konwersacji, z której przyszło zapytanie (wątek Tk)."""
+        self._forget_request(handle.label, handle)
+        if handle.cancelled:
+            return
+        bot_entry = with_token_count({"role": "model", "parts": [{"text": ai_response}]}, token_count)
+        if plan is not None:
+            bot_entry["context"] = plan.stats()
+        if self._deliver_reply(handle.label, bot_entry):
+            self.status_var.set(f"Gotowy ({plan.describe()})" if plan is not None else "Gotowy")
+
+    def _deliver_reply(self, conv_id, bot_entry, rendered=False):
+        """
+        Dopisuje odpowiedź modelu do jej konwersacji: bieżącej - do historii i okna
+        czatu, innej - prosto do magazynu (konwersacja dostaje znaczek nieprzeczytanej).
+        :return: True, jeśli odpowiedź trafiła do bieżącej konwersacji.
+        """
+        if conv_id == self.current_conversation_id:
+            self.conversation_history.append(bot_entry)
+            self.transcript.append(bot_entry, rendered=rendered)
+            self.save_conversation()
+            return True
+        if conv_id not in self.conversation_list:
+            return False
+        self._append_to_conversation(conv_id, [bot_entry])
+        self.unread_conversations.add(conv_id)
+        self.conversation_list.refresh_label(conv_id)
+        self.status_var.set(f"Nowa odpowiedź w konwersacji '{self.get_conversation_name_by_id(conv_id)}'.")
+        return False
+
+    def _append_to_conversation(self, conv_id, messages, header=None):
+        """
+        Dopisuje wiadomości (i pola nagłówka) do konwersacji, która nie jest otwarta.
+        Czekający zapis tej konwersacji nie jest zastępowany - dopisanie jest do niego dołączane.
+        """
+        self.conversation_writes.append(conv_id, messages, header)
+
+    def _show_request_error(self, conv_id, message):
+        """Pokazuje błąd zapytania w oknie czatu, jeśli jego konwersacja jest otwarta (wątek Tk)."""
+        if conv_id == self.current_conversation_id:
+            self.display_message("error", message)
+            self.status_var.set("Błąd API")
+        else:
+            self.status_var.set(f"Błąd w konwersacji '{self.get_conversation_name_by_id(conv_id)}': {message}")
+
+    def _summarize_context(self, backend, handle, request, plan):
+        """
+        Streszcza wiadomości pominięte w kontekście (w wątku zapytania, po odpowiedzi).
+        Nowe streszczenie obejmuje poprzednie, więc kolejne zapytania mieszczą się w limicie.
+        Anulowanie zapytania w trakcie czekania na limit pomija streszczenie.
+        """
+        previous = request["summary"]
+        start = previous.get("covers", 0) if previous else 0
+        prompt = build_summary_prompt(
+            previous, request["history"][start:plan.summarize_upto],
+            max_words=self.context_builder.summary_tokens * 3 // 4
+        )
+        try:
+            result = self.rate_limiter.call(
+                self._quota_key(), self.model_name,
+                lambda: backend.generate(
+                    self.model_name, prompt, {"max_output_tokens": self.context_builder.summary_tokens}
+                ),
+                tokens=estimate_tokens(prompt), cancelled=lambda: handle.cancelled
+            )
+        except Exception as e:
+            print(f"Błąd streszczania kontekstu: {e}")
+            return
+        if result is None or handle.cancelled:
+            return
+        text = result.strip()
+        if text:
+            self._call_in_ui(
+                self._set_context_summary, request["conversation_id"], make_summary(text, plan.summarize_upto)
+            )
+
+    def _set_context_summary(self, conv_id, summary):
+        """Zapamiętuje streszczenie w nagłówku konwersacji (wątek Tk)."""
+        if conv_id != self.current_conversation_id:
+            if conv_id in self.conversation_list:
+                self._append_to_conversation(conv_id, [], {"context_summary": summary})
+            return
+        self.context_summary = summary
+        self.save_conversation()
+
+    def stop_requests(self):
+        """Przerywa zapytanie bieżącej konwersacji; częściowa odpowiedź strumieniowa zostaje w historii."""
+        if self._cancel_request(self.current_conversation_id):
+            self.status_var.set("Zatrzymano odpowiedź.")
+        self._update_stop_button()
+
+    def _cancel_request(self, conv_id):
+        """Anuluje zapytanie danej konwersacji. Zwraca False, jeśli żadne nie trwa."""
+        handle, reply = self.inflight.get(conv_id, (None, None))
+        if handle is None:
+            return False
+        handle.cancel()
+        if reply is not None:
+            # Zakończ od razu, nie czekając, aż wątek zapytania doczeka się kolejnego fragmentu
+            reply.put_cancelled()
+        return True
+
+    def _forget_request(self, conv_id, handle):
+        """Usuwa zakończone zapytanie z listy trwających i odświeża znaczek konwersacji."""
+        entry = self.inflight.get(conv_id)
+        if entry is not None and entry[0] is handle:
+            del self.inflight[conv_id]
+            self.conversation_list.refresh_label(conv_id)
+            self._update_stop_button()
+
+    def _on_request_finished(self, handle):
+        """Wywoływane w wątku Tk po zakończeniu zadania w puli zapytań."""
+        entry = self.inflight.get(handle.label)
+        if entry is not None and entry[0] is handle:
+            reply = entry[1]
+            if reply is None:
+                self._forget_request(handle.label, handle)
+            elif handle.error is not None:
+                # Jeśli wątek zapytania zakończył odpowiedź, kolejne zdarzenia są pomijane
+                reply.put_error(f"Błąd zapytania: {handle.error}")
+            else:
+                # Np. zapytanie anulowane, zanim wątek je uruchomił
+                reply.put_cancelled()
+        self._update_stop_button()
+
+    def _update_stop_button(self):
+        """Włącza przycisk Zatrzymaj tylko wtedy, gdy trwa zapytanie bieżącej konwersacji."""
+        busy = self.current_conversation_id in self.inflight
+        self.stop_button.config(state='normal' if busy else 'disabled')
+
+    def _stream_response(self, handle, chat, user_message, generation, reply, chunks=None):
+        """
+        Odbiera odpowiedź fragmentami (w wątku zapytania) i wkłada je do kolejki reply.
+        Anulowanie uchwytu przerywa odbiór (ModelBackend.cancel).
+        chunks: Lista, do której trafiają pary (sekundy od wysłania, fragment) - do nagrania.
+        Zwraca (pełny tekst, liczba tokenów odpowiedzi) albo None, jeśli odbiór przerwano.
+        """
+        key = self._quota_key()
+        stream = self.rate_limiter.call(
+            key, self.model_name, lambda: self.backend.stream(chat, user_message, generation),
+            tokens=reply.context.sent_tokens if reply.context is not None else 0,
+            cancelled=lambda: handle.cancelled,
+            on_wait=lambda seconds: self._on_rate_limit_wait(handle.label, seconds)
+        )
+        if stream is None:
+            reply.put_cancelled()
+            return None
+        sent_at = time.perf_counter()
+        handle.add_cancel_callback(lambda: self.backend.cancel(stream))
+        token_count = None
+        received = []
+        for chunk in stream:
+            if handle.cancelled:
+                break
+            if chunk.text:
+                if not received:
+                    self.tracer.record("request.first_token", time.perf_counter() - sent_at)
+                received.append(chunk.text)
+                if chunks is not None:
+                    chunks.append((time.perf_counter() - sent_at, chunk.text))
+                reply.put_text(chunk.text)
+            if chunk.token_count:
+                token_count = chunk.token_count
+            if chunk.cached_tokens and reply.context is not None:
+                reply.context.cached_tokens = chunk.cached_tokens
+        self.tracer.record("request.api", time.perf_counter() - sent_at, streaming=True)
+        self.rate_limiter.charge(key, self.model_name, token_count or estimate_tokens("".join(received)))
+        if handle.cancelled:
+            reply.put_cancelled()
+            return None
+        reply.put_done(token_count)
+        return "".join(received), token_count
+
+    # === Odpowiedzi strumieniowe (wątek Tk) ===
+    def _start_streaming_reply(self, conv_id):
+        """Otwiera w oknie czatu nową wiadomość bota i uruchamia cykliczne dopisywanie fragmentów."""
+        reply = StreamingReply(conv_id)
+        self._attach_streaming_reply(reply)
+        self.root.after(STREAM_DRAIN_INTERVAL_MS, self._drain_streaming_reply, reply)
+        return reply
+
+    def _attach_streaming_reply(self, reply):
+        """Wyświetla odpowiedź strumieniową na końcu okna czatu (z tym, co już przyszło)."""
+        # Odpowiedź powstaje na końcu okna - koniec fragmentu nie może być w tym czasie usuwany
+        self.transcript.scroll_to_end()
+        self.transcript.hold_tail = True
+        self._mark_message_start(self.history_start + len(self.conversation_history))
+        self.chat_display.config(state='normal')
+        self.chat_display.mark_set('stream_start', 'end-1c')
+        self.chat_display.mark_gravity('stream_start', tk.LEFT)
+        self.chat_display.insert(tk.END, "Bot: ", 'bot_prefix')
+        # Znacznik z grawitacją w prawo przesuwa się za dopisywanym tekstem
+        self.chat_display.mark_set('stream_insert', 'end-1c')
+        self.chat_display.mark_gravity('stream_insert', tk.RIGHT)
+        if reply.shown_text:
+            self._insert_segments(split_message_text(reply.shown_text), 'bot_text', 'stream_insert')
+        self.chat_display.config(state='disabled')
+        self.chat_display.see(tk.END)
+        self.displayed_reply = reply
+
+    def _detach_streaming_reply(self):
+        """Odłącza odpowiedź od okna czatu (koniec odpowiedzi albo przejście do innej konwersacji)."""
+        self.displayed_reply = None
+        self.transcript.hold_tail = False
+        self.chat_display.mark_unset('stream_start', 'stream_insert')
+
+    def _drain_streaming_reply(self, reply):
+        """
+        Odbiera wszystko, co przyszło od ostatniego wywołania (stały interwał), i dopisuje
+        do okna, jeśli odpowiedź jest wyświetlana. Odpowiedź konwersacji w tle tylko się zbiera.
+        """
+        segments = reply.drain()
+        if segments and reply is self.displayed_reply:
+            at_bottom = self.chat_display.yview()[1] >= 1.0
+            self.chat_display.config(state='normal')
+            self._insert_segments(segments, 'bot_text', 'stream_insert')
+            self.chat_display.config(state='disabled')
+            if at_bottom:
+                self.chat_display.see(tk.END)
+
+        if not reply.done:
+            self.root.after(STREAM_DRAIN_INTERVAL_MS, self._drain_streaming_reply, reply)
+            return
+        self._finish_streaming_reply(reply)
+
+    def _finish_streaming_reply(self, reply):
+        """Zamyka wiadomość bota, dopisuje ją do jej konwersacji i zapisuje ją jeden raz."""
+        conv_id = reply.conversation_id
+        handle, _ = self.inflight.get(conv_id, (None, None))
+        if handle is not None:
+            self._forget_request(conv_id, handle)
+        displayed = reply is self.displayed_reply
+        if displayed:
+            self.chat_display.config(state='normal')
+            if reply.text:
+                self.chat_display.insert('stream_insert', '\n\n')
+            else:
+                # Nic nie przyszło - usuń pusty nagłówek "Bot: "
+                self.chat_display.delete('stream_start', 'stream_insert')
+            self._detach_streaming_reply()
+            self.chat_display.config(state='disabled')
+
+        if reply.text:
+            # Przy błędzie w trakcie zachowujemy to, co już przyszło
+            bot_entry = with_token_count({"role": "model", "parts": [{"text": reply.text}]}, reply.token_count)
+            if reply.context is not None:
+                bot_entry["context"] = reply.context.stats()
+            self._deliver_reply(conv_id, bot_entry, rendered=displayed)
+
+        if reply.error:
+            self._show_request_error(conv_id, reply.error)
+        elif conv_id != self.current_conversation_id:
+            return
+        elif reply.cancelled:
+            self.status_var.set("Zatrzymano - zachowano częściową odpowiedź." if reply.text else "Zatrzymano odpowiedź.")
+        else:
+            summary = ", ".join(filter(None, [
+                reply.summary(), reply.context.describe() if reply.context is not None else ""
+            ]))
+            self.status_var.set(f"Gotowy ({summary})" if summary else "Gotowy")
 
     def export_conversation(self):
-        """Eksportuje bieżącą konwersację do pliku tekstowego."""
+        """Eksportuje bieżącą konwersację do pliku (tekst, Markdown, HTML lub JSONL - według rozszerzenia)."""
         if not self.conversation_history:
             messagebox.showwarning("Pusta konwersacja", "Nie ma nic do wyeksportowania!")
             return
             
         file_path = filedialog.asksaveasfilename(
             defaultextension=".txt",
-            filetypes=[("Pliki tekstowe", "*.txt"), ("Wszystkie pliki", "*.*")],
+            filetypes=[(cls.title, f"*{cls.extension}") for cls in exporters.EXPORTERS.values()]
+                      + [("Wszystkie pliki", "*.*")],
             title="Eksportuj konwersację jako"
         )
         
         if file_path:
             try:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(f"Prompt systemowy: {self.system_prompt.get()}\n\n")
-                    for message in self.conversation_history:
-                        sender = message['role']
-                        text_content = ""
-                        for part in message['parts']:
-                            if 'text' in part:
-                                text_content += part['text']
-                        f.write(f"{sender.capitalize()}: {text_content}\n\n")
+                header = {
+                    "id": self.current_conversation_id,
+                    "name": self.get_conversation_name_by_id(self.current_conversation_id),
+                    "system_prompt": self.system_prompt.get(),
+                }
+                exporters.export_conversation(
+                    file_path, header, self.get_full_history(), exporters.format_for_path(file_path),
+                    latex_dir=self.latex_cache_dir, dpi=LATEX_DPI
+                )
                 messagebox.showinfo("Sukces", "Konwersacja wyeksportowana pomyślnie.")
             except Exception as e:
                 messagebox.showerror("Błąd", f"Nie można wyeksportować konwersacji:\n{str(e)}")
 
+    def export_all_conversations(self):
+        """Okno eksportu wszystkich konwersacji do jednego archiwum ZIP (w tle, z paskiem postępu)."""
+        conversations = [(meta['id'], meta['name']) for meta in self.conversation_list]
+        if not conversations:
+            messagebox.showwarning("Brak konwersacji", "Nie ma nic do wyeksportowania!")
+            return
+
+        window = tk.Toplevel(self.root)
+        window.title("Eksport wszystkich konwersacji")
+        window.geometry("420x150")
+        window.transient(self.root)
+
+        formats = {cls.title: fmt for fmt, cls in exporters.EXPORTERS.items()}
+        format_var = tk.StringVar(value=exporters.MarkdownExporter.title)
+        options_frame = ttk.Frame(window)
+        options_frame.pack(fill=tk.X, padx=10, pady=10)
+        ttk.Label(options_frame, text="Format:").pack(side=tk.LEFT)
+        ttk.Combobox(
+            options_frame, textvariable=format_var, values=list(formats), state='readonly', width=20
+        ).pack(side=tk.LEFT, padx=5)
+
+        progress_var = tk.DoubleVar()
+        ttk.Progressbar(window, variable=progress_var, maximum=len(conversations)).pack(fill=tk.X, padx=10)
+        info_var = tk.StringVar(value=f"Konwersacji: {len(conversations)}")
+        ttk.Label(window, textvariable=info_var).pack(fill=tk.X, padx=10, pady=5)
+
+        buttons = ttk.Frame(window)
+        buttons.pack(fill=tk.X, padx=10, pady=(0, 10))
+        cancel_event = threading.Event()
+
+        def on_progress(done, total):
+            if window.winfo_exists():
+                progress_var.set(done)
+                info_var.set(f"Wyeksportowano {done}/{total}")
+
+        def on_finished(result, error, zip_path):
+            if not window.winfo_exists():
+                return
+            export_button.config(state='normal')
+            if error is not None:
+                messagebox.showerror("Błąd", f"Nie można wyeksportować konwersacji:\n{str(error)}", parent=window)
+            elif result is None:
+                info_var.set("Eksport przerwany.")
+            else:
+                info_var.set(f"Wyeksportowano {result['exported']} konwersacji w {result['seconds']:.1f} s.")
+                self.status_var.set(f"Wyeksportowano konwersacje do {zip_path}")
+                if result['errors']:
+                    messagebox.showwarning(
+                        "Eksport", f"Nie udało się wyeksportować {len(result['errors'])} konwersacji:\n"
+                        + "\n".join(result['errors'][:10]), parent=window
+                    )
+
+        def start():
+            zip_path = filedialog.asksaveasfilename(
+                parent=window, defaultextension=".zip",
+                filetypes=[("Archiwum ZIP", "*.zip")], title="Zapisz archiwum jako"
+            )
+            if not zip_path:
+                return
+            fmt = formats[format_var.get()]
+            if isinstance(self.store, SQLiteConversationStore):
+                source = ("sqlite", self.store.db_path)
+            else:
+                source = ("files", self.conversations_dir)
+            export_button.config(state='disabled')
+            cancel_event.clear()
+
+            def run():
+                result, error = None, None
+                try:
+                    # Procesy eksportu czytają z dysku - najpierw dokończ czekające zapisy
+                    self.writer.flush()
+                    result = exporters.export_all(
+                        source, conversations, zip_path, fmt,
+                        latex_dir=self.latex_cache_dir, dpi=LATEX_DPI,
+                        progress=lambda done, total: self._call_in_ui(on_progress, done, total),
+                        cancelled=cancel_event.is_set
+                    )
+                except Exception as e:
+                    error = e
+                self._call_in_ui(on_finished, result, error, zip_path)
+
+            threading.Thread(target=run, name="export-all", daemon=True).start()
+
+        def close():
+            cancel_event.set()
+            window.destroy()
+
+        export_button = ttk.Button(buttons, text="Eksportuj...", command=start)
+        export_button.pack(side=tk.LEFT)
+        ttk.Button(buttons, text="Anuluj", command=cancel_event.set).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Zamknij", command=close).pack(side=tk.RIGHT)
+        window.protocol("WM_DELETE_WINDOW", close)
+
+    def import_conversations(self):
+        """Import archiwum konwersacji z innych narzędzi (ChatGPT, Claude, JSON/JSONL) w tle."""
+        path = filedialog.askopenfilename(
+            filetypes=[("Archiwa konwersacji", "*.zip *.json *.jsonl"), ("Wszystkie pliki", "*.*")],
+            title="Importuj konwersacje"
+        )
+        if not path:
+            return
+
+        window = tk.Toplevel(self.root)
+        window.title("Import konwersacji")
+        window.geometry("420x120")
+        window.transient(self.root)
+        progress = ttk.Progressbar(window, mode='indeterminate')
+        progress.pack(fill=tk.X, padx=10, pady=(10, 0))
+        progress.start(50)
+        info_var = tk.StringVar(value=f"Importowanie {os.path.basename(path)}...")
+        ttk.Label(window, textvariable=info_var).pack(fill=tk.X, padx=10, pady=5)
+        cancel_event = threading.Event()
+
+        def on_progress(stats):
+            if window.winfo_exists():
+                info_var.set(f"Zaimportowano {stats['imported']} konwersacji ({stats['messages']} wiadomości)")
+            # Lista tylko z indeksu - nowe konwersacje pojawiają się w trakcie importu
+            self.load_conversation_list(refresh=False)
+
+        def on_finished(stats, error):
+            self.load_conversation_list(refresh=False)
+            if not window.winfo_exists():
+                return
+            progress.stop()
+            cancel_button.config(state='disabled')
+            if error is not None:
+                messagebox.showerror("Błąd", f"Nie można zaimportować konwersacji:\n{str(error)}", parent=window)
+                return
+            info_var.set(
+                f"{'Import przerwany' if stats['cancelled'] else 'Gotowe'}: {stats['imported']} nowych konwersacji, "
+                f"{stats['duplicates']} już zapisanych, {stats['skipped']} pominiętych."
+            )
+            self.status_var.set(f"Zaimportowano {stats['imported']} konwersacji z {os.path.basename(path)}")
+
+        def run():
+            stats, error = None, None
+            try:
+                stats = importer.ArchiveImporter(
+                    self.store,
+                    progress=lambda stats: self._call_in_ui(on_progress, stats),
+                    cancelled=cancel_event.is_set
+                ).import_path(path)
+            except Exception as e:
+                error = e
+            self._call_in_ui(on_finished, stats, error)
+
+        buttons = ttk.Frame(window)
+        buttons.pack(fill=tk.X, padx=10, pady=(0, 10))
+        cancel_button = ttk.Button(buttons, text="Anuluj", command=cancel_event.set)
+        cancel_button.pack(side=tk.LEFT)
+        ttk.Button(buttons, text="Zamknij", command=window.destroy).pack(side=tk.RIGHT)
+        thread = threading.Thread(target=run, name="import", daemon=True)
+        self._imports = [entry for entry in self._imports if entry[0].is_alive()]
+        self._imports.append((thread, cancel_event))
+        thread.start()
+
     def confirm_exit(self):
         """Potwierdzenie wyjścia z aplikacji."""
         if messagebox.askyesno(
@@ -1207,11 +2409,23 @@ class GeminiChatApp:
             "Czy na pewno chcesz zakończyć aplikację?\n"
             "Upewnij się, że wszystkie konwersacje są zapisane."
         ):
+            self.shutdown_requests()
+            self.latex_pool.shutdown()
+            self.shutdown_persistence()
             self.root.destroy()
 
 
 if __name__ == "__main__":
+    # Wymagane przez pulę procesów LaTeX w wersji zbudowanej PyInstallerem
+    multiprocessing.freeze_support()
+    # Tryb wsadowy bez okna: Gemini_chat_pro.py --batch <pytania> -o <wyniki> [opcje batch_cli]
+    if len(sys.argv) > 1 and sys.argv[1] == "--batch":
+        import batch_cli
+        sys.exit(batch_cli.main(sys.argv[2:]))
     root = tk.Tk()
     app = GeminiChatApp(root)
     root.mainloop()
+    app.shutdown_requests()
+    app.latex_pool.shutdown()
+    app.shutdown_persistence()
 
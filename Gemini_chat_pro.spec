@@ -6,11 +6,17 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=[],
+    # SDK Gemini jest importowane leniwie (gemini_sdk.load)
+    hiddenimports=['google.generativeai', 'google.api_core.retry'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # Moduły ciągnięte przez matplotlib/PIL, których aplikacja nie używa
+    excludes=[
+        'IPython', 'ipykernel', 'jupyter_client', 'jupyter_core', 'notebook',
+        'matplotlib.tests', 'numpy.tests', 'PIL.ImageQt',
+        'PyQt5', 'PyQt6', 'PySide2', 'PySide6', 'pytest',
+    ],
     noarchive=False,
     optimize=0,
 )
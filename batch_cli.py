@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Tryb wsadowy Gemini Chat Pro bez okna.
+
+Wysyła do modelu pytania z pliku (lub stdin) - równolegle, z limitem liczby
+jednoczesnych zapytań i zapytań na minutę - i zapisuje odpowiedzi do pliku
+JSONL w kolejności ich nadejścia. Korzysta z tych samych danych co aplikacja:
+config.json (model, backend, max_output_tokens), preprompts.json, klucz API
+i zapisane konwersacje (ich historia może być kontekstem pytań).
+Przerwane uruchomienie można powtórzyć z tym samym plikiem wyników - pytania,
+które mają już odpowiedź, są pomijane.
+
+Format pytań: zwykły tekst (jedno pytanie w linii) albo JSONL z polami
+"prompt" oraz opcjonalnie "id", "conversation", "preprompt", "system_prompt".
+
+Przykład:
+    python batch_cli.py pytania.txt -o odpowiedzi.jsonl --concurrency 8 --rpm 60
+    python Gemini_chat_pro.py --batch pytania.jsonl -o odpowiedzi.jsonl --conversation <id>
+    cat pytania.txt | python batch_cli.py - -o odpowiedzi.jsonl --preprompt "Tłumacz"
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from context_builder import ContextBuilder, with_token_count
+from conversation_store import ConversationStore
+from sqlite_store import SQLiteConversationStore
+from model_backend import create_backend
+from rate_limiter import RateLimiter, quota_key
+
+DEFAULT_MODEL_NAME = "gemini-1.5-flash"
+DEFAULT_SYSTEM_PROMPT = "Jesteś pomocnym asystentem. Odpowiadaj w języku polskim."
+
+
+class BatchEnvironment:
+    """Dane aplikacji (ten sam katalog i te same ustawienia co okno) potrzebne w trybie wsadowym."""
+
+    def __init__(self, data_dir=None):
+        self.data_dir = Path(data_dir or os.environ.get("GEMINI_CHAT_DATA_DIR") or Path(__file__).parent)
+        self.config = self._read_json("config.json", {})
+        self.preprompts = self._read_json("preprompts.json", {})
+        self.model_name = self.config.get('model', DEFAULT_MODEL_NAME)
+        self.max_output_tokens = self.config.get('max_output_tokens', 65536)
+        self.context_builder = ContextBuilder(
+            budget_tokens=self.config.get('context_budget_tokens', 32000),
+            summary_tokens=self.config.get('context_summary_tokens', 800)
+        )
+        self.backend = create_backend(self.config)
+        # Te same limity zapytań i tokenów na minutę co w aplikacji ("rate_limit" w config.json)
+        self.rate_limiter = RateLimiter.from_config(self.config.get('rate_limit'))
+        self.quota_key = None
+        self.store = self._open_store()
+        self._conversations = {}  # ID -> (nagłówek, historia); wiele pytań dzieli jedną konwersację
+        self._conversations_lock = threading.Lock()
+
+    def _read_json(self, name, default):
+        path = self.data_dir / name
+        if not path.exists():
+            return default
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _open_store(self):
+        # Jak GeminiChatApp.init_store, bez jednorazowego importu plików do bazy
+        if self.config.get('storage_backend') == 'sqlite':
+            return SQLiteConversationStore(str(self.data_dir / "conversations.db"))
+        conversations_dir = self.data_dir / "conversations"
+        os.makedirs(conversations_dir, exist_ok=True)
+        return ConversationStore(
+            str(conversations_dir),
+            str(self.data_dir / "conversations_index.json"),
+            mode=self.config.get('storage_mode', 'journal')
+        )
+
+    def load_conversation(self, conv_id):
+        """Nagłówek i historia zapisanej konwersacji (wczytywane raz na uruchomienie)."""
+        with self._conversations_lock:
+            if conv_id not in self._conversations:
+                loaded = self.store.load(conv_id)
+                if loaded is None:
+                    raise KeyError(f"Nie ma konwersacji {conv_id}")
+                self._conversations[conv_id] = loaded
+            return self._conversations[conv_id]
+
+    def configure_backend(self):
+        """Konfiguruje backend kluczem z api_key.txt (lub GEMINI_API_KEY)."""
+        if not self.backend.requires_api_key:
+            return
+        api_key = os.environ.get("GEMINI_API_KEY")
+        key_file = self.data_dir / "api_key.txt"
+        if not api_key and key_file.exists():
+            api_key = key_file.read_text().strip()
+        if not api_key:
+            raise RuntimeError("Brak klucza API (api_key.txt w katalogu danych lub zmienna GEMINI_API_KEY)")
+        self.backend.configure(api_key)
+        self.quota_key = quota_key(api_key)
+
+    def system_prompt(self, item, header=None):
+        """Prompt systemowy pytania: jawny, z prepromptu, z konwersacji albo domyślny."""
+        if item.get("system_prompt") is not None:
+            return item["system_prompt"]
+        if item.get("preprompt"):
+            if item["preprompt"] not in self.preprompts:
+                raise KeyError(f"Nie ma prepromptu '{item['preprompt']}'")
+            return self.preprompts[item["preprompt"]]
+        if header is not None:
+            return header.get("system_prompt", DEFAULT_SYSTEM_PROMPT)
+        return DEFAULT_SYSTEM_PROMPT
+
+    def close(self):
+        self.store.close()
+
+
+class StartPacer:
+    """Najwyżej `per_minute` startów zapytań na minutę, rozłożonych równo w czasie."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def prompt_id(item):
+    """Identyfikator pytania: podany w pliku albo skrót treści (stały między uruchomieniami)."""
+    if item.get("id") is not None:
+        return str(item["id"])
+    raw = json.dumps([item.get("conversation"), item.get("preprompt"), item.get("system_prompt"), item["prompt"]],
+                     ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def read_prompts(source, defaults):
+    """
+    Wczytuje pytania z pliku lub stdin ("-").
+    :param defaults: Pola dopisywane do pytań, które ich nie mają (np. conversation z --conversation).
+    """
+    stream = sys.stdin if source == "-" else open(source, 'r', encoding='utf-8')
+    items = []
+    try:
+        for number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"Błędny JSON w linii {number}: {e}")
+                if not item.get("prompt"):
+                    raise ValueError(f"Brak pola \"prompt\" w linii {number}")
+            else:
+                item = {"prompt": line}
+            for key, value in defaults.items():
+                if value is not None:
+                    item.setdefault(key, value)
+            item["id"] = prompt_id(item)
+            items.append(item)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    return items
+
+
+def answered_ids(output_path):
+    """ID pytań, które mają już odpowiedź w pliku wyników (wyniki z błędem są powtarzane)."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # Linia urwana przy przerwaniu poprzedniego uruchomienia
+                continue
+            if result.get("error") is None and "id" in result:
+                done.add(result["id"])
+    return done
+
+
+def run_prompt(env, item, save):
+    """Jedno pytanie (w wątku puli): kontekst, zapytanie, opcjonalnie zapis konwersacji. Zwraca wynik."""
+    started = time.perf_counter()
+    result = {"id": item["id"], "prompt": item["prompt"], "conversation": item.get("conversation")}
+    try:
+        header, history = None, []
+        if item.get("conversation"):
+            header, history = env.load_conversation(item["conversation"])
+        system_prompt = env.system_prompt(item, header)
+        user_entry = with_token_count({"role": "user", "parts": [{"text": item["prompt"]}]})
+        plan = env.context_builder.build(
+            history, pending=user_entry, system_prompt=system_prompt,
+            summary=header.get("context_summary") if header else None
+        )
+        chat = env.backend.open_chat(env.model_name, plan.system_prompt or None, plan.contents)
+        reply = env.rate_limiter.call(
+            env.quota_key, env.model_name,
+            lambda: env.backend.send(chat, item["prompt"], {"max_output_tokens": env.max_output_tokens}),
+            tokens=plan.sent_tokens
+        )
+        env.rate_limiter.charge(env.quota_key, env.model_name, reply.token_count)
+        result.update(response=reply.text, token_count=reply.token_count, context=plan.stats())
+        if save:
+            bot_entry = with_token_count({"role": "model", "parts": [{"text": reply.text}]}, reply.token_count)
+            result["saved_as"] = save_conversation(env, item, system_prompt, history, user_entry, bot_entry)
+        result["error"] = None
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["model"] = env.model_name
+    result["latency"] = round(time.perf_counter() - started, 3)
+    result["finished_at"] = time.time()
+    return result
+
+
+def save_conversation(env, item, system_prompt, history, user_entry, bot_entry):
+    """Zapisuje pytanie i odpowiedź jako nową konwersację (kopia kontekstu + wymiana). Zwraca jej ID."""
+    conv_id = str(uuid.uuid4())
+    header = {"name": f"Wsad: {item['prompt'][:40]}", "system_prompt": system_prompt}
+    env.store.save(conv_id, header, list(history) + [user_entry, bot_entry])
+    return conv_id
+
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+async def run_batch(env, items, output_path, concurrency=4, per_minute=0, save=False, progress=None):
+    """
+    Wykonuje pytania równolegle i dopisuje każdy wynik do output_path zaraz po nadejściu.
+    :return: (liczba odpowiedzi, liczba błędów).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = StartPacer(per_minute)
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+    counts = {"ok": 0, "errors": 0}
+
+    with open(output_path, 'a', encoding='utf-8') as out:
+        if out.tell() and not _ends_with_newline(output_path):
+            # Urwana linia z przerwanego uruchomienia - nowe wyniki od nowej linii
+            out.write("\n")
+
+        async def worker(item):
+            async with semaphore:
+                await limiter.wait()
+                result = await loop.run_in_executor(executor, run_prompt, env, item, save)
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            counts["errors" if result["error"] else "ok"] += 1
+            if progress:
+                progress(result, counts)
+
+        try:
+            await asyncio.gather(*(worker(item) for item in items))
+        finally:
+            executor.shutdown(wait=True)
+    return counts["ok"], counts["errors"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gemini Chat Pro - pytania z pliku bez okna.")
+    parser.add_argument("prompts", help="Plik z pytaniami (tekst lub JSONL) albo - dla stdin")
+    parser.add_argument("-o", "--output", required=True, help="Plik wyników JSONL (dopisywany)")
+    parser.add_argument("--conversation", help="ID zapisanej konwersacji - jej historia jest kontekstem pytań")
+    parser.add_argument("--preprompt", help="Nazwa prepromptu z preprompts.json jako prompt systemowy")
+    parser.add_argument("--system-prompt", help="Prompt systemowy (zamiast prepromptu)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Liczba jednoczesnych zapytań")
+    parser.add_argument("--rpm", type=float, default=0, help="Limit zapytań na minutę (0 - bez limitu)")
+    parser.add_argument("--save", action="store_true", help="Zapisz każdą odpowiedź jako nową konwersację")
+    parser.add_argument("--data-dir", help="Katalog danych aplikacji (domyślnie jak w aplikacji)")
+    parser.add_argument("--quiet", action="store_true", help="Nie wypisuj postępu")
+    args = parser.parse_args(argv)
+
+    env = BatchEnvironment(args.data_dir)
+    try:
+        items = read_prompts(args.prompts, {
+            "conversation": args.conversation, "preprompt": args.preprompt, "system_prompt": args.system_prompt,
+        })
+        done = answered_ids(args.output)
+        pending = [item for item in items if item["id"] not in done]
+        # Ten sam identyfikator dwa razy w pliku - wystarczy jedna odpowiedź
+        pending = list({item["id"]: item for item in pending}.values())
+        print(f"Pytania: {len(items)}, z odpowiedzią: {len(items) - len(pending)}, do wysłania: {len(pending)}",
+              file=sys.stderr)
+        if not pending:
+            return 0
+        env.configure_backend()
+
+        def progress(result, counts):
+            if args.quiet:
+                return
+            status = "BŁĄD " + result["error"] if result["error"] else f"{result['latency']:.1f} s"
+            print(f"[{counts['ok'] + counts['errors']}/{len(pending)}] {result['id']}: {status}", file=sys.stderr)
+
+        started = time.perf_counter()
+        ok, errors = asyncio.run(run_batch(
+            env, pending, args.output, concurrency=max(1, args.concurrency),
+            per_minute=args.rpm, save=args.save, progress=progress
+        ))
+        print(f"Gotowe: {ok} odpowiedzi, {errors} błędów w {time.perf_counter() - started:.1f} s", file=sys.stderr)
+        return 1 if errors else 0
+    except (OSError, ValueError, RuntimeError, KeyError) as e:
+        print(f"Błąd: {e}", file=sys.stderr)
+        return 2
+    finally:
+        env.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
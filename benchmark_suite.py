@@ -0,0 +1,541 @@
+#!/usr/bin/env python3
+"""
+Zestaw pomiarów Gemini Chat Pro na syntetycznym korpusie (synthetic_corpus).
+
+Mierzy operacje, które spowalniają pracę przy dużej liczbie konwersacji:
+start aplikacji, load_conversation_list, przełączanie konwersacji,
+save_conversation na długiej historii i display_message z wieloma wzorami
+LaTeX - oraz odpowiadające im operacje magazynu konwersacji bez interfejsu.
+Pomiary okna działają bez monitora: jeśli nie ma DISPLAY, a jest Xvfb,
+uruchamiany jest wirtualny ekran; bez niego są pomijane.
+
+Wyniki (w formacie zbliżonym do pytest-benchmark) trafiają do pliku JSON
+w katalogu benchmark_results, a --compare porównuje je z wcześniejszym plikiem.
+
+Przykład:
+    python benchmark_suite.py --conversations 5000 --messages 500000 --math 0.1
+    python benchmark_suite.py --corpus /tmp/corpus --only store --compare benchmark_results/poprzedni.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime
+
+from conversation_store import ConversationStore
+from synthetic_corpus import generate_corpus, message_text
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(APP_DIR, "benchmark_results")
+
+# Zarejestrowane pomiary: (grupa, nazwa, funkcja, czy potrzebuje ekranu)
+BENCHMARKS = []
+
+
+def benchmark(group, needs_display=False):
+    """Rejestruje funkcję pomiaru wywoływaną jako func(bench, ctx)."""
+    def register(func):
+        BENCHMARKS.append((group, func.__name__, func, needs_display))
+        return func
+    return register
+
+
+class Bench:
+    """Wykonuje jeden pomiar w kolejnych rundach (jak benchmark.pedantic z pytest-benchmark)."""
+
+    def __init__(self, default_rounds):
+        self.default_rounds = default_rounds
+        self.samples = []
+        self.extra_info = {}
+
+    def pedantic(self, target, setup=None, rounds=None, warmup_rounds=1):
+        """
+        Mierzy target() w `rounds` rundach. setup() (jeśli podane) jest
+        wywoływane przed każdą rundą i nie wlicza się do czasu.
+        """
+        rounds = rounds or self.default_rounds
+        for i in range(warmup_rounds + rounds):
+            if setup is not None:
+                setup()
+            started = time.perf_counter()
+            target()
+            elapsed = time.perf_counter() - started
+            if i >= warmup_rounds:
+                self.samples.append(elapsed)
+
+    def record(self, seconds):
+        """Dodaje próbkę zmierzoną poza pedantic (np. czas z innego procesu)."""
+        self.samples.append(seconds)
+
+    def stats(self):
+        samples = self.samples
+        q = statistics.quantiles(samples, n=4) if len(samples) > 1 else [samples[0]] * 3
+        mean = statistics.mean(samples)
+        return {
+            "min": min(samples),
+            "max": max(samples),
+            "mean": mean,
+            "median": statistics.median(samples),
+            "stddev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+            "iqr": q[2] - q[0],
+            "rounds": len(samples),
+            "ops": 1 / mean if mean > 0 else 0.0,
+            "data": samples,
+        }
+
+
+class BenchContext:
+    """Korpus i (tworzona przy pierwszym użyciu) aplikacja, wspólne dla pomiarów."""
+
+    def __init__(self, data_dir, corpus, rounds, seed=0):
+        self.data_dir = data_dir
+        self.corpus = corpus
+        self.rounds = rounds
+        self.rng = random.Random(seed)
+        self.conversations_dir = os.path.join(data_dir, "conversations")
+        self.index_file = os.path.join(data_dir, "conversations_index.json")
+        self.storage = corpus.get("storage", "journal")
+        self._app = None
+        self._store = None
+        self._sizes = None
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = self.open_store()
+        return self._store
+
+    def open_store(self):
+        if self.storage == "sqlite":
+            from sqlite_store import SQLiteConversationStore
+            return SQLiteConversationStore(os.path.join(self.data_dir, "conversations.db"))
+        return ConversationStore(self.conversations_dir, self.index_file, mode=self.storage)
+
+    def conversations_by_size(self):
+        """ID konwersacji od najdłuższej."""
+        if self._sizes is None:
+            entries = self.store.list_conversations(refresh=False)
+            self._sizes = [e["id"] for e in sorted(entries, key=lambda e: -e.get("message_count", 0))]
+        return self._sizes
+
+    def sample_conversations(self, count):
+        """Najdłuższa konwersacja i losowe pozostałe - do przełączania."""
+        ids = self.conversations_by_size()
+        return ids[:1] + self.rng.sample(ids[1:], min(count - 1, len(ids) - 1))
+
+    def math_text(self, unique=False):
+        text = message_text(self.rng, "model", True)
+        if unique:
+            # Nowe wyrażenia - nie ma ich w cache wzorów
+            text += f" Nowy wzór $z_{{{self.rng.randint(0, 10 ** 9)}}} = {self.rng.random():.6f}$."
+        return text
+
+    @property
+    def app(self):
+        if self._app is None:
+            self._app = self._start_app()
+        return self._app
+
+    def _start_app(self):
+        import tkinter as tk
+        os.environ["GEMINI_CHAT_DATA_DIR"] = self.data_dir
+        from Gemini_chat_pro import GeminiChatApp
+        root = tk.Tk()
+        app = GeminiChatApp(root)
+        pump(root, lambda: "conversations_loaded" in app.startup_marks and app.current_conversation_id)
+        return app
+
+    def pump_until_rendered(self, timeout=60):
+        """Obsługuje zdarzenia Tk, aż wszystkie wzory LaTeX zostaną podmienione na obrazy."""
+        pump(self.app.root, lambda: not self.app._latex_pending, timeout)
+
+    def close(self):
+        if self._app is not None:
+            app = self._app
+            app.shutdown_requests()
+            app.latex_pool.shutdown()
+            app.shutdown_persistence()
+            app.root.destroy()
+            self._app = None
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+
+def pump(root, condition, timeout=60):
+    """Obsługuje zdarzenia Tk do spełnienia warunku."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError("Przekroczono czas oczekiwania na aplikację")
+        root.update()
+        time.sleep(0.001)
+
+
+# === Magazyn konwersacji (bez interfejsu) ===
+@benchmark("store")
+def store_list_cold(bench, ctx):
+    """Lista konwersacji bez indeksu - odczyt wszystkich plików (pierwsze uruchomienie)."""
+    if ctx.storage == "sqlite":
+        return
+    backup = ctx.index_file + ".bench"
+    shutil.copyfile(ctx.index_file, backup)
+
+    def setup():
+        if os.path.exists(ctx.index_file):
+            os.remove(ctx.index_file)
+
+    def target():
+        store = ctx.open_store()
+        store.list_conversations(refresh=True)
+        store.close()
+
+    try:
+        bench.pedantic(target, setup=setup, rounds=min(ctx.rounds, 3), warmup_rounds=0)
+    finally:
+        os.replace(backup, ctx.index_file)
+
+
+@benchmark("store")
+def store_list_warm(bench, ctx):
+    """Lista konwersacji z gotowym indeksem (kolejne uruchomienia)."""
+    def target():
+        store = ctx.open_store()
+        store.list_conversations(refresh=True)
+        store.close()
+    bench.pedantic(target)
+
+
+@benchmark("store")
+def store_load_tail_longest(bench, ctx):
+    """Ostatnia strona (100 wiadomości) najdłuższej konwersacji - jak przy jej otwarciu."""
+    conv_id = ctx.conversations_by_size()[0]
+    bench.pedantic(lambda: ctx.store.load_tail(conv_id, 100))
+
+
+@benchmark("store")
+def store_load_full_longest(bench, ctx):
+    """Cała najdłuższa konwersacja (get_full_history, eksport)."""
+    conv_id = ctx.conversations_by_size()[0]
+    bench.pedantic(lambda: ctx.store.load(conv_id))
+
+
+@benchmark("store")
+def store_save_append_longest(bench, ctx):
+    """Zapis najdłuższej konwersacji po dopisaniu wymiany (dopisywanie do dziennika)."""
+    conv_id = ctx.conversations_by_size()[0]
+    header, history, start = ctx.store.load_tail(conv_id, 100)
+    state = {"history": history}
+
+    def setup():
+        state["history"] = state["history"] + [
+            {"role": "user", "parts": [{"text": "Pytanie do pomiaru zapisu."}]},
+            {"role": "model", "parts": [{"text": ctx.math_text()}]},
+        ]
+
+    bench.pedantic(lambda: ctx.store.save(conv_id, {"name": header.get("name", conv_id)}, state["history"], start=start),
+                   setup=setup)
+
+
+@benchmark("store")
+def store_save_full_longest(bench, ctx):
+    """Pełny zapis najdłuższej konwersacji w starym formacie JSON (storage_mode "json")."""
+    conv_id = ctx.conversations_by_size()[0]
+    header, history = ctx.store.load(conv_id)
+    target_dir = tempfile.mkdtemp(prefix="gemini_chat_bench_json_")
+    try:
+        store = ConversationStore(target_dir, os.path.join(target_dir, "index.json"), mode="json")
+        bench.pedantic(lambda: store.save(conv_id, header, history))
+        store.close()
+    finally:
+        shutil.rmtree(target_dir, ignore_errors=True)
+
+
+# === Aplikacja (okno Tk) ===
+@benchmark("startup", needs_display=True)
+def app_startup(bench, ctx):
+    """Start aplikacji w osobnym procesie do wczytania listy konwersacji (z gotowym indeksem)."""
+    from startup_benchmark import run_app
+    stages = []
+    for _ in range(min(ctx.rounds, 5)):
+        result = run_app(ctx.data_dir, timeout=300)
+        bench.record(result["conversations_loaded"])
+        stages.append(result)
+    bench.extra_info = {
+        stage: statistics.median(r[stage] for r in stages)
+        for stage in ("imports", "window_mapped", "first_paint", "process_total")
+    }
+
+
+@benchmark("app", needs_display=True)
+def app_load_conversation_list(bench, ctx):
+    bench.pedantic(lambda: ctx.app.load_conversation_list(refresh=True))
+
+
+@benchmark("app", needs_display=True)
+def app_switch_conversation(bench, ctx):
+    """Otwarcie innej konwersacji: wczytanie ostatniej strony i narysowanie okna czatu."""
+    app = ctx.app
+    ids = iter(ctx.sample_conversations(ctx.rounds + 1) * 2)
+
+    def target():
+        app.current_conversation_id = next(ids)
+        app.load_conversation_history(app.current_conversation_id)
+        app.update_conversations_listbox_selection()
+        app.root.update_idletasks()
+
+    bench.pedantic(target)
+
+
+@benchmark("app", needs_display=True)
+def app_save_conversation(bench, ctx):
+    """save_conversation najdłuższej konwersacji aż do zakończenia zapisu w tle."""
+    app = ctx.app
+    conv_id = ctx.conversations_by_size()[0]
+    app.current_conversation_id = conv_id
+    app.load_conversation_history(conv_id)
+
+    def setup():
+        app.conversation_history.append({"role": "user", "parts": [{"text": "Pytanie do pomiaru zapisu."}]})
+        app.conversation_history.append({"role": "model", "parts": [{"text": ctx.math_text()}]})
+
+    def target():
+        app.save_conversation()
+        app.writer.wait_for(('conversation', conv_id))
+
+    bench.pedantic(target, setup=setup)
+
+
+def _clear_chat(app):
+    app.chat_display.config(state='normal')
+    app.chat_display.delete("1.0", "end")
+    app.chat_display.config(state='disabled')
+
+
+@benchmark("app", needs_display=True)
+def app_display_message_plain(bench, ctx):
+    """display_message bez wzorów - punkt odniesienia."""
+    app = ctx.app
+    text = message_text(ctx.rng, "model", False)
+
+    def target():
+        app.display_message("bot", text, is_new_entry=False)
+        app.root.update_idletasks()
+
+    bench.pedantic(target, setup=lambda: _clear_chat(app))
+
+
+@benchmark("app", needs_display=True)
+def app_display_message_latex_cached(bench, ctx):
+    """display_message z wieloma wzorami, które są już w cache."""
+    app = ctx.app
+    text = ctx.math_text()
+    app.display_message("bot", text, is_new_entry=False)
+    ctx.pump_until_rendered()
+
+    def target():
+        app.display_message("bot", text, is_new_entry=False)
+        app.root.update_idletasks()
+
+    bench.pedantic(target, setup=lambda: _clear_chat(app))
+
+
+@benchmark("app", needs_display=True)
+def app_display_message_latex_render(bench, ctx):
+    """display_message z nowymi wzorami aż do podmiany wszystkich obrazów (renderowanie w tle)."""
+    app = ctx.app
+    texts = []
+
+    def setup():
+        _clear_chat(app)
+        texts.append(ctx.math_text(unique=True))
+
+    def target():
+        app.display_message("bot", texts[-1], is_new_entry=False)
+        ctx.pump_until_rendered()
+
+    bench.pedantic(target, setup=setup, rounds=min(ctx.rounds, 5))
+
+
+# === Wirtualny ekran ===
+def start_virtual_display():
+    """
+    Uruchamia Xvfb na wolnym numerze ekranu i ustawia DISPLAY.
+    Zwraca proces Xvfb albo None, jeśli Xvfb nie jest zainstalowany.
+    """
+    xvfb = shutil.which("Xvfb")
+    if xvfb is None:
+        return None
+    for number in range(90, 130):
+        if os.path.exists(f"/tmp/.X{number}-lock"):
+            continue
+        proc = subprocess.Popen(
+            [xvfb, f":{number}", "-screen", "0", "1280x1024x24", "-nolisten", "tcp"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and proc.poll() is None:
+            if os.path.exists(f"/tmp/.X11-unix/X{number}"):
+                os.environ["DISPLAY"] = f":{number}"
+                return proc
+            time.sleep(0.05)
+        proc.kill()
+    return None
+
+
+def display_available():
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+        root.destroy()
+        return True
+    except Exception:
+        return False
+
+
+# === Wyniki ===
+def git_commit():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=APP_DIR,
+                                    capture_output=True, text=True).stdout.strip())
+        return {"id": rev, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"id": None, "dirty": None}
+
+
+def save_results(results, path=None):
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(RESULTS_DIR, f"{stamp}-{results['commit_info']['id'] or 'nogit'}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def print_results(results, baseline=None, threshold=0.1):
+    """Tabela median (ms); z baseline - zmiana względem wcześniejszego pliku wyników."""
+    previous = {}
+    if baseline is not None:
+        previous = {b["name"]: b["stats"]["median"] for b in baseline["benchmarks"]}
+        print(f"Porównanie z {baseline['commit_info'].get('id')} ({baseline['datetime']})")
+    print(f"\n{'pomiar':<36}{'mediana':>12}{'min':>12}{'odch.':>12}{'rundy':>7}")
+    regressions = 0
+    for b in results["benchmarks"]:
+        s = b["stats"]
+        line = (f"{b['group'] + '/' + b['name']:<36}{s['median'] * 1000:>10.2f}ms"
+                f"{s['min'] * 1000:>10.2f}ms{s['stddev'] * 1000:>10.2f}ms{s['rounds']:>7}")
+        if b["name"] in previous and previous[b["name"]] > 0:
+            change = s["median"] / previous[b["name"]] - 1
+            line += f"  {change:+.1%}"
+            if change > threshold:
+                line += "  (wolniej!)"
+                regressions += 1
+        print(line)
+    for name in results.get("skipped", []):
+        print(f"{name:<36}{'pominięty':>12}")
+    return regressions
+
+
+def run_suite(ctx, only=None, with_display=True):
+    results = []
+    skipped = []
+    for group, name, func, needs_display in BENCHMARKS:
+        full_name = f"{group}/{name}"
+        if only and not any(o in full_name for o in only):
+            continue
+        if needs_display and not with_display:
+            skipped.append(full_name)
+            continue
+        print(f"  {full_name}...", flush=True)
+        bench = Bench(ctx.rounds)
+        try:
+            func(bench, ctx)
+        except Exception as e:
+            print(f"Błąd pomiaru {full_name}: {e}")
+            skipped.append(full_name)
+            continue
+        if bench.samples:
+            results.append({"group": group, "name": name, "stats": bench.stats(), "extra_info": bench.extra_info})
+    return results, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pomiary Gemini Chat Pro na syntetycznym korpusie.")
+    parser.add_argument("--corpus", help="Istniejący katalog z synthetic_corpus.py (pomiary dopisują do niego wiadomości)")
+    parser.add_argument("--conversations", type=int, default=1000, help="Liczba konwersacji nowego korpusu")
+    parser.add_argument("--messages", type=int, default=50000, help="Łączna liczba wiadomości nowego korpusu")
+    parser.add_argument("--math", type=float, default=0.1, help="Udział wiadomości z wzorami LaTeX")
+    parser.add_argument("--storage", choices=("journal", "json", "sqlite"), default="journal")
+    parser.add_argument("--rounds", type=int, default=10, help="Liczba rund pomiaru")
+    parser.add_argument("--only", nargs="*", help="Tylko pomiary, których nazwa zawiera podany tekst")
+    parser.add_argument("--no-display", action="store_true", help="Pomiń pomiary wymagające okna")
+    parser.add_argument("--output", help="Plik wyników (domyślnie benchmark_results/<data>-<commit>.json)")
+    parser.add_argument("--compare", help="Plik wcześniejszych wyników do porównania")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Od jakiej zmiany mediany zgłaszać spowolnienie")
+    args = parser.parse_args()
+
+    xvfb = None
+    with_display = not args.no_display
+    if with_display and not os.environ.get("DISPLAY") and sys.platform.startswith("linux"):
+        xvfb = start_virtual_display()
+    if with_display and not display_available():
+        print("Brak ekranu (zainstaluj Xvfb) - pomiary okna zostaną pominięte.")
+        with_display = False
+
+    temp_dir = None
+    try:
+        if args.corpus:
+            data_dir = args.corpus
+            with open(os.path.join(data_dir, "corpus.json"), encoding="utf-8") as f:
+                corpus = json.load(f)
+        else:
+            data_dir = temp_dir = tempfile.mkdtemp(prefix="gemini_chat_bench_")
+            print(f"Generowanie korpusu ({args.conversations} konwersacji, {args.messages} wiadomości) w {data_dir}...")
+            corpus = generate_corpus(data_dir, args.conversations, args.messages, args.math, storage=args.storage)
+
+        ctx = BenchContext(data_dir, corpus, args.rounds)
+        try:
+            benchmarks, skipped = run_suite(ctx, args.only, with_display)
+        finally:
+            ctx.close()
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        if xvfb is not None:
+            xvfb.terminate()
+
+    results = {
+        "machine_info": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "commit_info": git_commit(),
+        "datetime": datetime.now().isoformat(),
+        "corpus": corpus,
+        "benchmarks": benchmarks,
+        "skipped": skipped,
+    }
+    path = save_results(results, args.output)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    regressions = print_results(results, baseline, args.threshold)
+    print(f"\nWyniki zapisane w {path}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def content_fingerprint(message):
+    """Skrót roli i treści wiadomości (bez pól dodawanych przez aplikację, np. "tokens")."""
+    raw = json.dumps([message.get("role"), message.get("parts")], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class ChatSession:
+    """Żywa sesja czatu SDK wraz z modelem i opisem historii, którą zawiera."""
+
+    def __init__(self, model_name, system_instruction, chat, first, count, last_fp):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.chat = chat
+        self.first = first        # Numer pierwszej wiadomości konwersacji w historii sesji
+        self.count = count        # Liczba wiadomości konwersacji, które sesja już zna
+        self.last_fp = last_fp    # Skrót ostatniej z nich (wykrywa edycję historii)
+
+
+class ChatSessionCache:
+    """
+    Pamięć podręczna sesji czatu (czat backendu modelu z system_instruction)
+    dla kolejnych konwersacji, z limitem LRU liczby żywych sesji.
+    Sesja jest używana ponownie, dopóki nie zmieni się model, prompt systemowy
+    (także streszczenie kontekstu), okno wysyłanej historii ani jej treść.
+    Na czas zapytania sesja jest wyjmowana z pamięci (checkout), więc dwa
+    równoległe zapytania nigdy nie dzielą jednego obiektu czatu.
+    """
+
+    def __init__(self, make_chat, max_sessions=8):
+        """
+        :param make_chat: Funkcja make_chat(nazwa_modelu, system_instruction, historia, model=None)
+                          tworząca czat (ModelBackend.open_chat).
+        :param max_sessions: Maksymalna liczba przechowywanych sesji.
+        """
+        self.make_chat = make_chat
+        self.max_sessions = max(1, int(max_sessions))
+        self._sessions = OrderedDict()  # klucz (ID konwersacji) -> ChatSession
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def checkout(self, key, model_name, system_instruction, history, first, contents, model_factory=None):
+        """
+        Zwraca sesję gotową do wysłania kolejnej wiadomości.
+        :param history: Wszystkie wcześniejsze wiadomości konwersacji (bez bieżącej).
+        :param first: Numer pierwszej wiadomości wysyłanej do modelu (pominięte są wcześniejsze).
+        :param contents: Wiadomości history[first:] w postaci dla API (użyte przy tworzeniu sesji).
+        :param model_factory: Funkcja bez argumentów tworząca model przekazywany do make_chat
+                              (np. model z zapisanym kontekstem - wtedy contents to tylko jego ciąg dalszy).
+        :return: Krotka (ChatSession, czy_użyta_ponownie).
+        """
+        with self._lock:
+            session = self._sessions.pop(key, None)
+        if session is not None and self._matches(session, model_name, system_instruction, history, first):
+            with self._lock:
+                self.hits += 1
+            return session, True
+
+        model = model_factory() if model_factory is not None else None
+        session = ChatSession(
+            model_name, system_instruction,
+            self.make_chat(model_name, system_instruction or None, contents, model=model),
+            first, len(history), content_fingerprint(history[-1]) if history else None
+        )
+        with self._lock:
+            self.misses += 1
+        return session, False
+
+    @staticmethod
+    def _matches(session, model_name, system_instruction, history, first):
+        if session.model_name != model_name or session.system_instruction != system_instruction:
+            return False
+        if session.first != first or session.count != len(history):
+            return False
+        return session.last_fp == (content_fingerprint(history[-1]) if history else None)
+
+    def checkin(self, key, session, reply):
+        """
+        Oddaje sesję po udanym zapytaniu. SDK dopisało już do niej wiadomość
+        użytkownika i odpowiedź - tu aktualizowany jest tylko jej opis.
+        Sesji po błędzie lub anulowaniu nie należy oddawać (jej historia jest niepełna).
+        :param reply: Odpowiedź modelu (słownik role/parts).
+        """
+        session.count += 2
+        session.last_fp = content_fingerprint(reply)
+        with self._lock:
+            self._sessions.pop(key, None)
+            self._sessions[key] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """Usuwa sesję konwersacji (albo wszystkie, gdy key=None)."""
+        with self._lock:
+            if key is None:
+                self._sessions.clear()
+            else:
+                self._sessions.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {"sessions": len(self._sessions), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,245 @@
+import tkinter as tk
+
+
+class ChatTranscript:
+    """
+    Wirtualizowany widok rozmowy nad widżetem Text.
+    Model to numery wiadomości 0..total-1; w widżecie jest wyświetlony
+    tylko ich fragment [lo, hi) - okno wokół widocznego miejsca z marginesem.
+    Przewijanie do krawędzi fragmentu dorysowuje kolejne wiadomości, a te,
+    które są daleko od widoku, usuwa z widżetu. Pasek przewijania pokazuje
+    pozycję w całej rozmowie, nie tylko we fragmencie.
+    Każda wyświetlona wiadomość ma na początku znacznik msg_<numer>.
+    """
+
+    def __init__(self, text, scrollbar, render_message, fetch_messages, window=60, margin=20, edge=0.15):
+        """
+        :param text: Widżet Text z rozmową.
+        :param scrollbar: Pasek przewijania widżetu.
+        :param render_message: Funkcja render_message(wiadomość, index=..., seq=...)
+                               wstawiająca wiadomość w miejscu index i ustawiająca msg_<seq>.
+        :param fetch_messages: Funkcja fetch_messages(start, end) zwracająca wiadomości [start, end).
+        :param window: Docelowa liczba wyświetlonych wiadomości.
+        :param margin: Liczba wiadomości dorysowywanych naraz przy krawędzi.
+        :param edge: Jaka część widoku od krawędzi fragmentu uruchamia dorysowanie (0-1).
+        """
+        self.text = text
+        self.scrollbar = scrollbar
+        self.render_message = render_message
+        self.fetch_messages = fetch_messages
+        self.window = window
+        self.margin = margin
+        self.edge = edge
+
+        self.total = 0
+        self.lo = 0
+        self.hi = 0
+        # Gdy True, koniec fragmentu nie jest usuwany (np. trwa odpowiedź strumieniowa)
+        self.hold_tail = False
+
+        self._view = (0.0, 1.0)
+        self._adjust_scheduled = False
+        self._pending_jump = None
+
+        text.configure(yscrollcommand=self._on_text_scroll)
+        scrollbar.configure(command=self._on_scrollbar)
+
+    @property
+    def max_materialized(self):
+        return self.window + 2 * self.margin
+
+    def at_end(self):
+        """Czy ostatnia wiadomość rozmowy jest wyświetlona."""
+        return self.hi == self.total
+
+    # === Zmiany modelu ===
+    def reset(self, total, anchor_seq=None):
+        """
+        Czyści widżet i wyświetla okno wiadomości: ostatnie (anchor_seq=None)
+        albo wokół wiadomości anchor_seq, która trafia na górę widoku.
+        """
+        self.total = total
+        self._pending_jump = None
+        if anchor_seq is None:
+            self.hi = total
+            self.lo = max(0, total - self.window)
+        else:
+            anchor_seq = max(0, min(anchor_seq, total - 1))
+            self.lo = max(0, anchor_seq - self.margin)
+            self.hi = min(total, self.lo + self.window)
+            self.lo = max(0, min(self.lo, self.hi - self.window))
+
+        self.text.config(state='normal')
+        self.text.delete('1.0', tk.END)
+        self._set_tail_mark()
+        self._render_range(self.lo, self.hi, 'transcript_tail')
+        self.text.config(state='disabled')
+
+        if anchor_seq is None:
+            self.text.see(tk.END)
+        elif self.lo <= anchor_seq < self.hi:
+            self.text.yview(f"msg_{anchor_seq}")
+
+    def append(self, message, rendered=False, follow=False):
+        """
+        Dopisuje wiadomość na końcu rozmowy w czasie O(1) - bez przerysowywania.
+        Jeśli koniec rozmowy nie jest wyświetlony, wiadomość pojawi się po przewinięciu.
+        :param rendered: Wiadomość jest już w widżecie (np. odebrana strumieniowo).
+        :param follow: Przewiń do końca nawet, jeśli widok nie był na dole.
+        :return: Numer wiadomości.
+        """
+        seq = self.total
+        self.total += 1
+        if self.hi != seq:
+            if follow:
+                self.reset(self.total)
+            return seq
+
+        at_bottom = self._view[1] >= 0.999
+        if not rendered:
+            self.text.config(state='normal')
+            self._set_tail_mark()
+            self.render_message(message, index='transcript_tail', seq=seq)
+            self.text.config(state='disabled')
+        self.hi += 1
+        if follow or at_bottom:
+            self.text.see(tk.END)
+        self._trim_top()
+        return seq
+
+    def scroll_to_end(self):
+        """Wyświetla koniec rozmowy (przed dopisaniem nowej wiadomości na dole)."""
+        if not self.at_end():
+            self.reset(self.total)
+        else:
+            self.text.see(tk.END)
+
+    def jump_to(self, seq):
+        """Przewija do wiadomości seq, w razie potrzeby wyświetlając inne okno."""
+        if self.lo <= seq < self.hi:
+            self.text.yview(f"msg_{seq}")
+        else:
+            self.reset(self.total, anchor_seq=seq)
+
+    # === Przewijanie ===
+    def _on_text_scroll(self, first, last):
+        first, last = float(first), float(last)
+        self._view = (first, last)
+        self.scrollbar.set(*self._to_global(first, last))
+        if self._adjust_scheduled:
+            return
+        if (first <= self.edge and self.lo > 0) or (last >= 1 - self.edge and self.hi < self.total):
+            self._adjust_scheduled = True
+            self.text.after_idle(self._adjust)
+
+    def _to_global(self, first, last):
+        """Przelicza pozycję we fragmencie na pozycję w całej rozmowie."""
+        span = self.hi - self.lo
+        if self.total <= 0 or span <= 0:
+            return 0.0, 1.0
+        return (self.lo + first * span) / self.total, (self.lo + last * span) / self.total
+
+    def _on_scrollbar(self, *args):
+        if args[0] != 'moveto':
+            self.text.yview(*args)
+            return
+        target = float(args[1]) * self.total
+        span = self.hi - self.lo
+        if span > 0 and (self.lo <= target <= self.hi or (self.lo == 0 and self.hi == self.total)):
+            self.text.yview_moveto((target - self.lo) / span)
+            return
+        # Skok poza fragment - przy przeciąganiu suwaka przerysuj tylko raz na koniec serii zdarzeń
+        if self._pending_jump is None:
+            self.text.after_idle(self._do_pending_jump)
+        self._pending_jump = int(target)
+
+    def _do_pending_jump(self):
+        seq, self._pending_jump = self._pending_jump, None
+        if seq is not None and self.total:
+            self.reset(self.total, anchor_seq=seq)
+
+    def _adjust(self):
+        """Dorysowuje wiadomości przy krawędzi, do której zbliżył się widok."""
+        self._adjust_scheduled = False
+        first, last = self.text.yview()
+        if first <= self.edge and self.lo > 0:
+            self._extend_top()
+        elif last >= 1 - self.edge and self.hi < self.total:
+            self._extend_bottom()
+
+    def _extend_top(self):
+        new_lo = max(0, self.lo - self.margin)
+        self.text.config(state='normal')
+        # Zapamiętaj widoczny fragment, żeby widok nie skakał po wstawieniu tekstu powyżej
+        self.text.mark_set('view_anchor', '@0,0')
+        self.text.mark_gravity('view_anchor', tk.RIGHT)
+        self.text.mark_set('transcript_head', '1.0')
+        self.text.mark_gravity('transcript_head', tk.RIGHT)
+        self._render_range(new_lo, self.lo, 'transcript_head')
+        if self.lo < self.hi:
+            # Znacznik dotychczas pierwszej wiadomości (grawitacja w lewo) został przed wstawionym tekstem
+            self.text.mark_set(f"msg_{self.lo}", 'transcript_head')
+        self.lo = new_lo
+        self._trim_bottom()
+        self.text.config(state='disabled')
+        self.text.yview('view_anchor')
+
+    def _extend_bottom(self):
+        new_hi = min(self.total, self.hi + self.margin)
+        self.text.config(state='normal')
+        self._set_tail_mark()
+        self._render_range(self.hi, new_hi, 'transcript_tail')
+        self.hi = new_hi
+        self.text.config(state='disabled')
+        self._trim_top()
+
+    def _trim_top(self):
+        """Usuwa z widżetu najstarsze wiadomości fragmentu, jeśli są daleko nad widokiem."""
+        if self.hi - self.lo <= self.max_materialized:
+            return
+        new_lo = min(self.hi - self.window - self.margin, self._seq_at('@0,0') - self.margin)
+        if new_lo <= self.lo:
+            return
+        self.text.config(state='normal')
+        self.text.mark_set('view_anchor', '@0,0')
+        self.text.delete('1.0', f"msg_{new_lo}")
+        self.text.mark_unset(*[f"msg_{seq}" for seq in range(self.lo, new_lo)])
+        self.lo = new_lo
+        self.text.config(state='disabled')
+        self.text.yview('view_anchor')
+
+    def _trim_bottom(self):
+        """Usuwa z widżetu najnowsze wiadomości fragmentu, jeśli są daleko pod widokiem."""
+        if self.hold_tail or self.hi - self.lo <= self.max_materialized:
+            return
+        new_hi = max(self.lo + self.window + self.margin, self._seq_at('@0,%d' % self.text.winfo_height()) + self.margin + 1)
+        if new_hi >= self.hi:
+            return
+        self.text.delete(f"msg_{new_hi}", tk.END)
+        self.text.mark_unset(*[f"msg_{seq}" for seq in range(new_hi, self.hi)])
+        self.hi = new_hi
+
+    # === Pomocnicze ===
+    def _render_range(self, start, end, index):
+        if start >= end:
+            return
+        for i, message in enumerate(self.fetch_messages(start, end)):
+            self.render_message(message, index=index, seq=start + i)
+            # render_message może wyłączyć edycję widżetu
+            self.text.config(state='normal')
+
+    def _set_tail_mark(self):
+        """Znacznik końca tekstu - wstawianie przy nim nie przewija widoku (w przeciwieństwie do tk.END)."""
+        self.text.mark_set('transcript_tail', 'end-1c')
+        self.text.mark_gravity('transcript_tail', tk.RIGHT)
+
+    def _seq_at(self, index):
+        """Numer wyświetlonej wiadomości zawierającej index (wyszukiwanie binarne po znacznikach)."""
+        lo, hi = self.lo, self.hi
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.text.compare(f"msg_{mid}", '<=', index):
+                lo = mid + 1
+            else:
+                hi = mid
+        return max(self.lo, lo - 1)
@@ -0,0 +1,173 @@
+import math
+
+# Szacunek bez wywołania API: średnio ok. 4 znaki na token (jak w StreamingReply)
+CHARS_PER_TOKEN = 4
+# Narzut na każdą wiadomość (rola, separatory)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Maksymalna długość jednej wiadomości w tekście przekazywanym do streszczenia
+SUMMARY_MESSAGE_CHARS = 2000
+
+SUMMARY_HEADER = "Streszczenie wcześniejszej części rozmowy:"
+
+
+def estimate_tokens(text):
+    """Szacuje liczbę tokenów tekstu."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def message_text(message):
+    """Łączy tekst wszystkich części wiadomości."""
+    return "".join(
+        part.get("text", "") for part in message.get("parts", []) if isinstance(part, dict)
+    )
+
+
+def with_token_count(message, tokens=None):
+    """
+    Zapisuje w wiadomości liczbę tokenów (pole "tokens", zapisywane razem z historią),
+    żeby nie trzeba jej było liczyć przy każdym zapytaniu.
+    :param tokens: Dokładna liczba z API (usage_metadata) lub None - wtedy szacunek.
+    """
+    message["tokens"] = tokens if tokens else estimate_tokens(message_text(message))
+    return message
+
+
+def message_tokens(message):
+    """Liczba tokenów wiadomości: zapisana przy jej utworzeniu, a dla starszych wiadomości szacowana."""
+    tokens = message.get("tokens")
+    if not isinstance(tokens, int) or tokens < 0:
+        tokens = estimate_tokens(message_text(message))
+    return tokens + MESSAGE_OVERHEAD_TOKENS
+
+
+def api_content(message):
+    """Wiadomość w postaci przyjmowanej przez API - bez pól dodanych przez aplikację."""
+    return {"role": message["role"], "parts": message["parts"]}
+
+
+def make_summary(text, covers):
+    """Rekord streszczenia pierwszych `covers` wiadomości (zapisywany w nagłówku konwersacji)."""
+    return {"covers": covers, "text": text, "tokens": estimate_tokens(text)}
+
+
+def build_summary_prompt(previous_summary, messages, max_words):
+    """Polecenie dla modelu: streszczenie pominiętych wiadomości, uzupełniające poprzednie streszczenie."""
+    lines = [
+        f"Streść zwięźle (najwyżej ok. {max_words} słów) poniższą rozmowę użytkownika z asystentem. "
+        "Zachowaj fakty, ustalenia, decyzje i otwarte pytania, które mogą być potrzebne w dalszej rozmowie. "
+        "Odpowiedz samym streszczeniem, w języku rozmowy."
+    ]
+    if previous_summary:
+        lines.append("\nDotychczasowe streszczenie (uwzględnij je w nowym):\n" + previous_summary["text"])
+    lines.append("\nRozmowa:")
+    for message in messages:
+        speaker = "Użytkownik" if message.get("role") == "user" else "Asystent"
+        text = message_text(message)
+        if len(text) > SUMMARY_MESSAGE_CHARS:
+            text = text[:SUMMARY_MESSAGE_CHARS] + " [...]"
+        lines.append(f"{speaker}: {text}")
+    return "\n".join(lines)
+
+
+class ContextPlan:
+    """Wynik ContextBuilder.build: co trafia do modelu i ile zostało pominięte."""
+
+    def __init__(self, system_prompt, contents, summary, sent_tokens, dropped_tokens, dropped_messages, summarize_upto):
+        self.system_prompt = system_prompt      # Prompt systemowy, ewentualnie ze streszczeniem
+        self.contents = contents                # Historia do wysłania (bez bieżącej wiadomości)
+        self.summary = summary                  # Użyte streszczenie lub None
+        self.sent_tokens = sent_tokens
+        self.dropped_tokens = dropped_tokens
+        self.dropped_messages = dropped_messages
+        # Ile pierwszych wiadomości warto streścić na nowo (pominięte bez streszczenia) lub None
+        self.summarize_upto = summarize_upto
+        # Ile z wysłanych tokenów pochodziło z kontekstu zapisanego po stronie modelu (context_cache)
+        self.cached_tokens = 0
+
+    def stats(self):
+        """Statystyki zapytania - zapisywane przy odpowiedzi modelu (pole "context")."""
+        return {
+            "sent": self.sent_tokens,
+            "dropped": self.dropped_tokens,
+            "dropped_messages": self.dropped_messages,
+            "summary": self.summary is not None,
+            "cached": self.cached_tokens,
+        }
+
+    def describe(self):
+        """Krótki opis do paska statusu."""
+        text = f"kontekst ~{self.sent_tokens} tok."
+        if self.cached_tokens:
+            text += f" (z cache {self.cached_tokens})"
+        if self.dropped_messages:
+            text += f", pominięto ~{self.dropped_tokens} tok. ({self.dropped_messages} wiad.)"
+            if self.summary is not None:
+                text += " - ze streszczeniem"
+        return text
+
+
+class ContextBuilder:
+    """
+    Składa kontekst zapytania w limicie tokenów wejściowych: prompt systemowy,
+    bieżąca wiadomość i najnowsze wiadomości historii, które się zmieszczą.
+    Jeśli cała historia się nie mieści, starsze wiadomości są zastępowane
+    zapisanym streszczeniem (jeśli istnieje).
+    """
+
+    def __init__(self, budget_tokens=32000, summary_tokens=800):
+        """
+        :param budget_tokens: Limit tokenów wejściowych jednego zapytania.
+        :param summary_tokens: Limit długości tworzonych streszczeń.
+        """
+        self.budget_tokens = max(1, int(budget_tokens))
+        self.summary_tokens = max(1, int(summary_tokens))
+
+    def build(self, history, pending=None, system_prompt="", summary=None):
+        """
+        :param history: Wcześniejsze wiadomości konwersacji (bez bieżącej).
+        :param pending: Bieżąca wiadomość użytkownika (wysyłana osobno).
+        :param system_prompt: Prompt systemowy.
+        :param summary: Streszczenie z nagłówka konwersacji (make_summary) lub None.
+        :return: ContextPlan.
+        """
+        costs = [message_tokens(m) for m in history]
+        fixed = estimate_tokens(system_prompt)
+        if pending is not None:
+            fixed += message_tokens(pending)
+
+        if fixed + sum(costs) <= self.budget_tokens:
+            return ContextPlan(
+                system_prompt, [api_content(m) for m in history], None,
+                fixed + sum(costs), 0, 0, None
+            )
+
+        # Historia się nie mieści - najpierw miejsce na streszczenie, potem najnowsze wiadomości
+        if summary and summary.get("text"):
+            summary_cost = summary.get("tokens") or estimate_tokens(summary["text"])
+            if fixed + summary_cost > self.budget_tokens:
+                summary, summary_cost = None, 0
+        else:
+            summary, summary_cost = None, 0
+
+        available = self.budget_tokens - fixed - summary_cost
+        cut, used = len(history), 0
+        while cut > 0 and used + costs[cut - 1] <= available:
+            cut -= 1
+            used += costs[cut]
+        # Historia wysyłana do modelu musi zaczynać się od wiadomości użytkownika
+        while cut < len(history) and history[cut].get("role") != "user":
+            used -= costs[cut]
+            cut += 1
+
+        covered = summary.get("covers", 0) if summary else 0
+        if summary is not None:
+            system_prompt = (system_prompt + "\n\n" if system_prompt else "") + SUMMARY_HEADER + "\n" + summary["text"]
+        return ContextPlan(
+            system_prompt,
+            [api_content(m) for m in history[cut:]],
+            summary,
+            fixed + summary_cost + used,
+            sum(costs[:cut]),
+            cut,
+            cut if cut > covered else None
+        )
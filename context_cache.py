@@ -0,0 +1,312 @@
+import time
+import threading
+import itertools
+
+from context_builder import api_content, message_tokens, estimate_tokens
+from chat_sessions import content_fingerprint
+import gemini_sdk
+
+
+class CacheBackend:
+    """
+    Interfejs przechowywania stałego początku kontekstu po stronie modelu.
+    Uchwyt zwracany przez create() jest nieprzezroczysty - menedżer tylko
+    przekazuje go z powrotem do refresh/delete/make_model.
+    """
+
+    def create(self, model_name, system_instruction, contents, ttl_seconds):
+        """Zapisuje prompt systemowy i wiadomości. Zwraca uchwyt."""
+        raise NotImplementedError
+
+    def refresh(self, handle, ttl_seconds):
+        """Przedłuża ważność zapisanego kontekstu."""
+        raise NotImplementedError
+
+    def delete(self, handle):
+        raise NotImplementedError
+
+    def make_model(self, handle):
+        """Model (dla ModelBackend.open_chat), który dostaje zapisany kontekst przed historią czatu."""
+        raise NotImplementedError
+
+    def name(self, handle):
+        """Identyfikator zapisanego kontekstu (unikalny)."""
+        raise NotImplementedError
+
+
+class GeminiCacheBackend(CacheBackend):
+    """Cached content Gemini API (google.generativeai.caching)."""
+
+    def create(self, model_name, system_instruction, contents, ttl_seconds):
+        import datetime
+        genai, _ = gemini_sdk.load()
+        return genai.caching.CachedContent.create(
+            model=model_name,
+            system_instruction=system_instruction or None,
+            contents=contents,
+            ttl=datetime.timedelta(seconds=ttl_seconds)
+        )
+
+    def refresh(self, handle, ttl_seconds):
+        import datetime
+        handle.update(ttl=datetime.timedelta(seconds=ttl_seconds))
+
+    def delete(self, handle):
+        handle.delete()
+
+    def make_model(self, handle):
+        genai, _ = gemini_sdk.load()
+        return genai.GenerativeModel.from_cached_content(cached_content=handle)
+
+    def name(self, handle):
+        return handle.name
+
+
+class _LocalModel:
+    """Model, którego czat zaczyna się od zapisanego kontekstu i dalszej historii."""
+
+    def __init__(self, open_chat, handle):
+        self._open_chat = open_chat
+        self._handle = handle
+
+    def start_chat(self, history=None):
+        handle = self._handle
+        return self._open_chat(
+            handle["model_name"], handle["system_instruction"], handle["contents"] + list(history or [])
+        )
+
+
+class LocalCacheBackend(CacheBackend):
+    """
+    Zastępnik działający lokalnie (bez API cache): pamięta kontekst w procesie
+    i dokleja go do historii zwykłego czatu. Pozwala sprawdzić działanie
+    ContextCacheManager bez sieci, np. z MockBackend.
+    """
+
+    def __init__(self, open_chat, clock=time.monotonic):
+        """:param open_chat: Funkcja open_chat(nazwa_modelu, system_instruction, historia) (ModelBackend.open_chat)."""
+        self._open_chat = open_chat
+        self._clock = clock
+        self._ids = itertools.count(1)
+        self.entries = {}  # nazwa -> słownik z opisem zapisanego kontekstu
+
+    def create(self, model_name, system_instruction, contents, ttl_seconds):
+        name = f"local-cache/{next(self._ids)}"
+        self.entries[name] = {
+            "name": name,
+            "model_name": model_name,
+            "system_instruction": system_instruction,
+            "contents": list(contents),
+            "expires_at": self._clock() + ttl_seconds,
+        }
+        return self.entries[name]
+
+    def refresh(self, handle, ttl_seconds):
+        if handle["name"] not in self.entries:
+            raise KeyError(f"Kontekst {handle['name']} wygasł lub został usunięty")
+        handle["expires_at"] = self._clock() + ttl_seconds
+
+    def delete(self, handle):
+        self.entries.pop(handle["name"], None)
+
+    def make_model(self, handle):
+        return _LocalModel(self._open_chat, handle)
+
+    def name(self, handle):
+        return handle["name"]
+
+
+class CachePlan:
+    """Wynik ContextCacheManager.prepare dla jednego zapytania."""
+
+    def __init__(self, cache_name=None, model_factory=None, contents=None, cached_tokens=0, prefix_count=0):
+        self.cache_name = cache_name        # None - zapytanie bez zapisanego kontekstu
+        self.model_factory = model_factory  # Funkcja bez argumentów tworząca model z kontekstem
+        self.contents = contents            # Wiadomości do wysłania (tylko nowy koniec historii)
+        self.cached_tokens = cached_tokens
+        self.prefix_count = prefix_count    # Ile wiadomości okna jest w zapisanym kontekście
+
+
+class _Entry:
+    def __init__(self, handle, name, model_name, system_instruction, first, count, last_fp, tokens, expires_at):
+        self.handle = handle
+        self.name = name
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.first = first          # Numer pierwszej wiadomości konwersacji w kontekście
+        self.count = count          # Liczba wiadomości w kontekście
+        self.last_fp = last_fp
+        self.tokens = tokens        # Szacowana liczba tokenów kontekstu (z promptem systemowym)
+        self.expires_at = expires_at
+
+
+class ContextCacheManager:
+    """
+    Zapisuje po stronie modelu stały początek kontekstu konwersacji (prompt
+    systemowy + wcześniejsze wiadomości), gdy przekroczy on min_tokens, i przy
+    kolejnych zapytaniach wysyła tylko nowe wiadomości.
+    Zapis jest odnawiany przed wygaśnięciem (ttl_seconds) i usuwany, gdy
+    zmieni się prompt, model lub okno historii. Nowy, dłuższy zapis powstaje,
+    gdy niezapisany koniec historii sam urośnie do min_tokens.
+    """
+
+    def __init__(self, backend, min_tokens=32768, ttl_seconds=600, refresh_margin=60, clock=time.monotonic):
+        """
+        :param backend: CacheBackend (GeminiCacheBackend lub LocalCacheBackend).
+        :param min_tokens: Minimalny rozmiar zapisywanego kontekstu (limit API).
+        :param ttl_seconds: Czas ważności zapisu.
+        :param refresh_margin: Na ile sekund przed wygaśnięciem zapis jest odnawiany.
+        """
+        self.backend = backend
+        self.min_tokens = min_tokens
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin = refresh_margin
+        self._clock = clock
+        self._entries = {}          # ID konwersacji -> _Entry
+        self._failed_until = {}     # ID konwersacji -> czas, do którego nie próbujemy ponownie
+        self._busy = {}             # ID konwersacji -> znacznik trwającego create/refresh
+        # Blokada chroni tylko słowniki - wywołania backendu (sieć) idą już bez niej
+        self._lock = threading.Lock()
+
+    def prepare(self, key, model_name, system_instruction, messages, first):
+        """
+        :param messages: Wiadomości wysyłane do modelu (okno z ContextBuilder, bez bieżącej).
+        :param first: Numer pierwszej z nich w całej konwersacji.
+        :return: CachePlan.
+        """
+        plain = CachePlan(contents=[api_content(m) for m in messages])
+        stale = []
+        with self._lock:
+            if key in self._busy:
+                # Inne zapytanie tej konwersacji właśnie zapisuje lub odnawia kontekst
+                return plain
+            now = self._clock()
+            entry = self._entries.get(key)
+            if entry is not None and not self._matches(entry, model_name, system_instruction, messages, first, now):
+                stale.append(self._entries.pop(key))
+                entry = None
+
+            costs = [message_tokens(m) for m in messages]
+            if entry is not None:
+                if sum(costs[entry.count:]) < self.min_tokens:
+                    if entry.expires_at - now >= self.refresh_margin:
+                        return self._plan(entry, messages)
+                else:
+                    # Niezapisany koniec historii jest już duży - zapisz od nowa całość
+                    stale.append(self._entries.pop(key))
+                    entry = None
+
+            total = estimate_tokens(system_instruction) + sum(costs)
+            if entry is None and (total < self.min_tokens or self._failed_until.get(key, 0) > now):
+                token = None
+            else:
+                token = self._busy[key] = object()
+        self._delete(stale)
+        if token is None:
+            return plain
+
+        if entry is not None:
+            entry = self._refresh(key, entry, token)
+        else:
+            entry = self._create(key, model_name, system_instruction, messages, first, total, token)
+        return plain if entry is None else self._plan(entry, messages)
+
+    def _matches(self, entry, model_name, system_instruction, messages, first, now):
+        if entry.expires_at <= now:
+            return False
+        if entry.model_name != model_name or entry.system_instruction != system_instruction:
+            return False
+        if entry.first != first or entry.count > len(messages):
+            return False
+        return entry.count == 0 or content_fingerprint(messages[entry.count - 1]) == entry.last_fp
+
+    def _plan(self, entry, messages):
+        backend, handle = self.backend, entry.handle
+        return CachePlan(
+            cache_name=entry.name,
+            model_factory=lambda: backend.make_model(handle),
+            contents=[api_content(m) for m in messages[entry.count:]],
+            cached_tokens=entry.tokens,
+            prefix_count=entry.count
+        )
+
+    def _finish(self, key, token):
+        """Zdejmuje znacznik create/refresh. False - konwersację w międzyczasie unieważniono (blokada trzymana)."""
+        if self._busy.get(key) is not token:
+            return False
+        del self._busy[key]
+        return True
+
+    def _create(self, key, model_name, system_instruction, messages, first, tokens, token):
+        try:
+            handle = self.backend.create(
+                model_name, system_instruction, [api_content(m) for m in messages], self.ttl_seconds
+            )
+        except Exception as e:
+            print(f"Nie można zapisać kontekstu w cache modelu: {e}")
+            with self._lock:
+                if self._finish(key, token):
+                    self._failed_until[key] = self._clock() + self.ttl_seconds
+            return None
+        now = self._clock()
+        entry = _Entry(
+            handle, self.backend.name(handle), model_name, system_instruction, first, len(messages),
+            content_fingerprint(messages[-1]) if messages else None, tokens, now + self.ttl_seconds
+        )
+        with self._lock:
+            current = self._finish(key, token)
+            if current:
+                self._entries[key] = entry
+        if not current:
+            self._delete([entry])
+            return None
+        return entry
+
+    def _refresh(self, key, entry, token):
+        try:
+            self.backend.refresh(entry.handle, self.ttl_seconds)
+        except Exception as e:
+            print(f"Nie można odnowić cache kontekstu: {e}")
+            with self._lock:
+                if self._finish(key, token) and self._entries.get(key) is entry:
+                    del self._entries[key]
+            return None
+        with self._lock:
+            if not self._finish(key, token) or self._entries.get(key) is not entry:
+                return None
+            entry.expires_at = self._clock() + self.ttl_seconds
+        return entry
+
+    def _delete(self, entries):
+        """Usuwa zapisy po stronie modelu (bez blokady - to wywołania sieciowe)."""
+        for entry in entries:
+            try:
+                self.backend.delete(entry.handle)
+            except Exception as e:
+                # Zapis i tak wygaśnie po upływie TTL
+                print(f"Nie można usunąć cache kontekstu: {e}")
+
+    def invalidate(self, key=None):
+        """
+        Zapomina zapis konwersacji (albo wszystkie, gdy key=None) i od razu wraca -
+        wywoływane z wątku Tk, więc usunięcie po stronie modelu idzie w osobnym wątku.
+        Trwający w tym czasie create/refresh porzuca (i usuwa) swój wynik.
+        """
+        with self._lock:
+            keys = list(self._entries) if key is None else [key]
+            entries = [self._entries.pop(k) for k in keys if k in self._entries]
+            if key is None:
+                self._busy.clear()
+                self._failed_until.clear()
+            else:
+                self._busy.pop(key, None)
+                self._failed_until.pop(key, None)
+        if entries:
+            threading.Thread(target=self._delete, args=(entries,), name="context-cache-delete", daemon=True).start()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "cached_tokens": sum(e.tokens for e in self._entries.values()),
+            }
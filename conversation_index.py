@@ -0,0 +1,167 @@
+import os
+import json
+import threading
+
+# Wersja formatu pliku indeksu - zmiana wymusza pełną przebudowę
+INDEX_VERSION = 2
+
+
+class ConversationIndex:
+    """
+    Trwały indeks metadanych konwersacji (id, nazwa, daty, liczba wiadomości,
+    mtime i rozmiar pliku). Dzięki niemu lista konwersacji nie wymaga
+    parsowania każdego pliku JSON - ponownie czytane są tylko pliki,
+    których mtime lub rozmiar nie zgadza się z zapisanym wpisem.
+    """
+
+    def __init__(self, index_file, conversations_dir, read_metadata=None, extensions=('.json',)):
+        """
+        :param index_file: Ścieżka do pliku indeksu.
+        :param conversations_dir: Katalog z plikami konwersacji.
+        :param read_metadata: Funkcja czytająca metadane z pliku konwersacji
+                              (domyślnie json.load całego pliku).
+        :param extensions: Obsługiwane rozszerzenia plików, od najważniejszego -
+                           gdy dla jednego ID istnieje kilka plików, wygrywa pierwszy.
+        """
+        self.index_file = index_file
+        self.conversations_dir = conversations_dir
+        self.read_metadata = read_metadata or self._read_json
+        self.extensions = tuple(extensions)
+        self.entries = {}
+        self._lock = threading.RLock()
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        """Wczytuje indeks z dysku. Uszkodzony lub nieaktualny plik jest ignorowany."""
+        with self._lock:
+            self.entries = {}
+            try:
+                if os.path.exists(self.index_file):
+                    with open(self.index_file, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                    if data.get("version") == INDEX_VERSION:
+                        self.entries = {e["id"]: e for e in data.get("entries", [])}
+            except (json.JSONDecodeError, OSError, KeyError, AttributeError) as e:
+                print(f"Błąd odczytu indeksu konwersacji, zostanie przebudowany: {e}")
+                self.entries = {}
+
+    def save(self):
+        """Zapisuje indeks atomowo (plik tymczasowy + podmiana), jeśli się zmienił."""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"version": INDEX_VERSION, "entries": list(self.entries.values())}
+            tmp_path = self.index_file + ".tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    # dumps korzysta z kodera w C - dump do pliku koduje w Pythonie
+                    f.write(json.dumps(data, ensure_ascii=False))
+                os.replace(tmp_path, self.index_file)
+                self._dirty = False
+            except OSError as e:
+                print(f"Błąd zapisu indeksu konwersacji: {e}")
+
+    def refresh(self):
+        """
+        Porównuje indeks z zawartością katalogu konwersacji.
+        Parsowane są wyłącznie pliki nowe lub zmienione (inny mtime/rozmiar),
+        wpisy usuniętych plików są wyrzucane z indeksu.
+        :return: Lista wpisów posortowana po nazwie.
+        """
+        with self._lock:
+            found = {}
+            try:
+                with os.scandir(self.conversations_dir) as it:
+                    for dir_entry in it:
+                        conv_id, ext = os.path.splitext(dir_entry.name)
+                        if ext not in self.extensions or not dir_entry.is_file():
+                            continue
+                        priority = self.extensions.index(ext)
+                        if conv_id not in found or priority < found[conv_id][0]:
+                            found[conv_id] = (priority, dir_entry)
+            except OSError as e:
+                print(f"Nie można przeskanować katalogu konwersacji: {e}")
+                return self.list()
+
+            for conv_id, (_, dir_entry) in found.items():
+                try:
+                    stat = dir_entry.stat()
+                except OSError:
+                    continue
+                entry = self.entries.get(conv_id)
+                if entry and entry.get("mtime") == stat.st_mtime_ns and entry.get("size") == stat.st_size:
+                    continue
+                self._reindex_file(conv_id, dir_entry.path, stat)
+
+            for conv_id in list(self.entries):
+                if conv_id not in found:
+                    del self.entries[conv_id]
+                    self._dirty = True
+
+            self.save()
+            return self.list()
+
+    def _reindex_file(self, conv_id, filepath, stat):
+        """Parsuje pojedynczy plik konwersacji i aktualizuje jego wpis."""
+        try:
+            data = self.read_metadata(filepath)
+        except (json.JSONDecodeError, OSError, UnicodeDecodeError, KeyError) as e:
+            print(f"Błąd odczytu pliku JSON: {filepath} - {e}")
+            self.entries.pop(conv_id, None)
+            self._dirty = True
+            return
+        self.entries[conv_id] = self._make_entry(conv_id, data, stat)
+        self._dirty = True
+
+    @staticmethod
+    def _read_json(filepath):
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    @staticmethod
+    def _make_entry(conv_id, data, stat):
+        """Buduje wpis indeksu na podstawie danych konwersacji i statystyk pliku."""
+        return {
+            "id": conv_id,
+            # Nazwa null lub nie-napis nie może zepsuć sortowania listy
+            "name": str(data.get("name") or conv_id),
+            "created_at": data.get("created_at"),
+            "last_modified": data.get("last_modified"),
+            "message_count": data.get("message_count", len(data.get("history", []))),
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+        }
+
+    def update(self, conv_id, data, filepath):
+        """
+        Aktualizuje wpis po zapisie konwersacji, bez ponownego czytania pliku.
+        Indeks nie jest od razu zapisywany na dysk - robi to save() przy
+        zamykaniu lub następny refresh(). Po awarii nieaktualne wpisy zostaną
+        wykryte po mtime i przebudowane.
+        :param data: Słownik, który właśnie został zapisany do pliku.
+        :param filepath: Ścieżka zapisanego pliku (do odczytu mtime/rozmiaru).
+        """
+        with self._lock:
+            try:
+                stat = os.stat(filepath)
+            except OSError as e:
+                print(f"Nie można odczytać statystyk pliku {filepath}: {e}")
+                return
+            self.entries[conv_id] = self._make_entry(conv_id, data, stat)
+            self._dirty = True
+
+    def remove(self, conv_id):
+        """Usuwa wpis konwersacji z indeksu."""
+        with self._lock:
+            if self.entries.pop(conv_id, None) is not None:
+                self._dirty = True
+
+    def get(self, conv_id):
+        """Zwraca wpis konwersacji lub None."""
+        return self.entries.get(conv_id)
+
+    def list(self):
+        """Zwraca wpisy posortowane alfabetycznie po nazwie."""
+        with self._lock:
+            return sorted(self.entries.values(), key=lambda e: e['name'].lower())
@@ -0,0 +1,158 @@
+import bisect
+import tkinter as tk
+
+
+def _sort_key(meta):
+    """Klucz sortowania: nazwa bez rozróżniania wielkości liter, ID rozstrzyga remisy."""
+    return (meta['name'].lower(), meta['id'])
+
+
+class ConversationListModel:
+    """
+    Model listy konwersacji nad tk.Listbox.
+    Trzyma tablicę wiersz -> ID oraz słownik ID -> wiersz, dzięki czemu
+    wyszukanie konwersacji po ID lub po zaznaczonym wierszu nie wymaga
+    przeglądania listy, a konwersacje o tej samej nazwie się nie mylą.
+    Do widżetu trafiają tylko zmiany: wstawienia, zmiany nazw i usunięcia.
+    """
+
+    def __init__(self, listbox, format_label=None):
+        """
+        :param listbox: Widżet tk.Listbox wyświetlający konwersacje.
+        :param format_label: Funkcja meta -> tekst wiersza (domyślnie nazwa).
+        """
+        self.listbox = listbox
+        self.format_label = format_label or (lambda meta: meta['name'])
+        self._ids = []    # wiersz -> ID
+        self._keys = []   # wiersz -> klucz sortowania
+        self._rows = {}   # ID -> wiersz
+        self._meta = {}   # ID -> metadane
+
+    # === Odczyt ===
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, conv_id):
+        return conv_id in self._rows
+
+    def __iter__(self):
+        """Metadane w kolejności wyświetlania."""
+        return (self._meta[conv_id] for conv_id in self._ids)
+
+    def get(self, conv_id):
+        """Zwraca metadane konwersacji lub None."""
+        return self._meta.get(conv_id)
+
+    def row_of(self, conv_id):
+        """Zwraca numer wiersza konwersacji lub None."""
+        return self._rows.get(conv_id)
+
+    def id_at(self, row):
+        """Zwraca ID konwersacji w danym wierszu lub None."""
+        return self._ids[row] if 0 <= row < len(self._ids) else None
+
+    def first_id(self):
+        return self._ids[0] if self._ids else None
+
+    def selected_id(self):
+        """Zwraca ID zaznaczonej konwersacji lub None."""
+        selection = self.listbox.curselection()
+        return self.id_at(selection[0]) if selection else None
+
+    # === Zmiany ===
+    def set_items(self, metas):
+        """Wypełnia listę od zera (jedno wywołanie insert dla całego widżetu)."""
+        metas = sorted((dict(m) for m in metas), key=_sort_key)
+        self._ids = [m['id'] for m in metas]
+        self._keys = [_sort_key(m) for m in metas]
+        self._meta = {m['id']: m for m in metas}
+        self._rows = {conv_id: row for row, conv_id in enumerate(self._ids)}
+        self.listbox.delete(0, tk.END)
+        if metas:
+            self.listbox.insert(tk.END, *(self.format_label(m) for m in metas))
+
+    def sync(self, metas):
+        """
+        Uzgadnia model z pełną listą metadanych, wykonując na widżecie
+        wyłącznie potrzebne wstawienia, zmiany nazw i usunięcia.
+        """
+        if not self._ids:
+            self.set_items(metas)
+            return
+        incoming = {m['id']: m for m in metas}
+        for conv_id in [c for c in self._ids if c not in incoming]:
+            self.remove(conv_id)
+        for meta in incoming.values():
+            old = self._meta.get(meta['id'])
+            if old is None or old.get('name') != meta['name']:
+                self.upsert(meta)
+            else:
+                old.update(meta)
+
+    def upsert(self, meta):
+        """Wstawia konwersację w miejsce wynikające z sortowania albo aktualizuje istniejącą."""
+        meta = dict(meta)
+        conv_id = meta['id']
+        old = self._meta.get(conv_id)
+        if old is not None:
+            merged = dict(old)
+            merged.update(meta)
+            if _sort_key(merged) == _sort_key(old):
+                self._meta[conv_id] = merged
+                self.refresh_label(conv_id)
+                return
+            was_selected = self._is_row_selected(self._rows[conv_id])
+            self.remove(conv_id)
+            meta = merged
+        else:
+            was_selected = False
+
+        key = _sort_key(meta)
+        row = bisect.bisect_left(self._keys, key)
+        self._ids.insert(row, conv_id)
+        self._keys.insert(row, key)
+        self._meta[conv_id] = meta
+        self.listbox.insert(row, self.format_label(meta))
+        self._reindex(row)
+        if was_selected:
+            self.listbox.selection_set(row)
+
+    def remove(self, conv_id):
+        """Usuwa konwersację z modelu i z widżetu."""
+        row = self._rows.pop(conv_id, None)
+        if row is None:
+            return
+        del self._ids[row]
+        del self._keys[row]
+        self._meta.pop(conv_id, None)
+        self.listbox.delete(row)
+        self._reindex(row)
+
+    def refresh_label(self, conv_id):
+        """Przerysowuje tekst jednego wiersza, zachowując zaznaczenie."""
+        row = self._rows.get(conv_id)
+        if row is None:
+            return
+        was_selected = self._is_row_selected(row)
+        self.listbox.delete(row)
+        self.listbox.insert(row, self.format_label(self._meta[conv_id]))
+        if was_selected:
+            self.listbox.selection_set(row)
+
+    def select(self, conv_id):
+        """Zaznacza konwersację w widżecie i przewija do niej (bez przeszukiwania listy)."""
+        self.listbox.selection_clear(0, tk.END)
+        row = self._rows.get(conv_id)
+        if row is not None:
+            self.listbox.selection_set(row)
+            self.listbox.see(row)
+
+    def _is_row_selected(self, row):
+        return bool(self.listbox.selection_includes(row))
+
+    def _reindex(self, start):
+        """Aktualizuje słownik ID -> wiersz od podanego wiersza w dół."""
+        ids = self._ids
+        rows = self._rows
+        for row in range(start, len(ids)):
+            rows[ids[row]] = row
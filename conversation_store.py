@@ -0,0 +1,735 @@
+import os
+import json
+import zlib
+import hashlib
+import threading
+from array import array
+from datetime import datetime
+
+from conversation_index import ConversationIndex
+
+# Tryby zapisu konwersacji
+MODE_JOURNAL = "journal"  # <id>.jsonl - dopisywanie nowych wiadomości na końcu pliku
+MODE_JSON = "json"        # <id>.json - pełny zapis całego pliku (stary format)
+
+JOURNAL_EXT = ".jsonl"
+LEGACY_EXT = ".json"
+OFFSETS_EXT = ".offsets"
+
+# Bit oznaczający w pliku przesunięć rekord nagłówka/meta (a nie wiadomość)
+META_FLAG = 1 << 63
+
+# Pierwsza wartość pliku przesunięć: "OFFS" + wersja formatu
+OFFSETS_MAGIC = 0x4F46465300000002
+
+# Po tylu rekordach "meta" dziennik jest kompaktowany w tle
+COMPACT_META_THRESHOLD = 64
+
+# Rekordy zaczynają się od pola "t", więc rodzaj rekordu można rozpoznać bez parsowania
+MSG_PREFIX = b'{"t": "msg"'
+META_PREFIX = b'{"t": "meta"'
+
+
+def make_record(kind, **fields):
+    """Buduje rekord dziennika z polem "t" na początku."""
+    record = {"t": kind}
+    record.update(fields)
+    return record
+
+
+def message_fingerprint(message):
+    """Zwraca skrót wiadomości, używany do wykrycia edycji historii."""
+    raw = json.dumps(message, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha1(raw).hexdigest()
+
+
+def read_journal(filepath):
+    """
+    Czyta dziennik konwersacji.
+    :return: Krotka (nagłówek, historia, liczba rekordów meta).
+    """
+    header = {}
+    history = []
+    meta_records = 0
+    with open(filepath, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Niedokończony ostatni wiersz (np. po awarii) - pomijamy
+                print(f"Pominięto uszkodzony rekord w {filepath}")
+                continue
+            kind = record.pop("t", None)
+            if kind == "msg":
+                history.append(record["m"])
+                if "at" in record:
+                    header["last_modified"] = record["at"]
+            elif kind == "header":
+                header = record
+            elif kind == "meta":
+                header.update(record)
+                meta_records += 1
+    return header, history, meta_records
+
+
+def read_file_metadata(filepath):
+    """
+    Czyta metadane konwersacji z pliku w dowolnym formacie (dla indeksu).
+    :return: Słownik z polami nagłówka oraz message_count.
+    """
+    if filepath.endswith(JOURNAL_EXT):
+        header, history, _ = read_journal(filepath)
+        data = dict(header)
+        data["message_count"] = len(history)
+        return data
+    with open(filepath, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    data["message_count"] = len(data.pop("history", []))
+    return data
+
+
+def iter_conversation_files(conversations_dir):
+    """
+    Przechodzi po wszystkich konwersacjach w katalogu bez ich modyfikowania
+    (bez migracji starych plików). Gdy istnieją oba formaty, wygrywa dziennik.
+    :return: Generator krotek (id, nagłówek, historia).
+    """
+    found = {}
+    for filename in os.listdir(conversations_dir):
+        conv_id, ext = os.path.splitext(filename)
+        if ext == JOURNAL_EXT or (ext == LEGACY_EXT and conv_id not in found):
+            found[conv_id] = os.path.join(conversations_dir, filename)
+    for conv_id, filepath in sorted(found.items()):
+        try:
+            header, history = _read_conversation_file(filepath)
+        except (json.JSONDecodeError, OSError, UnicodeDecodeError) as e:
+            print(f"Błąd odczytu pliku JSON: {filepath} - {e}")
+            continue
+        header.setdefault("id", conv_id)
+        yield conv_id, header, history
+
+
+def read_conversation(conversations_dir, conv_id):
+    """
+    Wczytuje jedną konwersację bez jej modyfikowania (bez migracji starego pliku) -
+    do czytania z innego procesu niż aplikacja, np. przy eksporcie.
+    :return: Krotka (nagłówek, historia) lub None, jeśli konwersacja nie istnieje.
+    """
+    for ext in (JOURNAL_EXT, LEGACY_EXT):
+        filepath = os.path.join(conversations_dir, conv_id + ext)
+        if os.path.exists(filepath):
+            header, history = _read_conversation_file(filepath)
+            header.setdefault("id", conv_id)
+            return header, history
+    return None
+
+
+def _read_conversation_file(filepath):
+    if filepath.endswith(JOURNAL_EXT):
+        header, history, _ = read_journal(filepath)
+        return header, history
+    with open(filepath, 'r', encoding='utf-8') as f:
+        header = json.load(f)
+    return header, header.pop("history", [])
+
+
+class JournalOffsets:
+    """
+    Przesunięcia (w bajtach) rekordów dziennika, trzymane w pliku <id>.offsets.
+    Plik zaczyna się od OFFSETS_MAGIC, liczby bajtów dziennika objętych tablicą
+    i sumy CRC ostatniego objętego rekordu, dalej jest po jednej wartości na
+    rekord (z ustawionym META_FLAG dla nagłówka i rekordów meta).
+    Dziennik jest tylko dopisywany, więc synchronizacja czyta wyłącznie
+    nieznaną jeszcze końcówkę pliku. Suma CRC wykrywa plik przesunięć
+    zbudowany dla innego dziennika (np. awaria tuż po przepisaniu pliku).
+    """
+
+    def __init__(self, journal_path, offsets_path):
+        self.journal_path = journal_path
+        self.offsets_path = offsets_path
+        self.covered = 0
+        self.messages = array('Q')
+        self.meta = []
+        self._read_sidecar()
+
+    def _read_sidecar(self):
+        raw = array('Q')
+        try:
+            with open(self.offsets_path, 'rb') as f:
+                raw.frombytes(f.read())
+        except (OSError, ValueError):
+            return
+        if len(raw) < 3 or raw[0] != OFFSETS_MAGIC:
+            return  # stary format lub uszkodzony plik - przebudowa od zera
+        messages, meta = array('Q'), []
+        for value in raw[3:]:
+            if value & META_FLAG:
+                meta.append(value & ~META_FLAG)
+            else:
+                messages.append(value)
+        if self._last_record_crc(raw[1], messages, meta) != raw[2]:
+            print(f"Indeks przesunięć {self.offsets_path} nie pasuje do dziennika - zostanie przebudowany")
+            return
+        self.covered = raw[1]
+        self.messages = messages
+        self.meta = meta
+
+    def _last_record_crc(self, covered, messages, meta):
+        """CRC ostatniego rekordu przed bajtem `covered` albo None, jeśli dziennik go nie zawiera."""
+        last = max(messages[-1] if messages else 0, meta[-1] if meta else 0)
+        if not covered:
+            return 0
+        try:
+            with open(self.journal_path, 'rb') as f:
+                f.seek(last)
+                line = f.read(covered - last)
+        except (OSError, ValueError):
+            return None
+        if len(line) != covered - last or not line.endswith(b'\n'):
+            return None
+        return zlib.crc32(line)
+
+    def _write_sidecar(self):
+        crc = self._last_record_crc(self.covered, self.messages, self.meta)
+        if crc is None:
+            return
+        raw = array('Q', [OFFSETS_MAGIC, self.covered, crc])
+        raw.extend(self.messages)
+        raw.extend(offset | META_FLAG for offset in self.meta)
+        tmp_path = self.offsets_path + ".tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                raw.tofile(f)
+            os.replace(tmp_path, self.offsets_path)
+        except OSError as e:
+            print(f"Nie można zapisać indeksu przesunięć {self.offsets_path}: {e}")
+
+    def sync(self):
+        """Dopisuje do tablicy rekordy, które pojawiły się w dzienniku od ostatniego razu."""
+        size = os.path.getsize(self.journal_path)
+        if self.covered > size:
+            # Plik jest krótszy niż tablica - przebudowa od zera
+            self.covered = 0
+            self.messages = array('Q')
+            self.meta = []
+        if self.covered == size:
+            return
+        position = self.covered
+        with open(self.journal_path, 'rb') as f:
+            f.seek(position)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # niedokończony rekord - zostanie doczytany później
+                if line.startswith(MSG_PREFIX):
+                    self.messages.append(position)
+                elif line.strip():
+                    self.meta.append(position)
+                position += len(line)
+        self.covered = position
+        self._write_sidecar()
+
+
+class _ConversationState:
+    """Stan zapisanej konwersacji znany magazynowi (bez ponownego czytania pliku)."""
+
+    def __init__(self, header, count, fingerprints, meta_records):
+        self.header = header
+        self.count = count
+        # Skróty ostatnich len(fingerprints) zapisanych wiadomości (wykrywają edycję historii)
+        self.fingerprints = fingerprints
+        self.meta_records = meta_records
+        self.generation = 0
+
+
+class ConversationStore:
+    """
+    Magazyn konwersacji na plikach.
+    W trybie "journal" każda konwersacja to plik JSONL: rekord nagłówka,
+    małe rekordy "meta" ze zmienionymi polami nagłówka (nazwa, prompt systemowy...)
+    oraz po jednym rekordzie "msg" na wiadomość. Zapis dopisuje tylko nowe
+    wiadomości; pełne przepisanie pliku następuje jedynie po edycji historii
+    albo przy kompaktowaniu w tle. Stare pliki .json są czytane normalnie
+    i przy pierwszym dostępie przenoszone do nowego formatu.
+    """
+
+    def __init__(self, conversations_dir, index_file, mode=MODE_JOURNAL):
+        """
+        :param conversations_dir: Katalog z plikami konwersacji.
+        :param index_file: Ścieżka do pliku indeksu konwersacji.
+        :param mode: MODE_JOURNAL lub MODE_JSON.
+        """
+        self.conversations_dir = conversations_dir
+        self.mode = mode if mode in (MODE_JOURNAL, MODE_JSON) else MODE_JOURNAL
+        self.index = ConversationIndex(
+            index_file,
+            conversations_dir,
+            read_metadata=read_file_metadata,
+            extensions=(JOURNAL_EXT, LEGACY_EXT)
+        )
+        self._states = {}
+        self._offsets = {}
+        # Blokada na konwersację - zapis jednej nie wstrzymuje odczytu innej;
+        # wspólna blokada chroni tylko słownik blokad i zbiór _compacting
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._compacting = set()
+
+    def _conversation_lock(self, conv_id):
+        with self._lock:
+            lock = self._locks.get(conv_id)
+            if lock is None:
+                lock = self._locks[conv_id] = threading.RLock()
+            return lock
+
+    # === Ścieżki ===
+    def journal_path(self, conv_id):
+        return os.path.join(self.conversations_dir, f"{conv_id}{JOURNAL_EXT}")
+
+    def legacy_path(self, conv_id):
+        return os.path.join(self.conversations_dir, f"{conv_id}{LEGACY_EXT}")
+
+    def offsets_path(self, conv_id):
+        return os.path.join(self.conversations_dir, f"{conv_id}{OFFSETS_EXT}")
+
+    # === Lista konwersacji ===
+    def list_conversations(self, refresh=True):
+        """
+        Zwraca metadane wszystkich konwersacji posortowane po nazwie.
+        refresh=True porównuje indeks z plikami na dysku.
+        """
+        return self.index.refresh() if refresh else self.index.list()
+
+    def get_metadata(self, conv_id):
+        """Zwraca wpis indeksu dla konwersacji lub None."""
+        return self.index.get(conv_id)
+
+    # === Odczyt ===
+    def load(self, conv_id):
+        """
+        Wczytuje konwersację.
+        :return: Krotka (nagłówek, historia) lub None, jeśli konwersacja nie istnieje.
+        """
+        with self._conversation_lock(conv_id):
+            journal = self.journal_path(conv_id)
+            if os.path.exists(journal):
+                header, history, meta_records = read_journal(journal)
+                self._remember(conv_id, header, history, meta_records)
+                return dict(header), history
+
+            legacy = self.legacy_path(conv_id)
+            if not os.path.exists(legacy):
+                return None
+            with open(legacy, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            history = data.pop("history", [])
+            header = data
+            header.setdefault("id", conv_id)
+            if self.mode == MODE_JOURNAL:
+                # Przezroczysta migracja do formatu dziennika
+                self._rewrite_journal(conv_id, header, history)
+                os.remove(legacy)
+            else:
+                self._remember(conv_id, header, history, 0)
+            return dict(header), history
+
+    def load_tail(self, conv_id, count):
+        """
+        Wczytuje nagłówek i tylko ostatnie `count` wiadomości konwersacji,
+        korzystając z indeksu przesunięć (bez czytania całego pliku).
+        :return: Krotka (nagłówek, wiadomości, indeks pierwszej wczytanej wiadomości)
+                 lub None, jeśli konwersacja nie istnieje.
+        """
+        with self._conversation_lock(conv_id):
+            if not os.path.exists(self.journal_path(conv_id)):
+                loaded = self.load(conv_id)
+                if loaded is None:
+                    return None
+                if self.mode != MODE_JOURNAL:
+                    # Stary format nie ma indeksu przesunięć - zwracamy całość
+                    return loaded[0], loaded[1], 0
+
+            offsets = self._get_offsets(conv_id)
+            header = self._read_header(conv_id, offsets)
+            total = len(offsets.messages)
+            start = max(0, total - count)
+            messages = self._read_messages(conv_id, offsets, start, total)
+            self._remember_state(conv_id, header, total, messages, max(0, len(offsets.meta) - 1))
+            return dict(header), messages, start
+
+    def load_range(self, conv_id, start, end):
+        """Wczytuje wiadomości o indeksach [start, end)."""
+        with self._conversation_lock(conv_id):
+            if not os.path.exists(self.journal_path(conv_id)):
+                loaded = self.load(conv_id)
+                if loaded is None:
+                    return []
+                if self.mode != MODE_JOURNAL:
+                    return loaded[1][start:end]
+            offsets = self._get_offsets(conv_id)
+            return self._read_messages(conv_id, offsets, start, min(end, len(offsets.messages)))
+
+    def message_count(self, conv_id):
+        """Zwraca liczbę wiadomości w konwersacji."""
+        with self._conversation_lock(conv_id):
+            state = self._states.get(conv_id)
+            if state is not None:
+                return state.count
+            if os.path.exists(self.journal_path(conv_id)):
+                return len(self._get_offsets(conv_id).messages)
+            loaded = self.load(conv_id)
+            return len(loaded[1]) if loaded else 0
+
+    def _get_offsets(self, conv_id):
+        offsets = self._offsets.get(conv_id)
+        if offsets is None:
+            offsets = JournalOffsets(self.journal_path(conv_id), self.offsets_path(conv_id))
+            self._offsets[conv_id] = offsets
+        offsets.sync()
+        return offsets
+
+    def _drop_offsets(self, conv_id):
+        """Unieważnia indeks przesunięć po przepisaniu dziennika."""
+        self._offsets.pop(conv_id, None)
+        path = self.offsets_path(conv_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _read_header(self, conv_id, offsets):
+        """
+        Składa nagłówek z rekordu header i kolejnych rekordów meta. Czas ostatniego
+        dopisania wiadomości jest w polu "at" ostatniego rekordu msg.
+        """
+        header = {}
+        with open(self.journal_path(conv_id), 'rb') as f:
+            for offset in offsets.meta:
+                f.seek(offset)
+                record = json.loads(f.readline())
+                kind = record.pop("t", None)
+                if kind == "header":
+                    header = record
+                elif kind == "meta":
+                    header.update(record)
+            if offsets.messages:
+                f.seek(offsets.messages[-1])
+                at = json.loads(f.readline()).get("at")
+                if at and at > header.get("last_modified", ""):
+                    header["last_modified"] = at
+        return header
+
+    def _read_messages(self, conv_id, offsets, start, end):
+        messages = []
+        if start >= end:
+            return messages
+        with open(self.journal_path(conv_id), 'rb') as f:
+            for offset in offsets.messages[start:end]:
+                f.seek(offset)
+                messages.append(json.loads(f.readline())["m"])
+        return messages
+
+    def _remember(self, conv_id, header, history, meta_records):
+        self._remember_state(conv_id, header, len(history), history, meta_records)
+
+    def _remember_state(self, conv_id, header, count, tail, meta_records):
+        """:param tail: Ostatnie wiadomości konwersacji (wszystkie lub wczytana końcówka)."""
+        fingerprints = [message_fingerprint(m) for m in tail]
+        state = self._states.get(conv_id)
+        generation = state.generation if state else 0
+        self._states[conv_id] = _ConversationState(dict(header), count, fingerprints, meta_records)
+        self._states[conv_id].generation = generation
+
+    def _get_state(self, conv_id):
+        """Zwraca znany stan konwersacji, w razie potrzeby czytając ją raz z dysku."""
+        state = self._states.get(conv_id)
+        if state is None and self.load(conv_id) is not None:
+            state = self._states.get(conv_id)
+        return state
+
+    # === Zapis ===
+    def create(self, conv_id, header):
+        """Tworzy nową, pustą konwersację z podanym nagłówkiem."""
+        now = datetime.now().isoformat()
+        header = dict(header)
+        header["id"] = conv_id
+        header.setdefault("created_at", now)
+        header["last_modified"] = now
+        with self._conversation_lock(conv_id):
+            self._write_full(conv_id, header, [])
+
+    def save(self, conv_id, header, history, start=0):
+        """
+        Zapisuje konwersację. Jeśli zapisany stan jest prefiksem historii,
+        dopisywane są tylko nowe wiadomości i zmienione pola nagłówka.
+        :param header: Pola nagłówka do ustawienia (np. name, system_prompt).
+        :param history: Historia wiadomości od indeksu `start` do końca.
+        :param start: Liczba starszych wiadomości, których nie ma w `history`
+                      (przy historii wczytanej stronami przez load_tail).
+        """
+        with self._conversation_lock(conv_id):
+            state = self._get_state(conv_id)
+            new_header = dict(state.header) if state else {"id": conv_id}
+            new_header.update(header)
+            new_header["id"] = conv_id
+            new_header.setdefault("created_at", datetime.now().isoformat())
+            new_header["last_modified"] = datetime.now().isoformat()
+
+            if (self.mode != MODE_JOURNAL or state is None
+                    or not os.path.exists(self.journal_path(conv_id))
+                    or not self._journal_intact(conv_id)
+                    or not self._is_prefix(state, history, start)):
+                if start > 0:
+                    history = self.load_range(conv_id, 0, start) + list(history)
+                self._write_full(conv_id, new_header, history)
+                return
+
+            self._append_to_journal(conv_id, state, new_header, history[state.count - start:])
+
+    def save_batch(self, conversations):
+        """
+        Zapisuje wiele całych konwersacji (np. przy imporcie). Indeks jest
+        zapisywany jak zawsze przy close() - po awarii refresh() odczyta nowe pliki.
+        :param conversations: Lista krotek (id, nagłówek, historia).
+        """
+        for conv_id, header, history in conversations:
+            with self._conversation_lock(conv_id):
+                self.save(conv_id, header, history)
+                # Skróty wiadomości nie są potrzebne, dopóki konwersacja nie zostanie otwarta
+                with self._lock:
+                    compacting = conv_id in self._compacting
+                if not compacting:
+                    self._states.pop(conv_id, None)
+
+    def append(self, conv_id, messages, header=None):
+        """
+        Dopisuje wiadomości na końcu zapisanej konwersacji i ewentualnie zmienia
+        pola nagłówka - bez podawania jej historii (np. odpowiedź modelu dla
+        konwersacji, która nie jest otwarta w oknie).
+        """
+        with self._conversation_lock(conv_id):
+            state = self._get_state(conv_id)
+            if state is None:
+                raise KeyError(f"Konwersacja {conv_id} nie istnieje")
+            new_header = dict(state.header)
+            new_header.update(header or {})
+            new_header["id"] = conv_id
+            new_header["last_modified"] = datetime.now().isoformat()
+
+            if self.mode != MODE_JOURNAL or not os.path.exists(self.journal_path(conv_id)):
+                _, history = self.load(conv_id)
+                self._write_full(conv_id, new_header, history + list(messages))
+                return
+            if not self._journal_intact(conv_id):
+                # Bez pełnej historii nie da się przepisać pliku - obcinamy urwany rekord
+                state = self._repair_tail(conv_id)
+            self._append_to_journal(conv_id, state, new_header, list(messages))
+
+    def _append_to_journal(self, conv_id, state, new_header, new_messages):
+        """
+        Dopisuje do dziennika nowe wiadomości i zmienione pola nagłówka.
+        Sam last_modified nie tworzy rekordu meta (liczonego do kompaktowania) -
+        przy dopisaniu wiadomości trafia do pola "at" ostatniej z nich.
+        """
+        changed = {k: v for k, v in new_header.items()
+                   if k != "last_modified" and state.header.get(k) != v}
+        records = [make_record("msg", m=m) for m in new_messages]
+        if records:
+            records[-1]["at"] = new_header["last_modified"]
+        if changed:
+            changed["last_modified"] = new_header["last_modified"]
+            records.append(make_record("meta", **changed))
+        if not records:
+            return
+        self._append_records(conv_id, records)
+
+        state.header = new_header
+        state.count += len(new_messages)
+        state.fingerprints.extend(message_fingerprint(m) for m in new_messages)
+        if changed:
+            state.meta_records += 1
+        self._update_index(conv_id, new_header, state.count)
+
+        if state.meta_records >= COMPACT_META_THRESHOLD:
+            self.compact_in_background(conv_id)
+
+    @staticmethod
+    def _is_prefix(state, history, start=0):
+        """
+        Sprawdza, czy zapisana część historii nie została zmieniona (również
+        w środku - porównywany jest skrót każdej wczytanej zapisanej wiadomości).
+        Wiadomości sprzed `start` nie są w pamięci, więc nie mogły się zmienić.
+        """
+        if start + len(history) < state.count:
+            return False
+        known = state.count - len(state.fingerprints)
+        if start < known:
+            # Wczytano starsze wiadomości, których skrótów nie znamy - nie da się tego sprawdzić
+            return False
+        return all(
+            message_fingerprint(history[i - start]) == state.fingerprints[i - known]
+            for i in range(start, state.count)
+        )
+
+    def _journal_intact(self, conv_id):
+        """Sprawdza, czy dziennik kończy się pełnym rekordem (a nie urwanym po awarii)."""
+        with open(self.journal_path(conv_id), 'rb') as f:
+            if f.seek(0, os.SEEK_END) == 0:
+                return True
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def _repair_tail(self, conv_id):
+        """
+        Obcina dziennik do ostatniego pełnego rekordu, żeby dopisywany rekord
+        nie skleił się z urwanym. Zwraca stan odczytany na nowo z pliku.
+        """
+        journal = self.journal_path(conv_id)
+        with open(journal, 'rb+') as f:
+            end = f.seek(0, os.SEEK_END)
+            while end > 0:
+                step = min(end, 65536)
+                f.seek(end - step)
+                newline = f.read(step).rfind(b'\n')
+                if newline >= 0:
+                    end = end - step + newline + 1
+                    break
+                end -= step
+            f.truncate(end)
+        print(f"Obcięto niedokończony rekord w {journal}")
+        self._drop_offsets(conv_id)
+        header, history, meta_records = read_journal(journal)
+        self._remember(conv_id, header, history, meta_records)
+        state = self._states[conv_id]
+        state.generation += 1
+        return state
+
+    def _append_records(self, conv_id, records):
+        if not records:
+            return
+        lines = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+        # newline='\n' - przesunięcia w pliku .offsets muszą być takie same na każdym systemie
+        with open(self.journal_path(conv_id), 'a', encoding='utf-8', newline='\n') as f:
+            f.write(lines)
+
+    def _write_full(self, conv_id, header, history):
+        """Zapisuje całą konwersację w bieżącym trybie (atomowo)."""
+        if self.mode == MODE_JOURNAL:
+            self._rewrite_journal(conv_id, header, history)
+            legacy = self.legacy_path(conv_id)
+            if os.path.exists(legacy):
+                os.remove(legacy)
+        else:
+            data = dict(header)
+            data["history"] = history
+            legacy = self.legacy_path(conv_id)
+            tmp_path = legacy + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, legacy)
+            journal = self.journal_path(conv_id)
+            if os.path.exists(journal):
+                os.remove(journal)
+                self._drop_offsets(conv_id)
+            self._remember(conv_id, header, history, 0)
+            self._states[conv_id].generation += 1
+            self._update_index(conv_id, header, len(history))
+
+    def _rewrite_journal(self, conv_id, header, history):
+        """Przepisuje dziennik od zera: jeden nagłówek i wszystkie wiadomości."""
+        journal = self.journal_path(conv_id)
+        tmp_path = journal + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8', newline='\n') as f:
+            f.write(json.dumps(make_record("header", **header), ensure_ascii=False) + "\n")
+            for message in history:
+                f.write(json.dumps(make_record("msg", m=message), ensure_ascii=False) + "\n")
+        os.replace(tmp_path, journal)
+        self._drop_offsets(conv_id)
+        self._remember(conv_id, header, history, 0)
+        self._states[conv_id].generation += 1
+        self._update_index(conv_id, header, len(history))
+
+    def _update_index(self, conv_id, header, message_count):
+        path = self.journal_path(conv_id) if self.mode == MODE_JOURNAL else self.legacy_path(conv_id)
+        data = dict(header)
+        data["message_count"] = message_count
+        self.index.update(conv_id, data, path)
+
+    # === Kompaktowanie ===
+    def compact_in_background(self, conv_id):
+        """Uruchamia kompaktowanie dziennika w osobnym wątku (jeśli jeszcze nie trwa)."""
+        with self._lock:
+            if conv_id in self._compacting:
+                return
+            self._compacting.add(conv_id)
+        threading.Thread(target=self._compact, args=(conv_id,), daemon=True).start()
+
+    def _compact(self, conv_id):
+        """
+        Scala rekordy meta w jeden nagłówek. Plik jest czytany bez blokady
+        (do rozmiaru z chwili startu), a rekordy dopisane w międzyczasie
+        są przenoszone na koniec nowego pliku przed podmianą.
+        """
+        try:
+            with self._conversation_lock(conv_id):
+                state = self._states.get(conv_id)
+                journal = self.journal_path(conv_id)
+                if state is None or not os.path.exists(journal):
+                    return
+                snapshot_size = os.path.getsize(journal)
+                snapshot_header = dict(state.header)
+                generation = state.generation
+
+            tmp_path = journal + ".compact"
+            with open(journal, 'rb') as src, open(tmp_path, 'wb') as dst:
+                dst.write((json.dumps(make_record("header", **snapshot_header), ensure_ascii=False) + "\n").encode('utf-8'))
+                while src.tell() < snapshot_size:
+                    line = src.readline()
+                    if not line:
+                        break
+                    if line.startswith(MSG_PREFIX):
+                        dst.write(line)
+
+            with self._conversation_lock(conv_id):
+                state = self._states.get(conv_id)
+                if state is None or state.generation != generation or not os.path.exists(journal):
+                    os.remove(tmp_path)
+                    return
+                tail_meta = 0
+                with open(journal, 'rb') as src, open(tmp_path, 'ab') as dst:
+                    src.seek(snapshot_size)
+                    for line in src:
+                        if line.startswith(META_PREFIX):
+                            tail_meta += 1
+                        dst.write(line)
+                os.replace(tmp_path, journal)
+                self._drop_offsets(conv_id)
+                state.meta_records = tail_meta
+                state.generation += 1
+                self._update_index(conv_id, state.header, state.count)
+        except OSError as e:
+            print(f"Błąd kompaktowania konwersacji {conv_id}: {e}")
+        finally:
+            with self._lock:
+                self._compacting.discard(conv_id)
+
+    # === Usuwanie ===
+    def delete(self, conv_id):
+        """
+        Usuwa wszystkie pliki konwersacji.
+        :return: True, jeśli konwersacja istniała.
+        """
+        with self._conversation_lock(conv_id):
+            existed = False
+            for path in (self.journal_path(conv_id), self.legacy_path(conv_id)):
+                if os.path.exists(path):
+                    os.remove(path)
+                    existed = True
+            self._states.pop(conv_id, None)
+            self._drop_offsets(conv_id)
+            self.index.remove(conv_id)
+            return existed
+
+    def close(self):
+        """Zapisuje indeks na dysk (wywoływane przy zamykaniu aplikacji)."""
+        self.index.save()
@@ -0,0 +1,327 @@
+import io
+import os
+import re
+import json
+import time
+import html
+import base64
+import struct
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from context_builder import message_text
+from conversation_store import read_conversation
+from latex_cache import make_key, read_cached_png
+from sqlite_store import SQLiteConversationStore
+from streaming import split_message_text
+
+SENDER_NAMES = {"user": "Ty", "model": "Gemini"}
+
+# Konwersacje przekazywane do jednego zadania puli przy eksporcie zbiorczym
+EXPORT_CHUNK = 16
+
+
+class Exporter:
+    """
+    Zapis konwersacji do pliku tekstowego wiadomość po wiadomości - nic poza
+    bieżącą wiadomością nie jest składane w pamięci. Podklasy nadpisują
+    begin / message / end.
+    """
+
+    extension = ".txt"
+    title = "Pliki tekstowe"
+
+    def write(self, f, header, messages):
+        """
+        :param f: Plik tekstowy otwarty do zapisu.
+        :param header: Nagłówek konwersacji (name, system_prompt...).
+        :param messages: Iterowalna historia (może być generatorem).
+        """
+        self.begin(f, header)
+        for seq, message in enumerate(messages):
+            self.message(f, seq, message)
+        self.end(f)
+
+    def begin(self, f, header):
+        f.write(f"Prompt systemowy: {header.get('system_prompt', '')}\n\n")
+
+    def message(self, f, seq, message):
+        f.write(f"{message.get('role', '').capitalize()}: {message_text(message)}\n\n")
+
+    def end(self, f):
+        pass
+
+
+class MarkdownExporter(Exporter):
+    extension = ".md"
+    title = "Markdown"
+
+    def begin(self, f, header):
+        f.write(f"# {header.get('name') or header.get('id', 'Konwersacja')}\n\n")
+        if header.get("system_prompt"):
+            f.write("> " + header["system_prompt"].replace("\n", "\n> ") + "\n\n")
+
+    def message(self, f, seq, message):
+        sender = SENDER_NAMES.get(message.get("role"), message.get("role", ""))
+        f.write(f"### {sender}\n\n{message_text(message)}\n\n")
+
+
+class JsonlExporter(Exporter):
+    """Pierwsza linia: {"header": ...}, następne - wiadomości w postaci z historii."""
+
+    extension = ".jsonl"
+    title = "JSON Lines"
+
+    def begin(self, f, header):
+        f.write(json.dumps({"header": header}, ensure_ascii=False) + "\n")
+
+    def message(self, f, seq, message):
+        f.write(json.dumps(message, ensure_ascii=False) + "\n")
+
+
+HTML_HEAD = """<!DOCTYPE html>
+<html lang="pl">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: Arial, sans-serif; max-width: 50em; margin: 2em auto; padding: 0 1em;
+       color: #1e1e1e; background: #fafafa; line-height: 1.5; }}
+@media (prefers-color-scheme: dark) {{ body {{ color: #e6e6e6; background: #1e1e1e; }} }}
+.system {{ opacity: .7; font-style: italic; white-space: pre-wrap; }}
+.message {{ margin: 1.2em 0; }}
+.sender {{ font-weight: bold; }}
+.user .sender {{ color: #2b6cb0; }}
+.model .sender {{ color: #2f855a; }}
+.text {{ white-space: pre-wrap; }}
+.math {{ display: inline-block; vertical-align: middle; background: currentColor;
+         -webkit-mask-image: var(--tex); mask-image: var(--tex);
+         -webkit-mask-size: 100% 100%; mask-size: 100% 100%; mask-mode: luminance; }}
+.math-block {{ text-align: center; margin: .5em 0; }}
+code.tex {{ font-family: monospace; }}
+</style>
+</head>
+<body>
+"""
+
+
+class HtmlExporter(Exporter):
+    """
+    Samodzielny plik HTML. Wzory LaTeX są wstawiane jako obrazy z pamięci
+    podręcznej wzorów (maski alfa w kolorze tekstu strony, więc pasują do
+    jasnego i ciemnego motywu); każdy wzór jest osadzany w pliku raz.
+    Wzory, których nie ma w cache, zostają w postaci tekstu TeX.
+    """
+
+    extension = ".html"
+    title = "Strona HTML"
+
+    def __init__(self, latex_dir=None, dpi=300, max_images=2000):
+        """
+        :param latex_dir: Katalog cache wzorów (LatexImageCache) lub None - wzory jako tekst.
+        :param dpi: Rozdzielczość, w jakiej aplikacja renderuje wzory (część klucza cache).
+        :param max_images: Ile wczytanych obrazów pamiętać między konwersacjami.
+        """
+        self.latex_dir = latex_dir
+        self.dpi = dpi
+        self.max_images = max_images
+        self._images = {}    # klucz -> (PNG w base64, szerokość, wysokość) lub None
+        self._embedded = set()
+
+    def begin(self, f, header):
+        self._embedded = set()
+        title = html.escape(header.get("name") or header.get("id", "Konwersacja"))
+        f.write(HTML_HEAD.format(title=title))
+        f.write(f"<h1>{title}</h1>\n")
+        if header.get("system_prompt"):
+            f.write(f'<p class="system">{html.escape(header["system_prompt"])}</p>\n')
+
+    def message(self, f, seq, message):
+        role = message.get("role", "")
+        sender = html.escape(SENDER_NAMES.get(role, role))
+        f.write(f'<div class="message {html.escape(role)}" id="msg-{seq}">'
+                f'<div class="sender">{sender}</div><div class="text">')
+        for segment in split_message_text(message_text(message)):
+            if segment[0] == 'text':
+                f.write(html.escape(segment[1]))
+            else:
+                self._write_math(f, segment[1], segment[2])
+        f.write("</div></div>\n")
+
+    def end(self, f):
+        f.write("</body>\n</html>\n")
+
+    def _write_math(self, f, expression, block_mode):
+        key = make_key(expression, block_mode, self.dpi)
+        image = self._image(key)
+        if image is None:
+            tex = html.escape(f"$${expression}$$" if block_mode else f"${expression}$")
+            f.write(f'<div class="math-block"><code class="tex">{tex}</code></div>' if block_mode
+                    else f'<code class="tex">{tex}</code>')
+            return
+        data, width, height = image
+        css_class = f"m{key[:16]}"
+        if css_class not in self._embedded:
+            # Obraz trafia do pliku tylko przy pierwszym wystąpieniu wzoru
+            self._embedded.add(css_class)
+            f.write(f"<style>.{css_class} {{ --tex: url(data:image/png;base64,{data}); }}</style>")
+        # Obraz ma rozdzielczość renderowania - na stronie ma rozmiar jak tekst (96 px na cal)
+        span = (f'<span class="math {css_class}" role="img" aria-label="{html.escape(expression)}" '
+                f'style="width: {width * 96 / self.dpi:.1f}px; height: {height * 96 / self.dpi:.1f}px"></span>')
+        f.write(f'<div class="math-block">{span}</div>' if block_mode else span)
+
+    def _image(self, key):
+        if key in self._images:
+            return self._images[key]
+        image = None
+        png = read_cached_png(self.latex_dir, key) if self.latex_dir else None
+        if png is not None and png[:8] == b"\x89PNG\r\n\x1a\n":
+            # Wymiary z nagłówka IHDR - bez dekodowania obrazu
+            width, height = struct.unpack(">II", png[16:24])
+            image = (base64.b64encode(png).decode('ascii'), width, height)
+        if len(self._images) >= self.max_images:
+            self._images.clear()
+        self._images[key] = image
+        return image
+
+
+EXPORTERS = {
+    "txt": Exporter,
+    "md": MarkdownExporter,
+    "html": HtmlExporter,
+    "jsonl": JsonlExporter,
+}
+
+
+def make_exporter(fmt, latex_dir=None, dpi=300):
+    """Exporter dla formatu ("txt", "md", "html", "jsonl")."""
+    if fmt == "html":
+        return HtmlExporter(latex_dir, dpi)
+    return EXPORTERS[fmt]()
+
+
+def format_for_path(path, default="txt"):
+    """Format eksportu na podstawie rozszerzenia pliku."""
+    ext = os.path.splitext(path)[1].lower().lstrip(".")
+    ext = {"markdown": "md", "htm": "html"}.get(ext, ext)
+    return ext if ext in EXPORTERS else default
+
+
+def export_conversation(path, header, messages, fmt="txt", latex_dir=None, dpi=300):
+    """Zapisuje jedną konwersację do pliku (przez plik tymczasowy - przerwany eksport nie zostawia połowy)."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8', newline='\n') as f:
+        make_exporter(fmt, latex_dir, dpi).write(f, header, messages)
+    os.replace(tmp_path, path)
+
+
+# === Eksport zbiorczy ===
+def archive_name(conv_id, name, extension):
+    """Nazwa pliku konwersacji w archiwum: bezpieczna nazwa + początek ID (nazwy mogą się powtarzać)."""
+    safe = re.sub(r'[^\w\- ]+', '_', name or "").strip()[:60] or "konwersacja"
+    return f"{safe}_{conv_id[:8]}{extension}"
+
+
+# Źródło konwersacji w procesie roboczym (ustawiane przez _init_worker)
+_worker_load = None
+
+
+def _open_source(source):
+    """
+    Funkcja conv_id -> (nagłówek, historia) dla źródła ("files", conversations_dir)
+    albo ("sqlite", db_path). Pliki są czytane bez modyfikowania (bez migracji).
+    """
+    kind, path = source
+    if kind == "sqlite":
+        return SQLiteConversationStore(path).load
+    return lambda conv_id: read_conversation(path, conv_id)
+
+
+def _init_worker(source):
+    global _worker_load
+    _worker_load = _open_source(source)
+
+
+def _export_chunk(entries, fmt, latex_dir, dpi):
+    """Zadanie puli: eksportuje kilka konwersacji. Zwraca listę (nazwa w archiwum, bajty, błąd)."""
+    exporter = make_exporter(fmt, latex_dir, dpi)
+    results = []
+    for conv_id, name in entries:
+        try:
+            loaded = _worker_load(conv_id)
+            if loaded is None:
+                raise LookupError(f"konwersacja {conv_id} nie istnieje")
+            header, history = loaded
+            header.setdefault("name", name)
+            buffer = io.BytesIO()
+            text = io.TextIOWrapper(buffer, encoding='utf-8', newline='\n', write_through=True)
+            exporter.write(text, header, history)
+            text.flush()
+            results.append((archive_name(conv_id, name, exporter.extension), buffer.getvalue(), None))
+            text.detach()
+        except Exception as e:
+            results.append((None, None, f"{conv_id}: {e}"))
+    return results
+
+
+def _make_pool(workers, source):
+    try:
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(source,))
+    except (OSError, NotImplementedError, ImportError) as e:
+        print(f"Pula procesów eksportu niedostępna, eksport w wątkach: {e}")
+        return ThreadPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(source,))
+
+
+def export_all(source, conversations, zip_path, fmt="md", latex_dir=None, dpi=300, workers=None,
+               progress=None, cancelled=None):
+    """
+    Eksportuje wiele konwersacji do jednego archiwum ZIP. Konwersacje są
+    wczytywane i zamieniane na tekst w puli procesów (po EXPORT_CHUNK na
+    zadanie), a bieżący wątek tylko dopisuje gotowe pliki do archiwum.
+    W toku jest najwyżej kilka zadań na proces, więc pamięć nie rośnie
+    z liczbą konwersacji.
+    :param source: ("files", conversations_dir) albo ("sqlite", db_path).
+    :param conversations: Lista par (ID, nazwa).
+    :param progress: Opcjonalna funkcja progress(wyeksportowane, wszystkie).
+    :param cancelled: Opcjonalna funkcja - True przerywa eksport (archiwum nie powstaje).
+    :return: Słownik {"exported", "errors" (lista opisów), "seconds"} albo None po przerwaniu.
+    """
+    started = time.perf_counter()
+    workers = workers or min(8, os.cpu_count() or 2)
+    conversations = list(conversations)
+    chunks = deque(conversations[i:i + EXPORT_CHUNK] for i in range(0, len(conversations), EXPORT_CHUNK))
+    tmp_path = zip_path + ".tmp"
+    exported, errors = 0, []
+    pool = _make_pool(workers, source)
+    try:
+        # Najszybszy poziom kompresji: archiwum o ~15% większe, kompresja ponad 2x szybsza
+        # (to ona, a nie pula, ogranicza tempo eksportu)
+        with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+            pending = deque()
+            while chunks or pending:
+                while chunks and len(pending) < workers * 2:
+                    pending.append(pool.submit(_export_chunk, chunks.popleft(), fmt, latex_dir, dpi))
+                for name, data, error in pending.popleft().result():
+                    if error is not None:
+                        errors.append(error)
+                        continue
+                    archive.writestr(name, data)
+                    exported += 1
+                if progress:
+                    progress(exported + len(errors), len(conversations))
+                if cancelled is not None and cancelled():
+                    for future in pending:
+                        future.cancel()
+                    break
+        if cancelled is not None and cancelled():
+            os.remove(tmp_path)
+            return None
+        os.replace(tmp_path, zip_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    return {"exported": exported, "errors": errors, "seconds": time.perf_counter() - started}
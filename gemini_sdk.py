@@ -0,0 +1,24 @@
+import threading
+
+# Import google.generativeai trwa ok. sekundy (grpc, protobuf) - nie robimy go przy starcie
+_lock = threading.Lock()
+_modules = None
+
+
+def load():
+    """
+    Importuje SDK Gemini przy pierwszym wywołaniu (z dowolnego wątku).
+    :return: Krotka (google.generativeai, google.api_core.retry).
+    """
+    global _modules
+    with _lock:
+        if _modules is None:
+            import google.generativeai as genai
+            from google.api_core import retry
+            _modules = (genai, retry)
+        return _modules
+
+
+def is_loaded():
+    """Czy SDK zostało już zaimportowane."""
+    return _modules is not None
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Import konwersacji z archiwów innych narzędzi do danych aplikacji.
+
+Obsługiwane źródła:
+  - eksport ChatGPT (conversations.json albo całe archiwum .zip),
+  - eksport Claude (conversations.json albo .zip),
+  - ogólna lista konwersacji [{"title", "messages": [{"role", "content"}]}],
+  - pliki samej aplikacji (stary format .json z "history", eksport .jsonl).
+
+Archiwum jest czytane przyrostowo - w pamięci jest tylko bieżąca konwersacja
+i jedna partia do zapisu - więc rozmiar pliku nie ma znaczenia. Konwersacje
+trafiają do magazynu partiami (ConversationStore / SQLiteConversationStore).
+Identyfikator konwersacji to skrót jej treści, więc ponowny import tego
+samego archiwum niczego nie powtarza.
+
+Przykład:
+    python importer.py chatgpt-export.zip
+    python importer.py conversations.json --data-dir ~/gemini-chat
+"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import hashlib
+import zipfile
+import argparse
+from datetime import datetime
+
+from context_builder import message_text, with_token_count
+
+# Konwersacje zapisywane do magazynu naraz
+IMPORT_BATCH = 200
+
+# Początkowy rozmiar czytanego kawałka (znaki) i największy dopuszczalny element tablicy
+READ_CHUNK = 1 << 20
+MAX_ELEMENT_CHARS = 256 * 1024 * 1024
+
+ROLES = {"user": "user", "human": "user", "assistant": "model", "model": "model", "bot": "model"}
+
+_ARRAY_GAP = re.compile(r"[\s,]*")
+_WHITESPACE = re.compile(r"\s*")
+_SCALAR = re.compile(r"[^\s,\]}]*")
+
+
+def iter_json_array(f, chunk_size=READ_CHUNK):
+    """
+    Zwraca kolejne elementy tablicy JSON z pliku tekstowego, czytając go kawałkami -
+    w pamięci jest tylko bieżący element i reszta ostatniego kawałka.
+    Plik z pojedynczym obiektem (nie tablicą) daje ten jeden obiekt.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+    read_size = chunk_size
+
+    def read_more():
+        nonlocal buffer, pos, eof
+        chunk = f.read(read_size)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def skip(pattern):
+        nonlocal pos
+        while True:
+            pos = pattern.match(buffer, pos).end()
+            if pos < len(buffer) or eof:
+                return
+            read_more()
+
+    skip(_WHITESPACE)
+    if pos >= len(buffer):
+        return
+    array = buffer[pos] == "["
+    if array:
+        pos += 1
+    while True:
+        skip(_ARRAY_GAP if array else _WHITESPACE)
+        if pos >= len(buffer):
+            if array:
+                raise ValueError("Niedomknięta tablica JSON")
+            return
+        if array and buffer[pos] == "]":
+            return
+        if buffer[pos] not in '{["' and _SCALAR.match(buffer, pos).end() == len(buffer) and not eof:
+            # Liczba lub literał na końcu bufora mogły zostać ucięte
+            read_more()
+            continue
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            if len(buffer) - pos > MAX_ELEMENT_CHARS:
+                raise ValueError("Element archiwum jest za duży lub plik jest uszkodzony")
+            # Element nie mieści się w buforze - czytaj coraz większe kawałki
+            read_size = min(read_size * 2, MAX_ELEMENT_CHARS)
+            read_more()
+            continue
+        pos = end
+        read_size = chunk_size
+        yield value
+        if not array:
+            return
+
+
+def iter_jsonl(f):
+    """
+    Konwersacje z pliku JSONL: jedna konwersacja w linii albo eksport aplikacji
+    (linia {"header": ...}, a po niej wiadomości).
+    """
+    current = None
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        item = json.loads(line)
+        if isinstance(item, dict) and isinstance(item.get("header"), dict):
+            if current is not None:
+                yield current
+            current = dict(item["header"], history=[])
+        elif current is not None and isinstance(item, dict) and "role" in item and "parts" in item:
+            current["history"].append(item)
+        else:
+            if current is not None:
+                yield current
+                current = None
+            yield item
+    if current is not None:
+        yield current
+
+
+def iter_archive(path):
+    """Surowe konwersacje z pliku .json / .jsonl, archiwum .zip albo katalogu z takimi plikami."""
+    if os.path.isdir(path):
+        for root, _, files in os.walk(path):
+            for name in sorted(files):
+                if name.lower().endswith((".json", ".jsonl", ".zip")):
+                    yield from iter_archive(os.path.join(root, name))
+        return
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.namelist():
+                if not member.lower().endswith((".json", ".jsonl")):
+                    continue
+                with archive.open(member) as raw:
+                    f = io.TextIOWrapper(raw, encoding="utf-8-sig")
+                    yield from _iter_file(f, member)
+        return
+    with open(path, "r", encoding="utf-8-sig") as f:
+        yield from _iter_file(f, path)
+
+
+def _iter_file(f, name):
+    if name.lower().endswith(".jsonl"):
+        return iter_jsonl(f)
+    return iter_json_array(f)
+
+
+# === Mapowanie na format historii aplikacji ===
+def make_message(role, text):
+    """Wiadomość w formacie aplikacji albo None (inna rola, pusty tekst)."""
+    role = ROLES.get(role)
+    if role is None or not isinstance(text, str) or not text.strip():
+        return None
+    return {"role": role, "parts": [{"text": text}]}
+
+
+def _timestamp(value):
+    """Czas z archiwum (sekundy epoki albo ISO) jako ISO albo None."""
+    if isinstance(value, (int, float)):
+        try:
+            return datetime.fromtimestamp(value).isoformat()
+        except (OverflowError, OSError, ValueError):
+            return None
+    return value if isinstance(value, str) and value else None
+
+
+def _content_text(content):
+    """Tekst z pola treści: napis, lista części albo {"parts": [...]} / {"text": ...}."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, dict):
+        if "parts" in content:
+            return _content_text(content["parts"])
+        return content.get("text") if isinstance(content.get("text"), str) else ""
+    if isinstance(content, list):
+        texts = []
+        for part in content:
+            if isinstance(part, str):
+                texts.append(part)
+            elif isinstance(part, dict) and part.get("type", "text") == "text" and isinstance(part.get("text"), str):
+                texts.append(part["text"])
+        return "\n".join(texts)
+    return ""
+
+
+def convert_chatgpt(item):
+    """Eksport ChatGPT: gałąź drzewa `mapping` kończąca się na `current_node`."""
+    mapping = item.get("mapping") or {}
+    node_id = item.get("current_node")
+    if node_id not in mapping:
+        # Brak bieżącego węzła - ostatni liść idąc od korzenia po pierwszych dzieciach
+        node_id = next((k for k, v in mapping.items() if not v.get("parent")), None)
+        while node_id in mapping and mapping[node_id].get("children"):
+            node_id = mapping[node_id]["children"][0]
+    chain = []
+    while node_id in mapping and len(chain) <= len(mapping):
+        node = mapping[node_id]
+        chain.append(node.get("message"))
+        node_id = node.get("parent")
+    history = []
+    for message in reversed(chain):
+        if not message:
+            continue
+        if (message.get("metadata") or {}).get("is_visually_hidden_from_conversation"):
+            continue
+        entry = make_message((message.get("author") or {}).get("role"), _content_text(message.get("content")))
+        if entry:
+            history.append(entry)
+    return item.get("title"), _timestamp(item.get("create_time")), history
+
+
+def convert_claude(item):
+    """Eksport Claude: lista `chat_messages` z nadawcą human / assistant."""
+    history = []
+    for message in item.get("chat_messages") or []:
+        text = message.get("text") or _content_text(message.get("content"))
+        entry = make_message(message.get("sender"), text)
+        if entry:
+            history.append(entry)
+    return item.get("name"), _timestamp(item.get("created_at")), history
+
+
+def convert_generic(item):
+    """Ogólna lista wiadomości {"role", "content" / "text" / "parts"}."""
+    history = []
+    for message in item.get("messages") or []:
+        if not isinstance(message, dict):
+            continue
+        text = message.get("content", message.get("text", message.get("parts")))
+        entry = make_message(message.get("role") or message.get("author"), _content_text(text))
+        if entry:
+            history.append(entry)
+    name = item.get("title") or item.get("name")
+    return name, _timestamp(item.get("created_at") or item.get("create_time")), history
+
+
+def convert_own(item):
+    """Pliki aplikacji (stary .json, eksport .jsonl) - historia jest już w docelowym formacie."""
+    history = []
+    for message in item.get("history") or []:
+        if isinstance(message, dict) and message.get("role") in ("user", "model"):
+            history.append({k: v for k, v in message.items() if k != "tokens"})
+    return item.get("name"), item.get("created_at"), history
+
+
+CONVERTERS = (
+    ("chatgpt", "mapping", convert_chatgpt),
+    ("claude", "chat_messages", convert_claude),
+    ("gemini_chat_pro", "history", convert_own),
+    ("generic", "messages", convert_generic),
+)
+
+
+def convert(item):
+    """
+    Surowa konwersacja z archiwum -> (źródło, nazwa, utworzona, historia)
+    albo None, jeśli format nie jest rozpoznany.
+    """
+    if not isinstance(item, dict):
+        return None
+    for source, key, converter in CONVERTERS:
+        if key in item:
+            name, created_at, history = converter(item)
+            return source, name, created_at, history
+    return None
+
+
+def content_hash(history):
+    """Skrót treści konwersacji (role i tekst) - ten sam dla każdego importu tej samej rozmowy."""
+    digest = hashlib.sha256()
+    for message in history:
+        text = message_text(message)
+        digest.update(f"{message['role']}:{len(text)}:{text}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ArchiveImporter:
+    """
+    Import archiwum do magazynu konwersacji partiami po `batch_size`.
+    Konwersacja o tej samej treści co już zapisana jest pomijana.
+    """
+
+    def __init__(self, store, batch_size=IMPORT_BATCH, progress=None, cancelled=None):
+        """
+        :param store: ConversationStore lub SQLiteConversationStore.
+        :param progress: Funkcja progress(statystyki) wywoływana po każdej partii.
+        :param cancelled: Funkcja zwracająca True, gdy import ma zostać przerwany.
+        """
+        self.store = store
+        self.batch_size = batch_size
+        self.progress = progress
+        self.cancelled = cancelled
+        self.stats = {"imported": 0, "messages": 0, "duplicates": 0, "skipped": 0, "seconds": 0.0}
+        self._batch = []
+        self._batch_ids = set()
+
+    def import_path(self, path):
+        """
+        Importuje plik, archiwum .zip lub katalog.
+        :return: Statystyki {imported, messages, duplicates, skipped, seconds, cancelled}.
+        """
+        started = time.perf_counter()
+        cancelled = False
+        try:
+            for item in iter_archive(path):
+                if self.cancelled is not None and self.cancelled():
+                    cancelled = True
+                    break
+                self.add(item)
+        finally:
+            # To, co już przeczytano, trafia do magazynu także po błędzie lub anulowaniu
+            self.flush()
+            self.stats["seconds"] = time.perf_counter() - started
+        return dict(self.stats, cancelled=cancelled)
+
+    def add(self, item):
+        """Dodaje surową konwersację do bieżącej partii (zapis po zebraniu batch_size)."""
+        converted = convert(item)
+        if converted is None or not converted[3]:
+            self.stats["skipped"] += 1
+            return
+        source, name, created_at, history = converted
+        digest = content_hash(history)
+        conv_id = str(uuid.UUID(digest[:32]))
+        if conv_id in self._batch_ids or self.store.get_metadata(conv_id) is not None:
+            self.stats["duplicates"] += 1
+            return
+        header = {
+            "name": (name or "").strip() or "Zaimportowana konwersacja",
+            "imported_from": source,
+            "import_hash": digest,
+        }
+        if created_at:
+            header["created_at"] = created_at
+        for message in history:
+            with_token_count(message)
+        self._batch.append((conv_id, header, history))
+        self._batch_ids.add(conv_id)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Zapisuje bieżącą partię."""
+        if not self._batch:
+            return
+        self.store.save_batch(self._batch)
+        self.stats["imported"] += len(self._batch)
+        self.stats["messages"] += sum(len(history) for _, _, history in self._batch)
+        self._batch = []
+        self._batch_ids = set()
+        if self.progress:
+            self.progress(dict(self.stats))
+
+
+def main(argv=None):
+    from batch_cli import BatchEnvironment
+
+    parser = argparse.ArgumentParser(description="Gemini Chat Pro - import konwersacji z innych narzędzi.")
+    parser.add_argument("archives", nargs="+", help="Pliki .json / .jsonl, archiwa .zip lub katalogi")
+    parser.add_argument("--data-dir", help="Katalog danych aplikacji (domyślnie jak w aplikacji)")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH, help="Konwersacje zapisywane naraz")
+    parser.add_argument("--quiet", action="store_true", help="Nie wypisuj postępu")
+    args = parser.parse_args(argv)
+
+    def progress(stats):
+        if not args.quiet:
+            print(f"Zaimportowano {stats['imported']} konwersacji ({stats['messages']} wiadomości), "
+                  f"powtórzonych: {stats['duplicates']}", file=sys.stderr)
+
+    env = BatchEnvironment(args.data_dir)
+    try:
+        for path in args.archives:
+            importer = ArchiveImporter(env.store, batch_size=max(1, args.batch_size), progress=progress)
+            stats = importer.import_path(path)
+            print(f"{path}: {stats['imported']} nowych konwersacji, {stats['duplicates']} już zapisanych, "
+                  f"{stats['skipped']} pominiętych w {stats['seconds']:.1f} s", file=sys.stderr)
+        return 0
+    except (OSError, ValueError, zipfile.BadZipFile) as e:
+        print(f"Błąd: {e}", file=sys.stderr)
+        return 2
+    finally:
+        env.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+import os
+import json
+import time
+import queue
+import functools
+import threading
+from collections import deque
+
+
+class _NullSpan:
+    """Pusty span zwracany przy wyłączonym śledzeniu - nic nie mierzy i nic nie alokuje."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **fields):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """Pomiar jednego wywołania. Pola dodane przez set() trafiają do rekordu śladu."""
+
+    def __init__(self, tracer, name, fields):
+        self.tracer = tracer
+        self.name = name
+        self.fields = fields
+        self.parent = None
+        self.started_at = None
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def __enter__(self):
+        stack = self.tracer._stack()
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started_at
+        stack = self.tracer._stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        if exc_type is not None:
+            self.fields["error"] = exc_type.__name__
+        self.tracer.record(self.name, elapsed, parent=self.parent, **self.fields)
+        return False
+
+
+class Tracer:
+    """
+    Lekkie śledzenie czasu gorących ścieżek aplikacji. Każdy span (lub wartość
+    z record) trafia do okna ostatnich pomiarów (percentyle w oknie Diagnostyka)
+    i - jeśli podano plik - jako linia JSON do śladu zapisywanego w tle
+    (trace.jsonl, rotowany po przekroczeniu max_bytes).
+    Wyłączony (enabled=False) kosztuje tylko jedno sprawdzenie flagi.
+    """
+
+    def __init__(self, path=None, enabled=False, max_bytes=5 * 1024 * 1024, backups=3, window=500):
+        """
+        :param path: Plik śladu JSONL lub None (tylko statystyki w pamięci).
+        :param max_bytes: Rozmiar pliku, po którym jest on przenoszony do <plik>.1.
+        :param backups: Liczba zachowywanych starszych plików.
+        :param window: Liczba ostatnich pomiarów każdej nazwy branych do percentyli.
+        """
+        self.path = path
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.window = window
+        self._samples = {}      # nazwa -> deque ostatnich czasów (ms)
+        self._counts = {}       # nazwa -> liczba wszystkich pomiarów
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def span(self, name, **fields):
+        """Kontekst mierzący czas bloku: with tracer.span("save_conversation"): ..."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, fields)
+
+    def record(self, name, seconds, **fields):
+        """Zapisuje zmierzony gdzie indziej czas (np. oczekiwanie w kolejce zapytań)."""
+        if not self.enabled:
+            return
+        ms = seconds * 1000
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+            samples.append(ms)
+            self._counts[name] = self._counts.get(name, 0) + 1
+        if self.path:
+            entry = {"ts": time.time(), "name": name, "ms": round(ms, 3), "thread": threading.current_thread().name}
+            entry.update((k, v) for k, v in fields.items() if v is not None)
+            self._queue.put(entry)
+            self._ensure_writer()
+
+    def percentiles(self):
+        """{nazwa: {count, p50, p95, p99, max}} z okna ostatnich pomiarów (ms)."""
+        with self._lock:
+            snapshot = {name: (sorted(s), self._counts[name]) for name, s in self._samples.items()}
+        result = {}
+        for name, (values, count) in sorted(snapshot.items()):
+            if not values:
+                continue
+            last = len(values) - 1
+            result[name] = {
+                "count": count,
+                "p50": values[round(last * 0.50)],
+                "p95": values[round(last * 0.95)],
+                "p99": values[round(last * 0.99)],
+                "max": values[-1],
+            }
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+
+    # === Zapis śladu (wątek w tle) ===
+    def _ensure_writer(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run_writer, name="trace-writer", daemon=True)
+                    self._thread.start()
+
+    def _run_writer(self):
+        while True:
+            entries = [self._queue.get()]
+            # Zbierz wszystko, co czeka - jeden zapis na partię
+            while True:
+                try:
+                    entries.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in entries
+            lines = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries if e is not None)
+            try:
+                self._rotate_if_needed()
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(lines)
+            except Exception as e:
+                print(f"Błąd zapisu śladu: {e}")
+            if stop:
+                return
+
+    def _rotate_if_needed(self):
+        try:
+            if os.path.getsize(self.path) < self.max_bytes:
+                return
+        except OSError:
+            return
+        for i in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{i}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def close(self, timeout=2):
+        """Zapisuje czekające rekordy i kończy wątek zapisu."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+
+def traced(name):
+    """
+    Dekorator metody obiektu z atrybutem `tracer`: mierzy każde wywołanie jako span `name`.
+    Przy wyłączonym śledzeniu metoda jest wywoływana bezpośrednio.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            tracer = self.tracer
+            if not tracer.enabled:
+                return func(self, *args, **kwargs)
+            with tracer.span(name):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorate
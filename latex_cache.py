@@ -0,0 +1,209 @@
+import io
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Wersja sposobu renderowania - zmiana unieważnia wszystkie obrazy na dysku
+# (2: maski alfa niezależne od motywu)
+RENDER_VERSION = 2
+
+
+def make_key(expression, block_mode, dpi):
+    """Klucz obrazu: skrót z wyrażenia, trybu (inline/blok) i dpi. Kolory motywu nie wchodzą do klucza."""
+    raw = "\x00".join([
+        str(RENDER_VERSION), expression, "block" if block_mode else "inline", str(dpi)
+    ])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def read_cached_png(cache_dir, key):
+    """
+    Zwraca plik PNG (maskę alfa) wzoru z katalogu cache albo None - bez dekodowania
+    i bez zmiany kolejności LRU (np. do eksportu HTML, także z innego procesu).
+    """
+    try:
+        with open(os.path.join(cache_dir, key + ".png"), 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+class LatexImageCache:
+    """
+    Dwupoziomowa pamięć podręczna wyrenderowanych wzorów LaTeX.
+    Poziom 1: obrazy PIL w pamięci (LRU z limitem bajtów) - maski alfa
+    oraz ich pokolorowane warianty dla motywów (colored).
+    Poziom 2: pliki PNG z maskami w katalogu cache_dir (usuwane od najdawniej
+    używanych po przekroczeniu limitu rozmiaru katalogu).
+    Bezpieczna dla wątków - może być uzupełniana z wątku renderowania.
+    """
+
+    def __init__(self, cache_dir, memory_budget=64 * 1024 * 1024, disk_budget=256 * 1024 * 1024):
+        """
+        :param cache_dir: Katalog na pliki PNG.
+        :param memory_budget: Limit pamięci na zdekodowane obrazy (bajty).
+        :param disk_budget: Limit rozmiaru katalogu z plikami PNG (bajty).
+        """
+        self.cache_dir = cache_dir
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self._memory = OrderedDict()  # klucz -> (obraz, rozmiar w bajtach)
+        self._memory_bytes = 0
+        self._disk = OrderedDict()    # klucz -> rozmiar pliku, od najdawniej używanego
+        self._disk_bytes = 0
+        self._lock = threading.RLock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.renders = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._scan_disk()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".png")
+
+    def _scan_disk(self):
+        """Odtwarza kolejność LRU plików na dysku na podstawie czasu ostatniego użycia."""
+        entries = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.name.endswith(".png") and entry.is_file():
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        except OSError as e:
+            print(f"Nie można przeskanować katalogu cache LaTeX: {e}")
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    # === Odczyt ===
+    def get(self, key):
+        """Zwraca obraz PIL z pamięci lub z dysku, albo None (trzeba wyrenderować)."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry[0]
+
+            if key in self._disk:
+                try:
+                    with open(self._path(key), 'rb') as f:
+                        image = self._decode(f.read())
+                    os.utime(self._path(key))
+                except (OSError, ValueError) as e:
+                    print(f"Uszkodzony plik cache LaTeX {key}: {e}")
+                    self._forget_disk(key)
+                else:
+                    self._disk.move_to_end(key)
+                    self.disk_hits += 1
+                    self._remember(key, image)
+                    return image
+
+            self.misses += 1
+            return None
+
+    # === Zapis ===
+    def put(self, key, png_bytes):
+        """Zapisuje wyrenderowany PNG na dysku i w pamięci. Zwraca obraz PIL."""
+        image = self._decode(png_bytes)
+        with self._lock:
+            self.renders += 1
+            self._remember(key, image)
+            self._write_disk(key, png_bytes)
+        return image
+
+    def colored(self, key, mask, text_color, bg_color):
+        """
+        Zwraca wzór w kolorach motywu: kolor tekstu nałożony na tło przez maskę.
+        Warianty są pamiętane w tym samym LRU co maski, więc powrót do
+        poprzedniego motywu nie wymaga nawet ponownego składania obrazu.
+        """
+        variant = (key, text_color, bg_color)
+        with self._lock:
+            entry = self._memory.get(variant)
+            if entry is not None:
+                self._memory.move_to_end(variant)
+                return entry[0]
+        from PIL import Image
+        if mask.mode != 'L':
+            mask = mask.convert('L')
+        image = Image.composite(
+            Image.new('RGB', mask.size, text_color),
+            Image.new('RGB', mask.size, bg_color),
+            mask
+        )
+        with self._lock:
+            self._remember(variant, image)
+        return image
+
+    @staticmethod
+    def _decode(png_bytes):
+        # PIL importowany dopiero przy pierwszym wzorze - nie spowalnia startu aplikacji
+        from PIL import Image
+        image = Image.open(io.BytesIO(png_bytes))
+        image.load()
+        return image
+
+    def _remember(self, key, image):
+        size = image.width * image.height * len(image.getbands())
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= old[1]
+        self._memory[key] = (image, size)
+        self._memory_bytes += size
+        while self._memory_bytes > self.memory_budget and len(self._memory) > 1:
+            _, (_, evicted) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted
+
+    def _write_disk(self, key, png_bytes):
+        path = self._path(key)
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(png_bytes)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Nie można zapisać cache LaTeX: {e}")
+            return
+        self._disk_bytes -= self._disk.pop(key, 0)
+        self._disk[key] = len(png_bytes)
+        self._disk_bytes += len(png_bytes)
+        while self._disk_bytes > self.disk_budget and len(self._disk) > 1:
+            oldest = next(iter(self._disk))
+            self._forget_disk(oldest)
+
+    def _forget_disk(self, key):
+        self._disk_bytes -= self._disk.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        """Czyści oba poziomy pamięci podręcznej."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            for key in list(self._disk):
+                self._forget_disk(key)
+
+    def stats(self):
+        """Zwraca liczniki trafień i zajętość obu poziomów."""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "renders": self.renders,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_items": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+            }
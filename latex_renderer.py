@@ -0,0 +1,93 @@
+import io
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+def render_latex_png(latex_expression, block_mode, dpi):
+    """
+    Renderuje wzór LaTeX (mathtext) do PNG przyciętego do tekstu.
+    Wynik to maska alfa (PNG w skali szarości): kolory motywu nakłada się
+    później (LatexImageCache.colored), więc zmiana motywu nie wymaga renderowania.
+    Używa bezpośrednio Figure i płótna Agg - bez pyplot i jego globalnego stanu,
+    więc może działać w procesie roboczym lub w dowolnym wątku.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from PIL import Image
+
+    fig = Figure(figsize=(8, 1) if block_mode else (6, 0.5))
+    canvas = FigureCanvasAgg(fig)
+    fig.patch.set_alpha(0)
+
+    # $$...$$ dla wzorów blokowych, $...$ dla wzorów w linii
+    latex_text = f"$${latex_expression}$$" if block_mode else f"${latex_expression}$"
+    text_obj = fig.text(0.5, 0.5, latex_text, ha='center', va='center', fontsize=12, color='black')
+
+    # Jedno rysowanie, żeby poznać wymiary tekstu; savefig oczekuje ramki w calach
+    canvas.draw()
+    bbox = text_obj.get_window_extent(renderer=canvas.get_renderer())
+    bbox_padded = bbox.expanded(1.2, 1.2).transformed(fig.dpi_scale_trans.inverted())
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', bbox_inches=bbox_padded, dpi=dpi, transparent=True)
+    buf.seek(0)
+
+    # Zostaw tylko kanał alfa - to on niesie kształt wzoru
+    mask = Image.open(buf).convert('RGBA').getchannel('A')
+    out = io.BytesIO()
+    mask.save(out, format='PNG')
+    return out.getvalue()
+
+
+class LatexRenderPool:
+    """
+    Pula procesów renderujących wzory LaTeX poza wątkiem Tk.
+    Procesy startują dopiero przy pierwszym wzorze. Jeśli pula procesów
+    nie może wystartować (albo padnie), renderowanie przechodzi do
+    jednego wątku pomocniczego w bieżącym procesie.
+    """
+
+    def __init__(self, max_workers=2):
+        self.max_workers = max(1, int(max_workers))
+        self._executor = None
+        self._fallback = False
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                if not self._fallback:
+                    try:
+                        self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                        return self._executor
+                    except (OSError, NotImplementedError, ImportError) as e:
+                        print(f"Pula procesów LaTeX niedostępna, renderowanie w wątku: {e}")
+                        self._fallback = True
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="latex-render")
+            return self._executor
+
+    def submit(self, latex_expression, block_mode, dpi):
+        """Zleca renderowanie. Zwraca Future z bajtami PNG (maską alfa)."""
+        if self._closed:
+            raise RuntimeError("Pula renderowania LaTeX została zamknięta")
+        args = (latex_expression, block_mode, dpi)
+        executor = self._get_executor()
+        try:
+            return executor.submit(render_latex_png, *args)
+        except RuntimeError as e:
+            # BrokenProcessPool (proces roboczy padł) - dalej renderujemy w wątku
+            print(f"Pula procesów LaTeX przestała działać, renderowanie w wątku: {e}")
+            with self._lock:
+                self._fallback = True
+                self._executor = None
+            executor.shutdown(wait=False)
+            return self._get_executor().submit(render_latex_png, *args)
+
+    def shutdown(self):
+        """Zatrzymuje pulę, porzucając zadania czekające w kolejce."""
+        with self._lock:
+            self._closed = True
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
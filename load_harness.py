@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Test obciążeniowy ścieżki zapytań Gemini Chat Pro bez sieci.
+
+Symuluje N równoległych konwersacji po M wymian każda, przepuszczając je przez
+te same elementy co aplikacja: ContextBuilder, ChatSessionCache, RequestExecutor
+i StreamingReply, z lokalnym modelem MockBackend (opóźnienie, tokeny/s, błędy,
+rozrzut). Odpowiedzi są odbierane w pętli "interfejsu" co 16 ms - w oknie Tk,
+jeśli jest dostępny ekran, a w przeciwnym razie bez okna. Raport: percentyle
+czasu odpowiedzi i pierwszego tokena, przepustowość oraz przycięcia pętli UI.
+
+Przykład:
+    python load_harness.py --conversations 20 --turns 5 --workers 4
+    python load_harness.py --latency 1.0 --tps 40 --error-rate 0.05 --json
+"""
+import sys
+import json
+import time
+import argparse
+import statistics
+
+from context_builder import ContextBuilder, with_token_count, estimate_tokens
+from chat_sessions import ChatSessionCache
+from request_executor import RequestExecutor
+from streaming import StreamingReply
+from model_backend import MockBackend
+
+FRAME_SECONDS = 0.016
+MODEL_NAME = "mock-model"
+
+
+class SimulatedConversation:
+    """Jedna konwersacja: historia i odpowiedź, na którą właśnie czeka."""
+
+    def __init__(self, conv_id, turns, system_prompt):
+        self.id = conv_id
+        self.turns = turns
+        self.system_prompt = system_prompt
+        self.history = []
+        self.sent = 0
+        self.reply = None
+        self.handle = None
+        self.submitted_at = None
+
+
+class LoadHarness:
+    def __init__(self, backend, conversations, turns, workers, budget_tokens=32000,
+                 stall_ms=50, message_words=30, ui=None):
+        """
+        :param ui: Obiekt z metodami show(conv_id, segmenty) i update() (okno Tk) lub None.
+        """
+        self.backend = backend
+        self.builder = ContextBuilder(budget_tokens=budget_tokens)
+        self.sessions = ChatSessionCache(backend.open_chat, max_sessions=conversations)
+        self.executor = RequestExecutor(max_workers=workers)
+        self.stall_seconds = stall_ms / 1000
+        self.message_words = message_words
+        self.ui = ui
+        self.conversations = [
+            SimulatedConversation(f"load-{i:04d}", turns, f"Prompt systemowy konwersacji {i}.")
+            for i in range(conversations)
+        ]
+        self.latencies = []
+        self.first_tokens = []
+        self.errors = []
+        self.tokens = 0
+        self.frames = []
+
+    def _message(self, conv):
+        words = [f"pytanie{conv.sent}"] + [f"treść{i}" for i in range(self.message_words - 1)]
+        return f"Konwersacja {conv.id}: " + " ".join(words)
+
+    def _submit(self, conv):
+        message = self._message(conv)
+        conv.history.append(with_token_count({"role": "user", "parts": [{"text": message}]}))
+        conv.sent += 1
+        conv.reply = StreamingReply()
+        conv.submitted_at = time.perf_counter()
+        conv.handle = self.executor.submit(
+            self._request, conv.id, conv.system_prompt, list(conv.history), message, conv.reply,
+            label=conv.id
+        )
+
+    def _request(self, handle, conv_id, system_prompt, history, message, reply):
+        """To samo co _get_gemini_response w aplikacji (wątek puli zapytań)."""
+        try:
+            plan = self.builder.build(history[:-1], pending=history[-1], system_prompt=system_prompt)
+            session, _ = self.sessions.checkout(
+                conv_id, MODEL_NAME, plan.system_prompt, history[:-1], plan.dropped_messages, plan.contents
+            )
+            reply.context = plan
+            stream = self.backend.stream(session.chat, message, {"max_output_tokens": 2048})
+            handle.add_cancel_callback(lambda: self.backend.cancel(stream))
+            received, token_count = [], None
+            for chunk in stream:
+                if chunk.text:
+                    received.append(chunk.text)
+                    reply.put_text(chunk.text)
+                if chunk.token_count:
+                    token_count = chunk.token_count
+            if handle.cancelled:
+                reply.put_cancelled()
+                return
+            reply.put_done(token_count)
+            self.sessions.checkin(conv_id, session, {"role": "model", "parts": [{"text": "".join(received)}]})
+        except Exception as e:
+            reply.put_error(str(e))
+
+    def _drain(self, conv):
+        """Odbiera fragmenty odpowiedzi (wątek UI). Zwraca True, gdy odpowiedź jest kompletna."""
+        reply = conv.reply
+        segments = reply.drain()
+        if segments and self.ui is not None:
+            self.ui.show(conv.id, segments)
+        if not reply.done:
+            return False
+        now = time.perf_counter()
+        if reply.error is not None:
+            self.errors.append(reply.error)
+            # Jak w aplikacji: wiadomość bez odpowiedzi nie zostaje w historii
+            conv.history.pop()
+        else:
+            self.latencies.append(now - conv.submitted_at)
+            if reply.time_to_first_token is not None:
+                self.first_tokens.append(reply.time_to_first_token)
+            tokens = reply.token_count or estimate_tokens(reply.text)
+            self.tokens += tokens
+            conv.history.append(with_token_count({"role": "model", "parts": [{"text": reply.text}]}, tokens))
+        conv.reply = None
+        return True
+
+    def run(self, timeout=600):
+        """Wykonuje wszystkie konwersacje. Zwraca słownik wyników (report)."""
+        for conv in self.conversations:
+            self._submit(conv)
+        started = last_frame = time.perf_counter()
+        deadline = started + timeout
+        try:
+            while True:
+                pending = False
+                for conv in self.conversations:
+                    if conv.reply is None:
+                        continue
+                    if self._drain(conv) and conv.sent < conv.turns:
+                        self._submit(conv)
+                    pending = pending or conv.reply is not None
+                if self.ui is not None:
+                    self.ui.update()
+                if not pending:
+                    break
+                now = time.perf_counter()
+                if now > deadline:
+                    raise TimeoutError(f"Test nie zakończył się w {timeout} s")
+                self.frames.append(now - last_frame)
+                time.sleep(max(0.0, FRAME_SECONDS - (time.perf_counter() - now)))
+                last_frame = now
+        finally:
+            self.executor.shutdown(timeout=2)
+        return self.report(time.perf_counter() - started)
+
+    def report(self, elapsed):
+        stalls = [f for f in self.frames if f > self.stall_seconds]
+        return {
+            "requests": len(self.latencies) + len(self.errors),
+            "errors": len(self.errors),
+            "elapsed": elapsed,
+            "throughput_rps": len(self.latencies) / elapsed if elapsed > 0 else 0,
+            "throughput_tps": self.tokens / elapsed if elapsed > 0 else 0,
+            "latency": percentiles(self.latencies),
+            "first_token": percentiles(self.first_tokens),
+            "frames": len(self.frames),
+            "stalls": len(stalls),
+            "max_frame": max(self.frames) if self.frames else 0,
+            "sessions": self.sessions.stats(),
+        }
+
+
+class TkView:
+    """Okno z polem tekstowym, do którego trafiają odpowiedzi (jak w aplikacji)."""
+
+    def __init__(self, root):
+        import tkinter as tk
+        self.root = root
+        self.text = tk.Text(root, width=100, height=30)
+        self.text.pack(fill=tk.BOTH, expand=True)
+        self._starts = {}
+
+    def show(self, conv_id, segments):
+        for segment in segments:
+            # Wzory nie są tu renderowane - liczy się koszt wstawiania tekstu
+            self.text.insert("end", segment[1])
+        # Bez ograniczenia pole rośnie do setek tysięcy linii i samo staje się wąskim gardłem
+        if int(self.text.index("end-1c").split(".")[0]) > 2000:
+            self.text.delete("1.0", "1000.0")
+        self.text.see("end")
+
+    def update(self):
+        self.root.update()
+
+
+def make_view(headless):
+    if headless:
+        return None
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+    except Exception as e:
+        print(f"Brak ekranu ({e}) - pętla UI bez okna.", file=sys.stderr)
+        return None
+    root.title("Gemini Chat Pro - test obciążeniowy")
+    return TkView(root)
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    if len(values) == 1:
+        return {"p50": values[0], "p95": values[0], "p99": values[0], "max": values[0]}
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98], "max": max(values)}
+
+
+def print_report(result, options):
+    print(f"\nKonwersacje: {options.conversations} x {options.turns} wymian, wątki: {options.workers}")
+    print(f"Zapytania: {result['requests']}  błędy: {result['errors']}  czas: {result['elapsed']:.2f} s")
+    print(f"Przepustowość: {result['throughput_rps']:.2f} zapytań/s, {result['throughput_tps']:.0f} tok/s")
+    for label, key in (("Czas odpowiedzi", "latency"), ("Pierwszy token", "first_token")):
+        p = result[key]
+        if p:
+            print(f"{label:<16} p50 {p['p50'] * 1000:8.1f} ms   p95 {p['p95'] * 1000:8.1f} ms   "
+                  f"p99 {p['p99'] * 1000:8.1f} ms   max {p['max'] * 1000:8.1f} ms")
+    print(f"Pętla UI: {result['frames']} klatek, przycięcia > {options.stall_ms} ms: {result['stalls']}, "
+          f"najdłuższa klatka {result['max_frame'] * 1000:.1f} ms")
+    print(f"Sesje czatu: {result['sessions']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test obciążeniowy z lokalnym modelem testowym.")
+    parser.add_argument("--conversations", type=int, default=10, help="Liczba równoległych konwersacji")
+    parser.add_argument("--turns", type=int, default=5, help="Liczba wymian w każdej konwersacji")
+    parser.add_argument("--workers", type=int, default=4, help="Liczba wątków puli zapytań")
+    parser.add_argument("--latency", type=float, default=0.3, help="Czas do pierwszego tokena (s)")
+    parser.add_argument("--tps", type=float, default=80, help="Tokeny na sekundę")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Prawdopodobieństwo błędu (0-1)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Względny rozrzut czasów")
+    parser.add_argument("--reply-tokens", type=int, default=120, help="Długość odpowiedzi w tokenach")
+    parser.add_argument("--budget", type=int, default=32000, help="Limit tokenów kontekstu")
+    parser.add_argument("--stall-ms", type=float, default=50, help="Klatka dłuższa niż tyle ms to przycięcie")
+    parser.add_argument("--seed", type=int, default=None, help="Ziarno losowania (powtarzalne wyniki)")
+    parser.add_argument("--timeout", type=float, default=600, help="Limit czasu całego testu (s)")
+    parser.add_argument("--headless", action="store_true", help="Nie otwieraj okna Tk")
+    parser.add_argument("--json", action="store_true", help="Wypisz wyniki jako JSON")
+    args = parser.parse_args()
+
+    backend = MockBackend(
+        latency=args.latency, tokens_per_second=args.tps, error_rate=args.error_rate,
+        jitter=args.jitter, reply_tokens=args.reply_tokens, seed=args.seed
+    )
+    harness = LoadHarness(
+        backend, args.conversations, args.turns, args.workers,
+        budget_tokens=args.budget, stall_ms=args.stall_ms, ui=make_view(args.headless)
+    )
+    result = harness.run(timeout=args.timeout)
+    if harness.ui is not None:
+        harness.ui.root.destroy()
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result, args)
+
+
+if __name__ == "__main__":
+    main()
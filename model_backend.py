@@ -0,0 +1,316 @@
+import time
+import random
+import threading
+
+from context_builder import estimate_tokens, message_text
+import gemini_sdk
+
+
+class BackendResult:
+    """Odpowiedź modelu albo jeden jej fragment (przy odbiorze strumieniowym)."""
+
+    def __init__(self, text, token_count=None, cached_tokens=None):
+        self.text = text
+        self.token_count = token_count      # Tokeny odpowiedzi (z usage_metadata), jeśli znane
+        self.cached_tokens = cached_tokens  # Tokeny kontekstu z cache modelu, jeśli znane
+
+
+class BackendStream:
+    """
+    Odpowiedź strumieniowa: iterator po BackendResult. cancel() (z dowolnego
+    wątku) kończy iterację najpóźniej po bieżącym fragmencie i wywołuje
+    on_cancel - backend zamyka w nim połączenie, żeby serwer przestał wysyłać resztę.
+    """
+
+    def __init__(self, chunks, cancel_event=None, on_cancel=None):
+        self._chunks = iter(chunks)
+        self._cancel = cancel_event or threading.Event()
+        self._on_cancel = on_cancel
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._cancel.is_set():
+            raise StopIteration
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            raise
+        except Exception:
+            # Zamknięte połączenie zgłasza błąd w wątku, który czeka na fragment
+            if self._cancel.is_set():
+                raise StopIteration
+            raise
+
+    def cancel(self):
+        if self._cancel.is_set():
+            return
+        self._cancel.set()
+        if self._on_cancel is not None:
+            self._on_cancel()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+
+class ModelBackend:
+    """
+    Interfejs modelu, z którego korzysta aplikacja. Czat (open_chat) jest
+    obiektem backendu - aplikacja tylko przekazuje go do send/stream.
+    generation: słownik parametrów generowania (np. {"max_output_tokens": 1024}).
+    """
+
+    name = "base"
+    # Czy backend potrzebuje klucza API (configure) przed pierwszym zapytaniem
+    requires_api_key = False
+
+    @property
+    def ready(self):
+        return True
+
+    def configure(self, api_key):
+        pass
+
+    def open_chat(self, model_name, system_instruction, history, model=None):
+        """
+        Nowy czat z historią (postać dla API).
+        model - gotowy model z CacheBackend.make_model (zapisany kontekst); czat tworzy wtedy on.
+        """
+        raise NotImplementedError
+
+    def send(self, chat, message, generation):
+        """Wysyła wiadomość i czeka na całą odpowiedź. Zwraca BackendResult."""
+        raise NotImplementedError
+
+    def stream(self, chat, message, generation):
+        """Wysyła wiadomość i zwraca BackendStream z fragmentami odpowiedzi."""
+        raise NotImplementedError
+
+    def count_tokens(self, model_name, contents):
+        """Liczba tokenów wiadomości (postać dla API)."""
+        raise NotImplementedError
+
+    def cancel(self, stream):
+        """Przerywa odbiór odpowiedzi strumieniowej."""
+        stream.cancel()
+
+    def generate(self, model_name, prompt, generation):
+        """Pojedyncze zapytanie bez historii (np. streszczenie kontekstu). Zwraca tekst."""
+        raise NotImplementedError
+
+
+class GeminiBackend(ModelBackend):
+    """Gemini API przez google.generativeai (SDK ładowane przy configure)."""
+
+    name = "gemini"
+    requires_api_key = True
+
+    def __init__(self):
+        self._configured = False
+
+    @property
+    def ready(self):
+        return self._configured
+
+    def configure(self, api_key):
+        genai, _ = gemini_sdk.load()
+        genai.configure(api_key=api_key)
+        self._configured = True
+
+    def _generation_config(self, generation):
+        genai, _ = gemini_sdk.load()
+        return genai.types.GenerationConfig(**generation)
+
+    @staticmethod
+    def _request_options():
+        # Ponawianie po 429 i błędach serwera robi RateLimiter (z uwzględnieniem limitów
+        # i wskazówek API) - domyślne ponawianie SDK wstrzymywałoby zapytanie na długo
+        return {"retry": None}
+
+    @staticmethod
+    def _usage(response):
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return None, None
+        return (getattr(usage, "candidates_token_count", None) or None,
+                getattr(usage, "cached_content_token_count", None) or None)
+
+    def open_chat(self, model_name, system_instruction, history, model=None):
+        if model is None:
+            genai, _ = gemini_sdk.load()
+            model = genai.GenerativeModel(model_name, system_instruction=system_instruction or None)
+        return model.start_chat(history=history)
+
+    def send(self, chat, message, generation):
+        response = chat.send_message(
+            message,
+            request_options=self._request_options(),
+            generation_config=self._generation_config(generation)
+        )
+        return BackendResult(response.text, *self._usage(response))
+
+    def stream(self, chat, message, generation):
+        response = chat.send_message(
+            message,
+            request_options=self._request_options(),
+            generation_config=self._generation_config(generation),
+            stream=True
+        )
+
+        def chunks():
+            for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Fragment bez treści (np. tylko powód zakończenia)
+                    text = ""
+                yield BackendResult(text, *self._usage(chunk))
+
+        received = chunks()
+        return BackendStream(received, on_cancel=lambda: self._close_stream(response, received))
+
+    @staticmethod
+    def _close_stream(response, received):
+        """
+        Przerywa wywołanie strumieniowe SDK: iterator gRPC (i REST z api_core)
+        ma cancel(), który zamyka połączenie - sam koniec iteracji go nie zamyka.
+        Iterator jest prywatnym polem odpowiedzi (google-generativeai 0.x); bez niego
+        zamykany jest generator fragmentów, co porzuca odpowiedź SDK.
+        """
+        iterator = getattr(response, "_iterator", None)
+        for name in ("cancel", "close"):
+            close = getattr(iterator, name, None)
+            if callable(close):
+                close()
+                return
+        try:
+            received.close()
+        except ValueError:
+            # Generator czeka właśnie w innym wątku na fragment - odbiór skończy się po nim
+            print("Nie można przerwać połączenia z Gemini API - odpowiedź SDK nie ma iteratora do zamknięcia, "
+                  "odbiór zakończy się po bieżącym fragmencie")
+            return
+        print("Odpowiedź SDK nie ma iteratora do zamknięcia - przerwano tylko odbiór fragmentów")
+
+    def count_tokens(self, model_name, contents):
+        genai, _ = gemini_sdk.load()
+        return genai.GenerativeModel(model_name).count_tokens(contents).total_tokens
+
+    def generate(self, model_name, prompt, generation):
+        genai, _ = gemini_sdk.load()
+        response = genai.GenerativeModel(model_name).generate_content(
+            prompt, generation_config=self._generation_config(generation)
+        )
+        return response.text
+
+
+class MockBackendError(RuntimeError):
+    """Symulowany błąd API (MockBackend z error_rate > 0)."""
+
+    code = 503
+
+
+class _MockChat:
+    def __init__(self, system_instruction, history):
+        self.system_instruction = system_instruction
+        self.history = list(history)
+
+
+class MockBackend(ModelBackend):
+    """
+    Lokalny model do testów i pomiarów bez sieci. Odpowiada po `latency`
+    sekundach (+/- jitter), generując `reply_tokens` tokenów w tempie
+    `tokens_per_second`; z prawdopodobieństwem `error_rate` zgłasza błąd.
+    Bezpieczny dla wątków.
+    """
+
+    name = "mock"
+
+    def __init__(self, latency=0.3, tokens_per_second=80.0, error_rate=0.0, jitter=0.1,
+                 reply_tokens=120, chunk_tokens=8, seed=None, sleep=time.sleep):
+        """
+        :param latency: Czas do pierwszego tokena (s).
+        :param tokens_per_second: Szybkość generowania odpowiedzi.
+        :param error_rate: Prawdopodobieństwo błędu zapytania (0-1).
+        :param jitter: Względny rozrzut czasów (0.1 = +/-10%).
+        :param reply_tokens: Długość odpowiedzi w tokenach.
+        :param chunk_tokens: Liczba tokenów w jednym fragmencie strumienia.
+        """
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.jitter = jitter
+        self.reply_tokens = reply_tokens
+        self.chunk_tokens = max(1, chunk_tokens)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._sleep = sleep
+
+    @classmethod
+    def from_config(cls, options):
+        """Tworzy backend z ustawień ("mock_backend" w config.json)."""
+        keys = ("latency", "tokens_per_second", "error_rate", "jitter", "reply_tokens", "chunk_tokens", "seed")
+        return cls(**{k: options[k] for k in keys if k in options})
+
+    def _vary(self, value):
+        with self._lock:
+            factor = 1 + self._random.uniform(-self.jitter, self.jitter) if self.jitter else 1
+            failed = self._random.random() < self.error_rate
+        return max(0.0, value * factor), failed
+
+    def _reply_words(self, message):
+        # Odpowiedź zależy od treści pytania, więc powtarzalne zapytania dają to samo
+        words = ["Odpowiedź", "testowa", "na:"] + message.split()[:5]
+        while len(words) < self.reply_tokens:
+            words.append(f"słowo{len(words)}")
+        return words[:self.reply_tokens]
+
+    def open_chat(self, model_name, system_instruction, history, model=None):
+        if model is not None:
+            return model.start_chat(history=history)
+        return _MockChat(system_instruction, history)
+
+    def _chunks(self, chat, message, generation, cancelled):
+        limit = generation.get("max_output_tokens") or self.reply_tokens
+        words = self._reply_words(message)[:limit]
+        delay, failed = self._vary(self.latency)
+        self._sleep(delay)
+        if failed:
+            raise MockBackendError("Symulowany błąd modelu (503)")
+        per_token, _ = self._vary(1.0 / self.tokens_per_second if self.tokens_per_second else 0)
+        received = []
+        for start in range(0, len(words), self.chunk_tokens):
+            piece = words[start:start + self.chunk_tokens]
+            self._sleep(per_token * len(piece))
+            text = (" " if received else "") + " ".join(piece)
+            received.append(text)
+            if cancelled():
+                return
+            last = start + self.chunk_tokens >= len(words)
+            yield BackendResult(text, token_count=len(words) if last else None)
+        chat.history.append({"role": "user", "parts": [{"text": message}]})
+        chat.history.append({"role": "model", "parts": [{"text": "".join(received)}]})
+
+    def send(self, chat, message, generation):
+        chunks = list(self._chunks(chat, message, generation, lambda: False))
+        return BackendResult("".join(c.text for c in chunks), token_count=chunks[-1].token_count if chunks else 0)
+
+    def stream(self, chat, message, generation):
+        cancel_event = threading.Event()
+        return BackendStream(self._chunks(chat, message, generation, cancel_event.is_set), cancel_event)
+
+    def count_tokens(self, model_name, contents):
+        return sum(estimate_tokens(message_text(c)) for c in contents)
+
+    def generate(self, model_name, prompt, generation):
+        chat = self.open_chat(model_name, None, [])
+        return self.send(chat, prompt, generation).text
+
+
+def create_backend(config):
+    """Backend wybrany w config.json ("model_backend": "gemini" lub "mock")."""
+    if config.get('model_backend') == 'mock':
+        return MockBackend.from_config(config.get('mock_backend', {}))
+    return GeminiBackend()
@@ -0,0 +1,315 @@
+import re
+import time
+import random
+import hashlib
+import threading
+
+# Kody HTTP, po których zapytanie jest ponawiane: przekroczony limit i przejściowe błędy serwera
+QUOTA_ERROR = 429
+TRANSIENT_ERRORS = (500, 502, 503, 504)
+
+# Domyślne limity (darmowy poziom gemini-1.5-flash); inne - "rate_limit" w config.json
+DEFAULT_LIMITS = {"rpm": 15, "tpm": 1_000_000}
+
+_RETRY_PATTERNS = (
+    re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE),                  # "Please retry in 17.5s."
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)", re.IGNORECASE),   # RetryInfo w treści błędu
+)
+
+
+def quota_key(api_key):
+    """Identyfikator klucza API dla limitów (skrót - sam klucz nie jest nigdzie trzymany)."""
+    return hashlib.sha1(api_key.encode('utf-8')).hexdigest()[:12] if api_key else None
+
+
+def error_code(error):
+    """
+    Kod HTTP błędu API lub None. Brany tylko z jawnego pola statusu: code
+    (google.api_core.exceptions, MockBackendError) albo status_code (także
+    w error.response) - treść komunikatu nie jest przeszukiwana, więc inne
+    błędy (np. "503" w ścieżce pliku) nie są ponawiane.
+    """
+    for code in (
+        getattr(error, "code", None),
+        getattr(error, "status_code", None),
+        getattr(getattr(error, "response", None), "status_code", None),
+    ):
+        if isinstance(code, int) and not isinstance(code, bool):
+            return code
+    return None
+
+
+def retry_after(error):
+    """Czas (s), po którym API każe ponowić zapytanie, albo None, jeśli go nie podało."""
+    value = getattr(error, "retry_after", None)
+    if value is not None:
+        return float(value)
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if headers:
+        try:
+            return float(headers.get("Retry-After"))
+        except (TypeError, ValueError):
+            pass
+    for detail in getattr(error, "details", None) or ():
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None and hasattr(delay, "seconds"):
+            return delay.seconds + getattr(delay, "nanos", 0) / 1e9
+    text = str(error)
+    for pattern in _RETRY_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+class TokenBucket:
+    """
+    Budżet odnawiany w czasie (np. 15 zapytań na minutę). Rezerwacja może
+    zadłużyć budżet - następne czekają, aż dług się spłaci, więc zapytania
+    wychodzą w kolejności zgłoszenia i w równych odstępach.
+    """
+
+    def __init__(self, per_minute, now):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = now
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount, now):
+        """Pobiera `amount` z budżetu. Zwraca czas (s), po którym rezerwacja jest pokryta."""
+        self._refill(now)
+        # Zapytanie większe niż cały budżet i tak musi kiedyś wyjść
+        self.level -= min(amount, self.capacity)
+        return -self.level / self.rate if self.level < 0 else 0.0
+
+    def give_back(self, amount, now):
+        """Zwraca niewykorzystaną rezerwację (np. zapytanie anulowane w kolejce)."""
+        self._refill(now)
+        self.level = min(self.capacity, self.level + min(amount, self.capacity))
+
+    def charge(self, amount, now):
+        """Dolicza zużycie znane dopiero po odpowiedzi (bez czekania)."""
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+
+    def drain(self, now):
+        """Opróżnia budżet - po 429 kolejne zapytania wychodzą już tylko w tempie odnawiania."""
+        self._refill(now)
+        self.level = min(self.level, 0.0)
+
+    def available(self, now):
+        self._refill(now)
+        return max(0.0, self.level)
+
+
+class _Quota:
+    """Budżety jednej pary (klucz API, model)."""
+
+    def __init__(self, rpm, tpm, now):
+        self.requests = TokenBucket(rpm, now) if rpm else None
+        self.tokens = TokenBucket(tpm, now) if tpm else None
+        self.blocked_until = 0.0  # Po 429: do kiedy nic nie jest wysyłane
+
+
+class RateLimiter:
+    """
+    Wspólny ogranicznik zapytań do modelu: budżety zapytań (rpm) i tokenów
+    (tpm) na minutę, osobno dla każdej pary (klucz API, model). Zapytanie
+    ponad budżet czeka w kolejce zamiast dostać 429. Błędy limitu (429)
+    i przejściowe (5xx) są ponawiane z wykładniczym opóźnieniem z losowym
+    rozrzutem; czas podany przez API ("retry in ...") ma pierwszeństwo,
+    a 429 wstrzymuje wszystkie zapytania tej pary. Bezpieczny dla wątków.
+    """
+
+    def __init__(self, rpm=0, tpm=0, models=None, max_retries=4, base_delay=1.0, max_delay=60.0,
+                 seed=None, clock=time.monotonic, sleep=time.sleep):
+        """
+        :param rpm: Zapytań na minutę (0 - bez limitu).
+        :param tpm: Tokenów wejścia i odpowiedzi na minutę (0 - bez limitu).
+        :param models: Inne limity dla wybranych modeli: {model: {"rpm": ..., "tpm": ...}}.
+        :param max_retries: Ile razy ponawiać zapytanie po 429 / 5xx.
+        :param base_delay: Opóźnienie pierwszego ponowienia (s), podwajane przy kolejnych.
+        :param max_delay: Najdłuższe opóźnienie ponowienia (s).
+        """
+        self.rpm = rpm
+        self.tpm = tpm
+        self.models = models or {}
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._random = random.Random(seed)
+        self._clock = clock
+        self._sleep = sleep
+        self._quotas = {}
+        self._lock = threading.Lock()
+        self._stats = {"waits": 0, "waited": 0.0, "retries": 0, "quota_errors": 0}
+
+    @classmethod
+    def from_config(cls, options):
+        """Tworzy ogranicznik z ustawień ("rate_limit" w config.json), uzupełnionych o DEFAULT_LIMITS."""
+        options = dict(DEFAULT_LIMITS, **(options or {}))
+        keys = ("rpm", "tpm", "models", "max_retries", "base_delay", "max_delay")
+        return cls(**{k: options[k] for k in keys if k in options})
+
+    def _quota(self, key, model):
+        quota = self._quotas.get((key, model))
+        if quota is None:
+            limits = self.models.get(model, {})
+            quota = self._quotas[(key, model)] = _Quota(
+                limits.get("rpm", self.rpm), limits.get("tpm", self.tpm), self._clock()
+            )
+        return quota
+
+    # === Kolejka ===
+    def acquire(self, key, model, tokens=0, cancelled=None, on_wait=None):
+        """
+        Czeka, aż budżet pary (key, model) pozwoli wysłać zapytanie o ~tokens tokenach.
+        key=None (np. lokalny model testowy) - bez budżetu.
+        :param on_wait: Funkcja on_wait(sekundy) wywoływana, gdy zapytanie musi czekać.
+        :return: False, jeśli w trakcie czekania cancelled() zwróciło True.
+        """
+        if key is None:
+            return True
+        with self._lock:
+            now = self._clock()
+            quota = self._quota(key, model)
+            delay = max(0.0, quota.blocked_until - now)
+            if quota.requests is not None:
+                delay = max(delay, quota.requests.reserve(1, now))
+            if quota.tokens is not None and tokens:
+                delay = max(delay, quota.tokens.reserve(tokens, now))
+        if delay <= 0:
+            return True
+        with self._lock:
+            self._stats["waits"] += 1
+            self._stats["waited"] += delay
+        if on_wait:
+            on_wait(delay)
+        if self._wait(delay, cancelled):
+            return True
+        with self._lock:
+            now = self._clock()
+            if quota.requests is not None:
+                quota.requests.give_back(1, now)
+            if quota.tokens is not None and tokens:
+                quota.tokens.give_back(tokens, now)
+        return False
+
+    def charge(self, key, model, tokens):
+        """Dolicza tokeny odpowiedzi do budżetu tpm (znane dopiero po jej nadejściu)."""
+        if key is None or not tokens:
+            return
+        with self._lock:
+            quota = self._quota(key, model)
+            if quota.tokens is not None:
+                quota.tokens.charge(tokens, self._clock())
+
+    def _wait(self, seconds, cancelled=None):
+        """Śpi `seconds` sekund, sprawdzając co chwilę anulowanie. False - anulowano."""
+        deadline = self._clock() + seconds
+        while True:
+            left = deadline - self._clock()
+            if left <= 0:
+                return True
+            if cancelled is not None and cancelled():
+                return False
+            self._sleep(min(left, 0.25))
+
+    # === Ponawianie ===
+    def backoff(self, key, model, error, attempt):
+        """
+        Opóźnienie ponowienia po błędzie `error` (attempt - numer ponowienia od 0).
+        Po 429 wstrzymuje całą parę (key, model) i opróżnia jej budżet zapytań.
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        with self._lock:
+            # Rozrzut, żeby równoległe zapytania nie wróciły jednocześnie
+            delay = self._random.uniform(delay / 2, delay)
+            hint = retry_after(error)
+            if hint is not None:
+                delay = hint + self._random.uniform(0, self.base_delay)
+            self._stats["retries"] += 1
+            if error_code(error) == QUOTA_ERROR:
+                self._stats["quota_errors"] += 1
+                if key is not None:
+                    now = self._clock()
+                    quota = self._quota(key, model)
+                    quota.blocked_until = max(quota.blocked_until, now + delay)
+                    if quota.requests is not None:
+                        quota.requests.drain(now)
+        return delay
+
+    def call(self, key, model, func, tokens=0, cancelled=None, on_wait=None):
+        """
+        Wykonuje func() w budżecie pary (key, model), ponawiając je po 429 i błędach 5xx.
+        Tokeny są rezerwowane raz na całe wywołanie - ponowienie zajmuje tylko miejsce w rpm.
+        :return: Wynik func() albo None, jeśli zapytanie anulowano w trakcie czekania.
+        """
+        attempt = 0
+        while True:
+            if not self.acquire(key, model, tokens if attempt == 0 else 0, cancelled, on_wait):
+                return None
+            try:
+                return func()
+            except Exception as e:
+                code = error_code(e)
+                if (code != QUOTA_ERROR and code not in TRANSIENT_ERRORS) or attempt >= self.max_retries:
+                    raise
+                delay = self.backoff(key, model, e, attempt)
+                attempt += 1
+                print(f"Błąd {code} zapytania do modelu {model}, ponowienie {attempt} za {delay:.1f} s")
+                if code != QUOTA_ERROR or key is None:
+                    # Po 429 czeka acquire (wstrzymana para), po błędzie serwera tylko to zapytanie
+                    if on_wait:
+                        on_wait(delay)
+                    if not self._wait(delay, cancelled):
+                        return None
+
+    # === Stan ===
+    def headroom(self, key, model):
+        """
+        Stan budżetu pary: {"requests", "rpm", "tokens", "tpm", "blocked_for"}.
+        requests/tokens to None przy braku limitu.
+        """
+        with self._lock:
+            now = self._clock()
+            quota = self._quota(key, model)
+            return {
+                "requests": quota.requests.available(now) if quota.requests is not None else None,
+                "rpm": quota.requests.capacity if quota.requests is not None else None,
+                "tokens": quota.tokens.available(now) if quota.tokens is not None else None,
+                "tpm": quota.tokens.capacity if quota.tokens is not None else None,
+                "blocked_for": max(0.0, quota.blocked_until - now),
+            }
+
+    def describe(self, key, model):
+        """Krótki opis zapasu limitów do paska statusu ("" bez limitów)."""
+        if key is None:
+            return ""
+        info = self.headroom(key, model)
+        if info["blocked_for"] > 0:
+            return f"Limit API - wstrzymano na {info['blocked_for']:.0f} s"
+        parts = []
+        if info["rpm"] is not None:
+            parts.append(f"{int(info['requests'])}/{int(info['rpm'])} zap./min")
+        if info["tpm"] is not None:
+            parts.append(f"{_short(info['tokens'])}/{_short(info['tpm'])} tok./min")
+        return "Zapas: " + ", ".join(parts) if parts else ""
+
+    def stats(self):
+        """Liczba i łączny czas oczekiwań w kolejce, ponowień i błędów 429."""
+        with self._lock:
+            return dict(self._stats)
+
+
+def _short(value):
+    """1500000 -> "1.5M", 32000 -> "32k"."""
+    if value >= 1_000_000:
+        return f"{value / 1_000_000:.1f}M"
+    if value >= 1000:
+        return f"{value / 1000:.0f}k"
+    return f"{value:.0f}"
@@ -0,0 +1,144 @@
+import time
+import queue
+import itertools
+import threading
+
+
+class RequestHandle:
+    """
+    Uchwyt jednego zapytania do modelu. Anulowanie jest kooperacyjne:
+    funkcja zapytania sprawdza handle.cancelled (np. po każdym fragmencie
+    odpowiedzi strumieniowej) i sama kończy pracę.
+    """
+
+    def __init__(self, request_id, label=None):
+        self.id = request_id
+        self.label = label
+        self.error = None
+        self.submitted_at = time.perf_counter()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        self._on_cancel = []
+
+    def cancel(self):
+        """Prosi o przerwanie zapytania (czekające w kolejce nie zostanie uruchomione)."""
+        self._cancel.set()
+        for callback in list(self._on_cancel):
+            try:
+                callback()
+            except Exception as e:
+                print(f"Błąd przerywania zapytania {self.id}: {e}")
+
+    def add_cancel_callback(self, callback):
+        """Funkcja wywoływana przy anulowaniu (np. przerwanie odbioru strumienia)."""
+        self._on_cancel.append(callback)
+        if self.cancelled:
+            callback()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Czeka na zakończenie zapytania. Zwraca False, jeśli minął timeout."""
+        return self._done.wait(timeout)
+
+
+class RequestExecutor:
+    """
+    Ograniczona pula wątków wykonujących zapytania do modelu.
+    Zapytania ponad liczbę wątków czekają w kolejce FIFO. Wątki są
+    demonami, więc zawieszone połączenie sieciowe nie blokuje zamknięcia
+    aplikacji - shutdown() czeka na nie najwyżej podany czas.
+    """
+
+    def __init__(self, max_workers=2, on_finished=None):
+        """
+        :param max_workers: Maksymalna liczba równoległych zapytań.
+        :param on_finished: Funkcja wywoływana (w wątku puli) jako on_finished(uchwyt)
+                            po zakończeniu, błędzie lub anulowaniu zapytania.
+        """
+        self.max_workers = max(1, int(max_workers))
+        self.on_finished = on_finished
+        self._queue = queue.Queue()
+        self._active = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._closed = False
+        self._threads = []
+        for i in range(self.max_workers):
+            thread = threading.Thread(target=self._run, name=f"gemini-request-{i + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, func, *args, label=None):
+        """
+        Dodaje zapytanie do kolejki i natychmiast wraca.
+        :param func: Funkcja wywoływana jako func(uchwyt, *args).
+        :return: RequestHandle.
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Pula zapytań została zamknięta")
+            handle = RequestHandle(next(self._ids), label)
+            self._active[handle.id] = handle
+        self._queue.put((handle, func, args))
+        return handle
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            handle, func, args = item
+            if not handle.cancelled:
+                handle.started_at = time.perf_counter()
+                try:
+                    func(handle, *args)
+                except Exception as e:
+                    handle.error = e
+                    print(f"Błąd zapytania {handle.id}: {e}")
+            handle.finished_at = time.perf_counter()
+            with self._lock:
+                self._active.pop(handle.id, None)
+            handle._done.set()
+            if self.on_finished:
+                try:
+                    self.on_finished(handle)
+                except Exception:
+                    pass
+
+    def active(self):
+        """Zwraca uchwyty zapytań czekających lub trwających."""
+        with self._lock:
+            return list(self._active.values())
+
+    def cancel_all(self):
+        """Anuluje wszystkie czekające i trwające zapytania. Zwraca ich liczbę."""
+        handles = self.active()
+        for handle in handles:
+            handle.cancel()
+        return len(handles)
+
+    def shutdown(self, timeout=5):
+        """
+        Anuluje zapytania i zatrzymuje wątki, czekając na nie łącznie najwyżej timeout sekund.
+        :return: True, jeśli wszystkie wątki się zakończyły.
+        """
+        with self._lock:
+            if self._closed:
+                return True
+            self._closed = True
+        self.cancel_all()
+        for _ in self._threads:
+            self._queue.put(None)
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        return not any(thread.is_alive() for thread in self._threads)
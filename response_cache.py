@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Tryby pamięci podręcznej odpowiedzi (ustawiane dla każdej konwersacji osobno)
+MODE_OFF = "off"          # Zawsze pytaj model
+MODE_CACHE = "cache"      # Odpowiedz z pamięci, jeśli to samo zapytanie już padło; nowe zapamiętaj
+MODE_RECORD = "record"    # Zawsze pytaj model i nagrywaj odpowiedzi (nadpisując stare)
+MODE_REPLAY = "replay"    # Tylko nagrane odpowiedzi - bez połączenia z API
+MODES = (MODE_OFF, MODE_CACHE, MODE_RECORD, MODE_REPLAY)
+
+# Zmiana formatu nagrań unieważnia stare klucze
+RECORD_VERSION = 1
+
+
+def request_key(model_name, system_prompt, history, message, generation_config):
+    """
+    Klucz zapytania: skrót z modelu, promptu systemowego, historii (postać dla API),
+    wiadomości i parametrów generowania. Identyczne zapytania dają ten sam klucz.
+    """
+    raw = json.dumps(
+        [RECORD_VERSION, model_name, system_prompt or "", history, message, generation_config],
+        sort_keys=True, ensure_ascii=False, separators=(',', ':')
+    )
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def make_record(key, model_name, text, chunks, token_count=None):
+    """
+    Nagranie odpowiedzi.
+    :param chunks: Lista (sekundy od wysłania zapytania, tekst) kolejnych fragmentów.
+    """
+    return {
+        "key": key,
+        "model": model_name,
+        "text": text,
+        "chunks": [[round(offset, 4), chunk] for offset, chunk in chunks],
+        "token_count": token_count,
+        "recorded_at": time.time(),
+    }
+
+
+class ResponseCache:
+    """
+    Pamięć podręczna odpowiedzi modelu na dysku, adresowana treścią zapytania
+    (request_key). Każde nagranie to plik <klucz>.json; po przekroczeniu limitu
+    rozmiaru katalogu usuwane są najdawniej używane. Bezpieczna dla wątków.
+    """
+
+    def __init__(self, cache_dir, max_bytes=64 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._files = OrderedDict()  # klucz -> rozmiar pliku, od najdawniej używanego
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._scan()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def _scan(self):
+        entries = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.name.endswith(".json") and entry.is_file():
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, entry.name[:-5], stat.st_size))
+        except OSError as e:
+            print(f"Nie można przeskanować katalogu cache odpowiedzi: {e}")
+        for _, key, size in sorted(entries):
+            self._files[key] = size
+            self._bytes += size
+
+    def get(self, key):
+        """Zwraca nagranie (make_record) albo None."""
+        with self._lock:
+            if key not in self._files:
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(key), 'r', encoding='utf-8') as f:
+                    record = json.load(f)
+                os.utime(self._path(key))
+            except (OSError, ValueError) as e:
+                print(f"Uszkodzony plik cache odpowiedzi {key}: {e}")
+                self._forget(key)
+                self.misses += 1
+                return None
+            self._files.move_to_end(key)
+            self.hits += 1
+            return record
+
+    def put(self, key, record):
+        """Zapisuje nagranie (atomowo), w razie potrzeby usuwając najstarsze."""
+        data = json.dumps(record, ensure_ascii=False).encode('utf-8')
+        path = self._path(key)
+        with self._lock:
+            try:
+                with open(path + ".tmp", 'wb') as f:
+                    f.write(data)
+                os.replace(path + ".tmp", path)
+            except OSError as e:
+                print(f"Nie można zapisać cache odpowiedzi: {e}")
+                return
+            self.stores += 1
+            self._bytes -= self._files.pop(key, 0)
+            self._files[key] = len(data)
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes and len(self._files) > 1:
+                self._forget(next(iter(self._files)))
+
+    def _forget(self, key):
+        self._bytes -= self._files.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._files):
+                self._forget(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "items": len(self._files),
+                "bytes": self._bytes,
+            }
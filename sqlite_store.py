@@ -0,0 +1,344 @@
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+from conversation_store import iter_conversation_files
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    header TEXT NOT NULL,
+    created_at TEXT,
+    last_modified TEXT,
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    conversation_id TEXT NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    text TEXT NOT NULL,
+    data TEXT NOT NULL,
+    UNIQUE (conversation_id, seq)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    text, content='messages', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_au AFTER UPDATE ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    INSERT INTO messages_fts(rowid, text) VALUES (new.id, new.text);
+END;
+"""
+
+
+def _message_text(message):
+    """Łączy tekstowe części wiadomości (indeksowane przez FTS)."""
+    return "\n".join(part['text'] for part in message.get('parts', []) if 'text' in part)
+
+
+def _message_data(message):
+    return json.dumps(message, ensure_ascii=False, sort_keys=True)
+
+
+def build_fts_query(text):
+    """
+    Zamienia tekst wpisany przez użytkownika na bezpieczne zapytanie FTS5:
+    każde słowo w cudzysłowie (wszystkie muszą wystąpić), ostatnie jako prefiks.
+    """
+    words = [w.replace('"', '""') for w in text.split()]
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += '*'
+    return " ".join(terms)
+
+
+class SQLiteConversationStore:
+    """
+    Magazyn konwersacji w bazie SQLite (tabele conversations i messages)
+    z indeksem pełnotekstowym FTS5 nad treścią wiadomości.
+    Ma ten sam interfejs co ConversationStore, więc aplikacja może używać
+    dowolnego z nich. Każdy wątek dostaje własne połączenie z bazą.
+    """
+
+    def __init__(self, db_path):
+        """
+        :param db_path: Ścieżka do pliku bazy danych.
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        conn = self._conn()
+        with conn:
+            conn.executescript(SCHEMA)
+            try:
+                conn.executescript(FTS_SCHEMA)
+                self.has_fts = True
+            except sqlite3.OperationalError as e:
+                # SQLite bez FTS5 - wyszukiwanie przez LIKE
+                print(f"FTS5 niedostępne, wyszukiwanie będzie wolniejsze: {e}")
+                self.has_fts = False
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    # === Lista konwersacji ===
+    def list_conversations(self, refresh=True):
+        """Zwraca metadane wszystkich konwersacji posortowane po nazwie."""
+        rows = self._conn().execute(
+            "SELECT id, name, created_at, last_modified, message_count "
+            "FROM conversations ORDER BY name COLLATE NOCASE"
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_metadata(self, conv_id):
+        row = self._conn().execute(
+            "SELECT id, name, created_at, last_modified, message_count FROM conversations WHERE id = ?",
+            (conv_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    # === Odczyt ===
+    def _load_header(self, conn, conv_id):
+        row = conn.execute("SELECT header FROM conversations WHERE id = ?", (conv_id,)).fetchone()
+        return json.loads(row["header"]) if row else None
+
+    def load(self, conv_id):
+        """:return: Krotka (nagłówek, historia) lub None."""
+        conn = self._conn()
+        header = self._load_header(conn, conv_id)
+        if header is None:
+            return None
+        return header, self.load_range(conv_id, 0, None)
+
+    def load_tail(self, conv_id, count):
+        """:return: Krotka (nagłówek, ostatnie `count` wiadomości, indeks pierwszej) lub None."""
+        conn = self._conn()
+        header = self._load_header(conn, conv_id)
+        if header is None:
+            return None
+        total = self.message_count(conv_id)
+        start = max(0, total - count)
+        return header, self.load_range(conv_id, start, total), start
+
+    def load_range(self, conv_id, start, end):
+        """Wczytuje wiadomości o indeksach [start, end); end=None oznacza do końca."""
+        if end is None:
+            end = 1 << 62
+        rows = self._conn().execute(
+            "SELECT data FROM messages WHERE conversation_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+            (conv_id, start, end)
+        ).fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    def message_count(self, conv_id):
+        row = self._conn().execute(
+            "SELECT message_count FROM conversations WHERE id = ?", (conv_id,)
+        ).fetchone()
+        return row["message_count"] if row else 0
+
+    # === Zapis ===
+    def create(self, conv_id, header):
+        """Tworzy nową, pustą konwersację."""
+        now = datetime.now().isoformat()
+        header = dict(header)
+        header["id"] = conv_id
+        header.setdefault("created_at", now)
+        header["last_modified"] = now
+        with self._write_lock, self._conn() as conn:
+            self._write_header(conn, conv_id, header, 0)
+
+    def _write_header(self, conn, conv_id, header, message_count):
+        conn.execute(
+            "INSERT INTO conversations (id, name, header, created_at, last_modified, message_count) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET name = excluded.name, header = excluded.header, "
+            "last_modified = excluded.last_modified, message_count = excluded.message_count",
+            (conv_id, header.get("name", conv_id), json.dumps(header, ensure_ascii=False),
+             header.get("created_at"), header.get("last_modified"), message_count)
+        )
+
+    def save(self, conv_id, header, history, start=0):
+        """
+        Zapisuje konwersację w jednej transakcji. Jeśli zapisane wiadomości
+        są prefiksem historii, wstawiane są tylko nowe wiersze; w przeciwnym
+        razie przepisywane są wiadomości od indeksu `start`.
+        """
+        with self._write_lock, self._conn() as conn:
+            old_header = self._load_header(conn, conv_id) or {"id": conv_id}
+            new_header = dict(old_header)
+            new_header.update(header)
+            new_header["id"] = conv_id
+            new_header.setdefault("created_at", datetime.now().isoformat())
+            new_header["last_modified"] = datetime.now().isoformat()
+
+            count = self.message_count(conv_id)
+            first_new = count
+            if count > start + len(history) or not self._is_prefix(conn, conv_id, count, history, start):
+                conn.execute(
+                    "DELETE FROM messages WHERE conversation_id = ? AND seq >= ?",
+                    (conv_id, start)
+                )
+                first_new = start
+
+            self._write_header(conn, conv_id, new_header, start + len(history))
+            self._insert_messages(conn, conv_id, first_new, history[first_new - start:])
+
+    def save_batch(self, conversations):
+        """
+        Zapisuje wiele całych konwersacji w jednej transakcji (np. przy imporcie).
+        :param conversations: Lista krotek (id, nagłówek, historia).
+        """
+        now = datetime.now().isoformat()
+        with self._write_lock, self._conn() as conn:
+            for conv_id, header, history in conversations:
+                header = dict(header)
+                header["id"] = conv_id
+                header.setdefault("created_at", now)
+                header["last_modified"] = now
+                conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conv_id,))
+                self._write_header(conn, conv_id, header, len(history))
+                self._insert_messages(conn, conv_id, 0, history)
+
+    def append(self, conv_id, messages, header=None):
+        """Dopisuje wiadomości na końcu konwersacji i ewentualnie zmienia pola nagłówka."""
+        with self._write_lock, self._conn() as conn:
+            new_header = self._load_header(conn, conv_id)
+            if new_header is None:
+                raise KeyError(f"Konwersacja {conv_id} nie istnieje")
+            new_header.update(header or {})
+            new_header["id"] = conv_id
+            new_header["last_modified"] = datetime.now().isoformat()
+            count = self.message_count(conv_id)
+            self._write_header(conn, conv_id, new_header, count + len(messages))
+            self._insert_messages(conn, conv_id, count, messages)
+
+    def _is_prefix(self, conn, conv_id, count, history, start):
+        """Czy wszystkie zapisane wiadomości [start, count) są równe początkowi historii."""
+        if count <= start:
+            return count == start
+        rows = conn.execute(
+            "SELECT data FROM messages WHERE conversation_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+            (conv_id, start, count)
+        ).fetchall()
+        if len(rows) != count - start:
+            return False
+        return all(row["data"] == _message_data(message) for row, message in zip(rows, history))
+
+    @staticmethod
+    def _insert_messages(conn, conv_id, first_seq, messages):
+        conn.executemany(
+            "INSERT INTO messages (conversation_id, seq, role, text, data) VALUES (?, ?, ?, ?, ?)",
+            [
+                (conv_id, first_seq + i, m.get("role", ""), _message_text(m), _message_data(m))
+                for i, m in enumerate(messages)
+            ]
+        )
+
+    def delete(self, conv_id):
+        """:return: True, jeśli konwersacja istniała."""
+        with self._write_lock, self._conn() as conn:
+            conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conv_id,))
+            cursor = conn.execute("DELETE FROM conversations WHERE id = ?", (conv_id,))
+            return cursor.rowcount > 0
+
+    def close(self):
+        """Zamyka połączenie bieżącego wątku."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # === Wyszukiwanie ===
+    def search(self, text, limit=50):
+        """
+        Wyszukuje wiadomości we wszystkich konwersacjach.
+        :return: Lista trafień posortowana od najlepszego: słowniki z polami
+                 conversation_id, name, seq, role, snippet.
+        """
+        conn = self._conn()
+        if self.has_fts:
+            query = build_fts_query(text)
+            if not query:
+                return []
+            rows = conn.execute(
+                "SELECT m.conversation_id, c.name, m.seq, m.role, "
+                "snippet(messages_fts, 0, '[', ']', '…', 12) AS snippet "
+                "FROM messages_fts "
+                "JOIN messages m ON m.id = messages_fts.rowid "
+                "JOIN conversations c ON c.id = m.conversation_id "
+                "WHERE messages_fts MATCH ? "
+                "ORDER BY bm25(messages_fts) LIMIT ?",
+                (query, limit)
+            ).fetchall()
+        else:
+            text = text.strip()
+            if not text:
+                return []
+            rows = conn.execute(
+                "SELECT m.conversation_id, c.name, m.seq, m.role, substr(m.text, 1, 120) AS snippet "
+                "FROM messages m JOIN conversations c ON c.id = m.conversation_id "
+                "WHERE m.text LIKE ? ORDER BY c.last_modified DESC LIMIT ?",
+                (f"%{text}%", limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    # === Import ===
+    def get_meta(self, key, default=None):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else default
+
+    def set_meta(self, key, value):
+        with self._write_lock, self._conn() as conn:
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, value)
+            )
+
+    def import_conversation_files(self, conversations_dir, progress=None):
+        """
+        Jednorazowy import plików .json/.jsonl z katalogu konwersacji.
+        Konwersacje już obecne w bazie są pomijane, więc import można powtórzyć.
+        :param progress: Opcjonalna funkcja progress(liczba_zaimportowanych).
+        :return: Liczba zaimportowanych konwersacji.
+        """
+        imported = 0
+        if not os.path.isdir(conversations_dir):
+            return imported
+        for conv_id, header, history in iter_conversation_files(conversations_dir):
+            if self.get_metadata(conv_id) is not None:
+                continue
+            with self._write_lock, self._conn() as conn:
+                self._write_header(conn, conv_id, header, len(history))
+                self._insert_messages(conn, conv_id, 0, history)
+            imported += 1
+            if progress:
+                progress(imported)
+        self.set_meta("json_import_done", datetime.now().isoformat())
+        return imported
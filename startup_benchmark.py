@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Pomiar czasu startu Gemini Chat Pro.
+
+Uruchamia aplikację kilka razy w osobnych procesach na tymczasowym katalogu
+danych z wygenerowanymi konwersacjami (GEMINI_CHAT_DATA_DIR) w trybie
+GEMINI_CHAT_STARTUP_BENCHMARK. Aplikacja sama mierzy etapy startu, wypisuje
+je i kończy pracę. Pierwsze uruchomienie buduje indeks konwersacji ("zimny"
+start), kolejne korzystają z gotowego indeksu.
+
+Przykład:
+    python startup_benchmark.py --runs 5 --conversations 2000
+    python startup_benchmark.py --importtime
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+from conversation_store import ConversationStore
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_SCRIPT = os.path.join(APP_DIR, "Gemini_chat_pro.py")
+MARKER = "STARTUP_BENCHMARK "
+STAGES = ("imports", "window_mapped", "first_paint", "conversations_loaded")
+
+
+def seed_data_dir(data_dir, conversations, messages):
+    """Tworzy katalog danych z podaną liczbą konwersacji po `messages` wiadomości."""
+    conversations_dir = os.path.join(data_dir, "conversations")
+    os.makedirs(conversations_dir, exist_ok=True)
+    store = ConversationStore(conversations_dir, os.path.join(data_dir, "conversations_index.json"))
+    for i in range(conversations):
+        history = []
+        for j in range(messages):
+            role = "user" if j % 2 == 0 else "model"
+            history.append({"role": role, "parts": [{"text": f"Wiadomość {j} w konwersacji {i}. " * 5}]})
+        store.save(f"bench-{i:06d}", {"name": f"Konwersacja {i}", "system_prompt": ""}, history)
+    # Indeks ma zbudować dopiero aplikacja przy pierwszym uruchomieniu
+    index_file = os.path.join(data_dir, "conversations_index.json")
+    if os.path.exists(index_file):
+        os.remove(index_file)
+
+
+def run_app(data_dir, timeout):
+    """Uruchamia aplikację raz. Zwraca słownik czasów etapów (sekundy)."""
+    env = dict(os.environ)
+    env["GEMINI_CHAT_DATA_DIR"] = data_dir
+    env["GEMINI_CHAT_STARTUP_BENCHMARK"] = "1"
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, APP_SCRIPT], env=env, cwd=APP_DIR,
+        capture_output=True, text=True, timeout=timeout
+    )
+    total = time.perf_counter() - started
+    for line in proc.stdout.splitlines():
+        if line.startswith(MARKER):
+            result = json.loads(line[len(MARKER):])
+            result["process_total"] = total
+            return result
+    raise RuntimeError(f"Aplikacja nie zwróciła wyniku (kod {proc.returncode}):\n{proc.stderr[-2000:]}")
+
+
+def import_profile(limit):
+    """Najwolniejsze importy modułu aplikacji według python -X importtime."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import Gemini_chat_pro"],
+        cwd=APP_DIR, capture_output=True, text=True
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time:   self [us] | cumulative | nazwa modułu"
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def report(label, results):
+    print(f"\n{label} ({len(results)} uruchomień):")
+    for stage in STAGES + ("process_total",):
+        values = [r[stage] * 1000 for r in results if stage in r]
+        if values:
+            print(f"  {stage:<22} mediana {statistics.median(values):8.1f} ms   min {min(values):8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pomiar czasu startu Gemini Chat Pro.")
+    parser.add_argument("--runs", type=int, default=5, help="Liczba uruchomień z gotowym indeksem")
+    parser.add_argument("--conversations", type=int, default=500, help="Liczba wygenerowanych konwersacji")
+    parser.add_argument("--messages", type=int, default=20, help="Liczba wiadomości w konwersacji")
+    parser.add_argument("--timeout", type=float, default=120, help="Limit czasu jednego uruchomienia (s)")
+    parser.add_argument("--importtime", type=int, nargs="?", const=15, default=0,
+                        help="Pokaż N najwolniejszych importów (python -X importtime)")
+    parser.add_argument("--json", action="store_true", help="Wypisz surowe wyniki jako JSON")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="gemini_chat_startup_")
+    try:
+        print(f"Generowanie {args.conversations} konwersacji w {data_dir}...")
+        seed_data_dir(data_dir, args.conversations, args.messages)
+
+        cold = [run_app(data_dir, args.timeout)]
+        warm = [run_app(data_dir, args.timeout) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps({"cold": cold, "warm": warm}, indent=2))
+    else:
+        report("Zimny start (budowa indeksu)", cold)
+        report("Start z gotowym indeksem", warm)
+        if any(r.get("sdk_loaded") for r in cold + warm):
+            print("\nUwaga: SDK Gemini zostało zaimportowane przed wczytaniem listy konwersacji.")
+
+    if args.importtime:
+        print("\nNajwolniejsze importy (łącznie / własny czas, ms):")
+        for cumulative_us, self_us, name in import_profile(args.importtime):
+            print(f"  {cumulative_us / 1000:8.1f} {self_us / 1000:8.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
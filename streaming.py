@@ -0,0 +1,163 @@
+import re
+import time
+import queue
+
+# Ten sam podział co w display_message: $$...$$ (blok) lub $...$ (inline)
+LATEX_PATTERN = re.compile(r'\$\$[^$]+\$\$|\$[^$]+\$')
+
+# Powyżej tylu znaków bez zamykającego '$' znak dolara jest traktowany jak zwykły tekst,
+# żeby pojedyncze "$5" nie wstrzymało wyświetlania reszty odpowiedzi
+MAX_OPEN_LATEX_CHARS = 2000
+
+
+def split_message_text(text):
+    """
+    Dzieli tekst wiadomości na segmenty do wyświetlenia:
+    ('text', tekst), ('latex', wyrażenie, block_mode).
+    """
+    segments = []
+    for part in re.split(r'(\$\$[^$]+\$\$|\$[^$]+\$)', text):
+        if not part:
+            continue
+        if part.startswith('$$') and part.endswith('$$') and len(part) > 4:
+            segments.append(('latex', part[2:-2].strip(), True))
+        elif part.startswith('$') and part.endswith('$') and len(part) > 2:
+            segments.append(('latex', part[1:-1].strip(), False))
+        else:
+            segments.append(('text', part))
+    return segments
+
+
+class StreamingReply:
+    """
+    Stan jednej odpowiedzi modelu odbieranej strumieniowo.
+    Wątek zapytania wkłada fragmenty do kolejki (put_text / put_done / put_error),
+    a wątek Tk co kilkadziesiąt milisekund odbiera je partiami (drain)
+    i dostaje segmenty gotowe do wyświetlenia. Wyrażenia LaTeX są zwracane
+    dopiero po domknięciu, do tego czasu tekst od '$' czeka w buforze.
+    """
+
+    def __init__(self, conversation_id=None):
+        self.conversation_id = conversation_id  # Konwersacja, do której należy odpowiedź
+        self.queue = queue.Queue()
+        self.text = ""          # Cała dotąd odebrana treść
+        self._pending = ""      # Odebrany, jeszcze niewyświetlony ogon
+        self.done = False
+        self.error = None
+        self.cancelled = False
+        self.token_count = None  # Z usage_metadata, jeśli API je podało
+        self.context = None      # ContextPlan zapytania (ile tokenów wysłano, ile pominięto)
+
+        self.started_at = time.perf_counter()
+        self.first_token_at = None
+        self.finished_at = None
+
+    # === Wątek zapytania ===
+    def put_text(self, text):
+        self.queue.put(('text', text, time.perf_counter()))
+
+    def put_done(self, token_count=None):
+        self.queue.put(('done', token_count, time.perf_counter()))
+
+    def put_error(self, error):
+        self.queue.put(('error', error, time.perf_counter()))
+
+    def put_cancelled(self):
+        """Kończy odpowiedź na żądanie użytkownika - to, co już przyszło, zostaje."""
+        self.queue.put(('cancelled', None, time.perf_counter()))
+
+    # === Wątek Tk ===
+    def drain(self):
+        """
+        Odbiera wszystko, co czeka w kolejce.
+        :return: Lista segmentów do dopisania (jak w split_message_text).
+        """
+        received = []
+        while True:
+            try:
+                kind, value, at = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'text':
+                if self.done:
+                    continue
+                if self.first_token_at is None:
+                    self.first_token_at = at
+                received.append(value)
+            elif not self.done:
+                if kind == 'error':
+                    self.error = value
+                elif kind == 'cancelled':
+                    self.cancelled = True
+                else:
+                    self.token_count = value
+                self.done = True
+                self.finished_at = at
+
+        if received:
+            chunk = "".join(received)
+            self.text += chunk
+            self._pending += chunk
+        return self._take_segments(final=self.done)
+
+    def _take_segments(self, final=False):
+        """Zwraca segmenty z bufora, zostawiając w nim niedomknięte wyrażenie LaTeX."""
+        pending = self._pending
+        if final:
+            self._pending = ""
+            return split_message_text(pending)
+
+        segments = []
+        pos = 0
+        while True:
+            dollar = pending.find('$', pos)
+            if dollar < 0:
+                if pos < len(pending):
+                    segments.append(('text', pending[pos:]))
+                pos = len(pending)
+                break
+            if dollar > pos:
+                segments.append(('text', pending[pos:dollar]))
+            match = LATEX_PATTERN.match(pending, dollar)
+            if match:
+                segments.extend(split_message_text(match.group(0)))
+                pos = match.end()
+            elif len(pending) - dollar > MAX_OPEN_LATEX_CHARS:
+                segments.append(('text', '$'))
+                pos = dollar + 1
+            else:
+                pos = dollar
+                break
+        self._pending = pending[pos:]
+        return segments
+
+    @property
+    def shown_text(self):
+        """Treść oddana już do wyświetlenia (bez czekającego w buforze ogona)."""
+        return self.text[:len(self.text) - len(self._pending)]
+
+    # === Statystyki ===
+    @property
+    def time_to_first_token(self):
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    @property
+    def tokens_per_second(self):
+        if self.first_token_at is None or self.finished_at is None:
+            return None
+        # Bez usage_metadata szacujemy ok. 4 znaki na token
+        tokens = self.token_count if self.token_count else len(self.text) / 4
+        elapsed = self.finished_at - self.first_token_at
+        return tokens / elapsed if elapsed > 0 else None
+
+    def summary(self):
+        """Krótki opis do paska statusu."""
+        parts = []
+        if self.time_to_first_token is not None:
+            parts.append(f"pierwszy token po {self.time_to_first_token:.2f} s")
+        if self.tokens_per_second is not None:
+            estimated = "" if self.token_count else "~"
+            parts.append(f"{estimated}{self.tokens_per_second:.1f} tok/s")
+        return ", ".join(parts)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Generator syntetycznego katalogu danych Gemini Chat Pro do pomiarów.
+
+Tworzy konwersacje o zróżnicowanej długości (kilka bardzo długich, wiele
+krótkich) z zadanym udziałem wiadomości pełnych wzorów LaTeX. Wynik jest
+powtarzalny dla tego samego ziarna. Katalog można wskazać aplikacji przez
+GEMINI_CHAT_DATA_DIR; dostaje własny config.json z lokalnym modelem testowym.
+
+Przykład:
+    python synthetic_corpus.py /tmp/corpus --conversations 5000 --messages 500000 --math 0.1
+"""
+import os
+import json
+import time
+import random
+import argparse
+
+from context_builder import with_token_count
+from conversation_store import ConversationStore
+from sqlite_store import SQLiteConversationStore
+
+WORDS = (
+    "model odpowiedź pytanie dane funkcja wynik przykład wartość zbiór liczba "
+    "wektor macierz równanie rozwiązanie metoda analiza kod plik lista słownik "
+    "wątek zapytanie kontekst tekst obraz tabela klucz indeks czas pamięć"
+).split()
+
+INLINE_MATH = (
+    r"x^2 + y^2 = r^2", r"\alpha + \beta = \gamma", r"\frac{a}{b}", r"e^{i\pi} + 1 = 0",
+    r"\sqrt{x_1^2 + x_2^2}", r"\sum_{i=1}^{n} i", r"\lim_{x \to 0} \frac{\sin x}{x}",
+    r"\nabla \cdot E = \frac{\rho}{\epsilon_0}", r"P(A \mid B)", r"\int_0^1 x\,dx",
+)
+BLOCK_MATH = (
+    r"\int_{-\infty}^{\infty} e^{-x^2}\,dx = \sqrt{\pi}",
+    r"\sum_{k=0}^{\infty} \frac{x^k}{k!} = e^x",
+    r"\frac{\partial^2 u}{\partial t^2} = c^2 \nabla^2 u",
+    r"\det(A - \lambda I) = 0",
+    r"f(x) = \frac{1}{\sigma\sqrt{2\pi}} e^{-\frac{(x-\mu)^2}{2\sigma^2}}",
+)
+
+
+def sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def message_text(rng, role, math):
+    """Treść jednej wiadomości; math=True - kilkanaście wzorów inline i kilka blokowych."""
+    if role == "user":
+        return " ".join(sentence(rng, rng.randint(5, 15)) for _ in range(rng.randint(1, 3)))
+    parts = [sentence(rng, rng.randint(8, 20)) for _ in range(rng.randint(2, 8))]
+    if not math:
+        return " ".join(parts)
+    text = []
+    for part in parts:
+        text.append(part)
+        for _ in range(rng.randint(1, 3)):
+            # Część wzorów się powtarza, część jest unikalna - jak w prawdziwych rozmowach
+            expression = rng.choice(INLINE_MATH)
+            if rng.random() < 0.3:
+                expression += f" + {rng.randint(1, 999)}"
+            text.append(f"Dla ${expression}$ mamy {rng.choice(WORDS)}.")
+        if rng.random() < 0.5:
+            text.append(f"\n$${rng.choice(BLOCK_MATH)}$$\n")
+    return " ".join(text)
+
+
+def conversation_sizes(rng, conversations, messages):
+    """Dzieli `messages` wiadomości między konwersacje (rozkład z długim ogonem, parzyste liczby)."""
+    # Ograniczenie wag - pojedyncza konwersacja nie zabiera większości korpusu
+    weights = [min(rng.paretovariate(1.2), 50.0) for _ in range(conversations)]
+    total = sum(weights)
+    sizes = [max(2, int(messages * w / total) // 2 * 2) for w in weights]
+    # Wyrównanie sumy do zadanej liczby wiadomości
+    diff = messages - sum(sizes)
+    i = 0
+    while diff >= 2 or (diff <= -2 and any(s > 2 for s in sizes)):
+        step = 2 if diff > 0 else -2
+        if sizes[i % conversations] + step >= 2:
+            sizes[i % conversations] += step
+            diff -= step
+        i += 1
+    return sizes
+
+
+def generate_corpus(data_dir, conversations=500, messages=10000, math_ratio=0.1, seed=0,
+                    storage="journal", progress=None):
+    """
+    Tworzy katalog danych z konwersacjami.
+    :param messages: Łączna liczba wiadomości we wszystkich konwersacjach.
+    :param math_ratio: Udział wiadomości z dużą liczbą wzorów LaTeX (0-1, najwyżej 0.5).
+    :param storage: "journal", "json" lub "sqlite" (jak storage_mode / storage_backend).
+    :param progress: Opcjonalna funkcja progress(liczba_zapisanych_konwersacji).
+    :return: Słownik z opisem korpusu (zapisywany też jako corpus.json).
+    """
+    rng = random.Random(seed)
+    conversations_dir = os.path.join(data_dir, "conversations")
+    os.makedirs(conversations_dir, exist_ok=True)
+    index_file = os.path.join(data_dir, "conversations_index.json")
+    if storage == "sqlite":
+        store = SQLiteConversationStore(os.path.join(data_dir, "conversations.db"))
+        # Aplikacja nie ma czego importować z plików
+        store.set_meta("json_import_done", "synthetic")
+    else:
+        store = ConversationStore(conversations_dir, index_file, mode=storage)
+
+    started = time.perf_counter()
+    sizes = conversation_sizes(rng, conversations, messages)
+    math_messages = 0
+    for i, size in enumerate(sizes):
+        history = []
+        for j in range(size):
+            role = "user" if j % 2 == 0 else "model"
+            # Wzory są tylko w odpowiedziach modelu (połowa wiadomości)
+            math = role == "model" and rng.random() < math_ratio * 2
+            math_messages += math
+            history.append(with_token_count({"role": role, "parts": [{"text": message_text(rng, role, math)}]}))
+        store.save(f"synthetic-{i:06d}", {"name": f"Konwersacja {i}", "system_prompt": ""}, history)
+        if progress and (i + 1) % 100 == 0:
+            progress(i + 1)
+    store.close()
+
+    config = {"model_backend": "mock", "mock_backend": {"latency": 0.05, "seed": seed}}
+    if storage == "sqlite":
+        config["storage_backend"] = "sqlite"
+    else:
+        config["storage_mode"] = storage
+    with open(os.path.join(data_dir, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+
+    info = {
+        "conversations": conversations,
+        "messages": sum(sizes),
+        "math_messages": math_messages,
+        "longest": max(sizes),
+        "math_ratio": math_ratio,
+        "seed": seed,
+        "storage": storage,
+        "generated_in": time.perf_counter() - started,
+    }
+    with open(os.path.join(data_dir, "corpus.json"), "w", encoding="utf-8") as f:
+        json.dump(info, f, indent=2)
+    return info
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generator syntetycznych konwersacji do pomiarów.")
+    parser.add_argument("data_dir", help="Katalog danych do utworzenia")
+    parser.add_argument("--conversations", type=int, default=5000, help="Liczba konwersacji")
+    parser.add_argument("--messages", type=int, default=500000, help="Łączna liczba wiadomości")
+    parser.add_argument("--math", type=float, default=0.1, help="Udział wiadomości z wzorami LaTeX (0-1)")
+    parser.add_argument("--seed", type=int, default=0, help="Ziarno losowania")
+    parser.add_argument("--storage", choices=("journal", "json", "sqlite"), default="journal",
+                        help="Format zapisu konwersacji")
+    args = parser.parse_args()
+
+    info = generate_corpus(
+        args.data_dir, args.conversations, args.messages, args.math, args.seed, args.storage,
+        progress=lambda n: print(f"  zapisano {n}/{args.conversations} konwersacji", end="\r", flush=True)
+    )
+    print()
+    print(json.dumps(info, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import os
+import json
+
+import pytest
+
+from conversation_store import ConversationStore, COMPACT_META_THRESHOLD
+
+
+def message(text, role="user"):
+    return {"role": role, "parts": [{"text": text}]}
+
+
+def texts(messages):
+    return [m["parts"][0]["text"] for m in messages]
+
+
+def journal_records(store, conv_id):
+    with open(store.journal_path(conv_id), 'rb') as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def store(tmp_path):
+    (tmp_path / "conversations").mkdir()
+    return ConversationStore(str(tmp_path / "conversations"), str(tmp_path / "index.json"))
+
+
+@pytest.fixture
+def reopen(tmp_path):
+    """Nowy magazyn na tych samych plikach (bez stanu w pamięci, jak po ponownym starcie)."""
+    def make():
+        return ConversationStore(str(tmp_path / "conversations"), str(tmp_path / "index.json"))
+    return make
+
+
+def tear_last_line(store, conv_id, cut=10):
+    """Obcina koniec dziennika jak awaria w trakcie dopisywania rekordu."""
+    path = store.journal_path(conv_id)
+    os.truncate(path, os.path.getsize(path) - cut)
+
+
+# === Urwany ostatni rekord ===
+def test_append_after_torn_line_repairs_journal(store, reopen):
+    store.save("c", {"name": "C"}, [message("a"), message("b")])
+    tear_last_line(store, "c")
+
+    store.append("c", [message("d")])
+
+    records = journal_records(store, "c")  # każda linia to pełny JSON
+    assert [r["t"] for r in records] == ["header", "msg", "msg"]
+    assert texts(reopen().load("c")[1]) == ["a", "d"]
+
+
+def test_save_after_torn_line_rewrites_journal(store, reopen):
+    store.save("c", {"name": "C"}, [message("a"), message("b")])
+    tear_last_line(store, "c")
+
+    store.save("c", {"name": "C"}, [message("a"), message("b"), message("c")])
+
+    journal_records(store, "c")  # każda linia to pełny JSON
+    assert texts(reopen().load("c")[1]) == ["a", "b", "c"]
+
+
+def test_torn_header_is_repaired(store, reopen):
+    store.save("c", {"name": "C"}, [])
+    os.truncate(store.journal_path("c"), 5)
+
+    store.append("c", [message("z")], {"name": "C2"})
+
+    header, history = reopen().load("c")
+    assert header["name"] == "C2"
+    assert texts(history) == ["z"]
+
+
+# === Edycja historii ===
+def test_appending_keeps_existing_bytes(store):
+    store.save("c", {"name": "C"}, [message("a"), message("b")])
+    with open(store.journal_path("c"), 'rb') as f:
+        before = f.read()
+
+    store.save("c", {"name": "C"}, [message("a"), message("b"), message("c")])
+
+    with open(store.journal_path("c"), 'rb') as f:
+        assert f.read().startswith(before)
+
+
+@pytest.mark.parametrize("edited", [0, 1])
+def test_mid_history_edit_forces_rewrite(store, reopen, edited):
+    history = [message("a"), message("b", "model"), message("c")]
+    store.save("c", {"name": "C"}, history)
+    changed = list(history)
+    changed[edited] = message("EDYCJA", changed[edited]["role"])
+
+    store.save("c", {"name": "C"}, changed)
+
+    assert texts(reopen().load("c")[1]) == texts(changed)
+    kinds = [r["t"] for r in journal_records(store, "c")]
+    assert kinds == ["header", "msg", "msg", "msg"]
+
+
+def test_edit_inside_loaded_tail_forces_rewrite(store, reopen):
+    store.save("c", {"name": "C"}, [message(str(i)) for i in range(10)])
+    fresh = reopen()
+    _, tail, start = fresh.load_tail("c", 4)
+    assert start == 6
+    tail[1] = message("EDYCJA")
+
+    fresh.save("c", {"name": "C"}, tail + [message("10")], start=start)
+
+    expected = [str(i) for i in range(10)] + ["10"]
+    expected[7] = "EDYCJA"
+    assert texts(reopen().load("c")[1]) == expected
+
+
+def test_last_modified_alone_writes_no_meta_record(store, reopen):
+    store.save("c", {"name": "C"}, [message("a")])
+    store.save("c", {"name": "C"}, [message("a"), message("b")])
+    store.save("c", {"name": "C"}, [message("a"), message("b")])
+
+    assert [r["t"] for r in journal_records(store, "c")] == ["header", "msg", "msg"]
+    assert reopen().load("c")[0]["last_modified"] == store.load("c")[0]["last_modified"]
+
+
+# === Odczyt przez indeks przesunięć ===
+def assert_reads_match(store, conv_id):
+    header, history = store.load(conv_id)
+    for count in (1, 3, len(history), len(history) + 5):
+        tail_header, tail, start = store.load_tail(conv_id, count)
+        assert tail_header == header
+        assert start == max(0, len(history) - count)
+        assert tail == history[start:]
+    for start, end in ((0, 2), (2, 5), (len(history) - 1, len(history) + 3)):
+        assert store.load_range(conv_id, start, end) == history[start:end]
+    assert store.message_count(conv_id) == len(history)
+
+
+def test_tail_and_range_match_load_after_appends(store, reopen):
+    history = []
+    for i in range(8):
+        history.append(message(f"pytanie {i}"))
+        history.append(message(f"odpowiedź {i}", "model"))
+        store.save("c", {"name": f"C{i % 3}"}, history)
+        if i % 3 == 0:
+            store.append("c", [message(f"w tle {i}", "model")])
+            history = store.load("c")[1]
+
+    assert_reads_match(store, "c")
+    assert_reads_match(reopen(), "c")
+
+
+def test_tail_and_range_match_load_after_compaction(store, reopen):
+    history = [message("a")]
+    store.save("c", {"name": "C"}, history)
+    # Poniżej progu - kompaktowanie w tle się nie uruchamia, test wywołuje je sam
+    for i in range(COMPACT_META_THRESHOLD - 1):
+        history = history + [message(f"m{i}")]
+        store.save("c", {"name": f"C{i}"}, history)
+    before = store.load("c")
+    reader = reopen()
+    reader.load_tail("c", 5)  # zbudowany plik .offsets
+
+    store._compact("c")
+
+    records = journal_records(store, "c")
+    assert [r["t"] for r in records].count("meta") == 0
+    assert store.load("c") == before
+    assert_reads_match(reader, "c")
+    assert_reads_match(reopen(), "c")
+
+
+# === Plik .offsets ===
+def test_offsets_sidecar_is_reused(store, reopen):
+    store.save("c", {"name": "C"}, [message("a" * i) for i in range(1, 30)])
+    store.load_tail("c", 2)
+    assert os.path.exists(store.offsets_path("c"))
+    store.save("c", {"name": "C"}, [message("a" * i) for i in range(1, 32)])
+
+    assert_reads_match(reopen(), "c")
+
+
+def test_offsets_sidecar_from_another_journal_is_rejected(store, reopen):
+    store.save("c", {"name": "C"}, [message("a" * i) for i in range(1, 30)])
+    store.load_tail("c", 2)
+    with open(store.offsets_path("c"), 'rb') as f:
+        sidecar = f.read()
+
+    # Awaria tuż po przepisaniu dziennika: nowy plik, stary .offsets
+    other = [message("b" * i) for i in range(40)]
+    store.save("c", {"name": "INNY NAGŁÓWEK, DŁUŻSZY"}, other)
+    with open(store.offsets_path("c"), 'wb') as f:
+        f.write(sidecar)
+
+    fresh = reopen()
+    header, tail, start = fresh.load_tail("c", 2)
+    assert header["name"] == "INNY NAGŁÓWEK, DŁUŻSZY"
+    assert (tail, start) == (other[-2:], 38)
+    assert_reads_match(fresh, "c")
+
+
+def test_offsets_sidecar_in_old_format_is_rebuilt(store, reopen):
+    store.save("c", {"name": "C"}, [message(str(i)) for i in range(5)])
+    store.load_tail("c", 2)
+    with open(store.offsets_path("c"), 'wb') as f:
+        f.write(b"\0" * 64)
+
+    assert_reads_match(reopen(), "c")
@@ -0,0 +1,121 @@
+import threading
+import time
+
+from Gemini_chat_pro import GeminiChatApp
+from chat_sessions import ChatSessionCache
+from context_builder import ContextBuilder
+from instrumentation import Tracer
+from model_backend import MockBackend
+from rate_limiter import RateLimiter
+from request_executor import RequestHandle
+from response_cache import ResponseCache, make_record, MODE_RECORD, MODE_REPLAY
+from streaming import StreamingReply
+
+MESSAGE = "Jak działa pamięć podręczna?"
+
+
+class NoNetworkBackend:
+    """Backend, który nie może być użyty - każde wywołanie kończy test błędem."""
+
+    requires_api_key = False
+
+    def __getattr__(self, name):
+        raise AssertionError(f"Tryb odtwarzania użył backendu ({name})")
+
+
+def make_app(tmp_path, backend, replay_speed=0):
+    """Aplikacja bez okna Tk - tylko to, czego potrzebuje ścieżka zapytania."""
+    app = GeminiChatApp.__new__(GeminiChatApp)
+    app.config = {"response_replay_speed": replay_speed}
+    app.tracer = Tracer()
+    app.context_builder = ContextBuilder()
+    app.model_name = "mock-model"
+    app.backend = backend
+    app.api_key = None
+    app._backend_key = None
+    app._backend_lock = threading.Lock()
+    app.rate_limiter = RateLimiter()
+    app.chat_sessions = ChatSessionCache(backend.open_chat) if isinstance(backend, MockBackend) else None
+    app.context_cache = None
+    app.response_cache = ResponseCache(str(tmp_path / "responses"))
+    return app
+
+
+def make_request(mode):
+    return {
+        "conversation_id": "conv",
+        "system_prompt": "Jesteś pomocnym asystentem.",
+        "history": [{"role": "user", "parts": [{"text": MESSAGE}]}],
+        "summary": None,
+        "max_output_tokens": 256,
+        "response_cache": mode,
+    }
+
+
+def run_turn(app, mode):
+    """Jedna wymiana w trybie strumieniowym; zwraca elementy kolejki odpowiedzi (rodzaj, wartość)."""
+    reply = StreamingReply("conv")
+    app._get_gemini_response(RequestHandle(1, "conv"), MESSAGE, make_request(mode), reply)
+    received = []
+    while not reply.queue.empty():
+        kind, value, _ = reply.queue.get_nowait()
+        received.append((kind, value))
+    return received
+
+
+def test_recorded_turn_replays_without_network(tmp_path):
+    backend = MockBackend(latency=0, tokens_per_second=0, jitter=0, reply_tokens=12, chunk_tokens=4, seed=1)
+    recording_app = make_app(tmp_path, backend)
+    recorded = run_turn(recording_app, MODE_RECORD)
+    assert [kind for kind, _ in recorded] == ["text", "text", "text", "done"]
+    assert recording_app.response_cache.stats()["items"] == 1
+
+    replay_app = make_app(tmp_path, NoNetworkBackend())
+    replayed = run_turn(replay_app, MODE_REPLAY)
+
+    assert replayed == recorded
+    assert "".join(value for kind, value in replayed if kind == "text").startswith("Odpowiedź testowa na: Jak")
+    assert replay_app.response_cache.stats()["hits"] == 1
+
+
+def test_replay_without_recording_reports_error(tmp_path):
+    app = make_app(tmp_path, NoNetworkBackend())
+    received = run_turn(app, MODE_REPLAY)
+    assert len(received) == 1
+    kind, value = received[0]
+    assert kind == "error"
+    assert "brak nagranej odpowiedzi" in value
+
+
+def test_replay_keeps_chunk_order_and_timing(tmp_path):
+    app = make_app(tmp_path, NoNetworkBackend(), replay_speed=1.0)
+    record = make_record("k", "mock-model", "Ala ma kota", [(0.0, "Ala"), (0.05, " ma"), (0.1, " kota")], 3)
+    reply = StreamingReply("conv")
+
+    started = time.perf_counter()
+    app._replay_response(RequestHandle(1, "conv"), record, None, reply)
+    elapsed = time.perf_counter() - started
+
+    items = []
+    while not reply.queue.empty():
+        items.append(reply.queue.get_nowait())
+    assert [(kind, value) for kind, value, _ in items] == [
+        ("text", "Ala"), ("text", " ma"), ("text", " kota"), ("done", 3)
+    ]
+    assert elapsed >= 0.1
+    # Fragmenty przychodzą w nagranych odstępach od początku odtwarzania
+    assert items[2][2] - items[0][2] >= 0.09
+
+
+def test_replay_stops_when_cancelled(tmp_path):
+    app = make_app(tmp_path, NoNetworkBackend())
+    record = make_record("k", "mock-model", "Ala ma kota", [(0.0, "Ala"), (0.0, " ma kota")], 3)
+    handle = RequestHandle(1, "conv")
+    handle.cancel()
+    reply = StreamingReply("conv")
+
+    app._replay_response(handle, record, None, reply)
+
+    kind, _, _ = reply.queue.get_nowait()
+    assert kind == "cancelled"
+    assert reply.queue.empty()
@@ -0,0 +1,91 @@
+import os
+import json
+
+from response_cache import ResponseCache, request_key, make_record
+
+HISTORY = [
+    {"role": "user", "parts": [{"text": "Cześć"}]},
+    {"role": "model", "parts": [{"text": "Dzień dobry"}]},
+]
+
+
+def _key(**changes):
+    args = dict(
+        model_name="gemini-1.5-flash", system_prompt="Jesteś pomocnym asystentem.",
+        history=HISTORY, message="Co słychać?", generation_config={"max_output_tokens": 256}
+    )
+    args.update(changes)
+    return request_key(**args)
+
+
+def _record(key, text):
+    return make_record(key, "gemini-1.5-flash", text, [(0.0, text)])
+
+
+def test_request_key_is_stable():
+    # Zmiana klucza unieważnia wszystkie nagrania - wymaga podbicia RECORD_VERSION
+    assert _key() == "de2fee819ca5dbb2fff5c6c63e8dc447f4057b2102d360ae54729ccebb2938cc"
+
+
+def test_request_key_ignores_dict_order():
+    reordered = [{"parts": m["parts"], "role": m["role"]} for m in HISTORY]
+    assert _key(history=reordered) == _key()
+    assert _key(generation_config={"temperature": 0.5, "max_output_tokens": 256}) == \
+        _key(generation_config={"max_output_tokens": 256, "temperature": 0.5})
+
+
+def test_request_key_depends_on_every_part():
+    keys = {
+        _key(),
+        _key(model_name="gemini-1.5-pro"),
+        _key(system_prompt="Inny prompt."),
+        _key(system_prompt=None),
+        _key(history=HISTORY[:1]),
+        _key(message="Co słychać!"),
+        _key(generation_config={"max_output_tokens": 512}),
+    }
+    assert len(keys) == 7
+    # Brak promptu systemowego i pusty prompt to to samo zapytanie
+    assert _key(system_prompt=None) == _key(system_prompt="")
+
+
+def test_put_and_get_survive_reopening(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    record = make_record("k1", "gemini-1.5-flash", "Ala ma kota", [(0.1, "Ala "), (0.25, "ma kota")], 5)
+    cache.put("k1", record)
+
+    reopened = ResponseCache(str(tmp_path))
+    assert reopened.get("k1") == record
+    assert reopened.get("k2") is None
+    assert reopened.stats()["hits"] == 1
+    assert reopened.stats()["misses"] == 1
+
+
+def test_evicts_least_recently_used_over_size_limit(tmp_path):
+    records = {key: _record(key, "x" * 200) for key in ("a", "b", "c")}
+    size = max(len(json.dumps(r, ensure_ascii=False).encode("utf-8")) for r in records.values())
+    # Mieszczą się dwa nagrania
+    cache = ResponseCache(str(tmp_path / "cache"), max_bytes=2 * size)
+
+    cache.put("a", records["a"])
+    cache.put("b", records["b"])
+    assert cache.get("a") is not None  # "a" staje się ostatnio używanym
+    cache.put("c", records["c"])
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.stats()["items"] == 2
+    assert cache.stats()["bytes"] <= cache.max_bytes
+    assert not os.path.exists(tmp_path / "cache" / "b.json")
+
+
+def test_corrupted_record_is_dropped(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.put("k", _record("k", "tekst"))
+    with open(tmp_path / "k.json", "w", encoding="utf-8") as f:
+        f.write("{niedokończony")
+
+    assert cache.get("k") is None
+    assert cache.stats()["items"] == 0
+    assert not os.path.exists(tmp_path / "k.json")
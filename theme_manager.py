@@ -1,6 +1,5 @@
 import tkinter as tk
 from tkinter import ttk
-import matplotlib.pyplot as plt
 
 # Definicje palet kolorów dla trybu jasnego i ciemnego
 LIGHT_THEME_COLORS = {
@@ -59,8 +58,10 @@ def apply_theme_colors(root_window, widgets_to_style, theme_name):
     # Konfiguracja głównego okna
     root_window.configure(bg=colors["bg"])
 
-    # Konfiguracja stylów dla widżetów ttk
-    style.theme_use('default') # Resetuj do domyślnego, aby móc nadpisać style
+    # Konfiguracja stylów dla widżetów ttk - motyw 'default' pozwala nadpisać kolory;
+    # przełączany tylko raz, bo theme_use przebudowuje style wszystkich widżetów
+    if style.theme_use() != 'default':
+        style.theme_use('default')
     
     style.configure(".", background=colors["bg"], foreground=colors["fg"]) # Domyślny styl dla wszystkich widżetów ttk
     style.configure("TFrame", background=colors["bg"])
@@ -87,61 +88,33 @@ def apply_theme_colors(root_window, widgets_to_style, theme_name):
 
 
     # Konfiguracja widżetów tk (nie-ttk) i scrolledtext (specjalne przypadki)
+    # Okna poboczne (np. wyszukiwanie) przekazują tylko część widżetów
     # ScrolledText (chat_display)
-    widgets_to_style["chat_display"].configure(bg=colors["chat_bg"], fg=colors["chat_fg"], insertbackground=colors["chat_fg"])
-    
-    # Konfiguracja tagów w scrolledtext (chat_display)
-    widgets_to_style["chat_display"].tag_config('user_prefix', foreground=colors['user_prefix_fg'])
-    widgets_to_style["chat_display"].tag_config('user_text', foreground=colors['user_text_fg'])
-    widgets_to_style["chat_display"].tag_config('bot_prefix', foreground=colors['bot_prefix_fg'])
-    widgets_to_style["chat_display"].tag_config('bot_text', foreground=colors['bot_text_fg'])
-    widgets_to_style["chat_display"].tag_config('error', foreground=colors['error_fg'])
+    chat_display = widgets_to_style.get("chat_display")
+    if chat_display is not None:
+        chat_display.configure(bg=colors["chat_bg"], fg=colors["chat_fg"], insertbackground=colors["chat_fg"])
+        
+        # Konfiguracja tagów w scrolledtext (chat_display)
+        chat_display.tag_config('user_prefix', foreground=colors['user_prefix_fg'])
+        chat_display.tag_config('user_text', foreground=colors['user_text_fg'])
+        chat_display.tag_config('bot_prefix', foreground=colors['bot_prefix_fg'])
+        chat_display.tag_config('bot_text', foreground=colors['bot_text_fg'])
+        chat_display.tag_config('error', foreground=colors['error_fg'])
+        chat_display.tag_config('search_hit', background=colors['highlight_color'])
 
     # Tk.Listbox
-    widgets_to_style["conversation_listbox"].configure(
-        bg=colors["input_bg"], fg=colors["input_fg"],
-        selectbackground=colors["selected_bg"], selectforeground=colors["selected_fg"],
-        highlightbackground=colors["border_color"], highlightcolor=colors["highlight_color"]
-    )
-    widgets_to_style["preprompt_listbox"].configure(
-        bg=colors["input_bg"], fg=colors["input_fg"],
-        selectbackground=colors["selected_bg"], selectforeground=colors["selected_fg"],
-        highlightbackground=colors["border_color"], highlightcolor=colors["highlight_color"]
-    )
+    for listbox_key in ("conversation_listbox", "preprompt_listbox", "search_listbox"):
+        listbox = widgets_to_style.get(listbox_key)
+        if listbox is None:
+            continue
+        listbox.configure(
+            bg=colors["input_bg"], fg=colors["input_fg"],
+            selectbackground=colors["selected_bg"], selectforeground=colors["selected_fg"],
+            highlightbackground=colors["border_color"], highlightcolor=colors["highlight_color"]
+        )
 
-    # Konfiguracja matplotlib dla dark mode
-    if theme_name == "dark":
-        plt.rcParams.update({
-            "figure.facecolor": colors["bg"],
-            "axes.facecolor": colors["chat_bg"],
-            "axes.edgecolor": colors["border_color"],
-            "text.color": colors["fg"],
-            "axes.labelcolor": colors["fg"],
-            "xtick.color": colors["fg"],
-            "ytick.color": colors["fg"],
-            "grid.color": colors["border_color"],
-            "font.family": "sans-serif",
-            "font.sans-serif": ["Arial", "Helvetica", "DejaVu Sans"],
-            "savefig.facecolor": colors["bg"], # Kolor tła zapisanego obrazu
-            "lines.color": colors["fg"], # Kolor linii na wykresach
-            "patch.edgecolor": colors["fg"] # Kolor krawędzi łatek (np. słupków w histogramach)
-        })
-    else: # Resetuj do domyślnych dla trybu jasnego lub do preferowanych jasnych
-        plt.rcParams.update(plt.rcParamsDefault) # Resetuj do domyślnych matplotlib
-        # Możesz ustawić konkretne jasne kolory, jeśli domyślne nie są idealne
-        plt.rcParams.update({
-            "figure.facecolor": LIGHT_THEME_COLORS["bg"],
-            "axes.facecolor": LIGHT_THEME_COLORS["chat_bg"],
-            "axes.edgecolor": LIGHT_THEME_COLORS["border_color"],
-            "text.color": LIGHT_THEME_COLORS["fg"],
-            "axes.labelcolor": LIGHT_THEME_COLORS["fg"],
-            "xtick.color": LIGHT_THEME_COLORS["fg"],
-            "ytick.color": LIGHT_THEME_COLORS["fg"],
-            "grid.color": LIGHT_THEME_COLORS["border_color"],
-            "font.family": "sans-serif",
-            "font.sans-serif": ["Arial", "Helvetica", "DejaVu Sans"],
-            "savefig.facecolor": LIGHT_THEME_COLORS["bg"],
-            "lines.color": LIGHT_THEME_COLORS["fg"],
-            "patch.edgecolor": LIGHT_THEME_COLORS["fg"]
-        })
 
+def latex_colors(theme_name):
+    """Zwraca (kolor tekstu, kolor tła) wzorów LaTeX w oknie czatu dla motywu."""
+    colors = DARK_THEME_COLORS if theme_name == "dark" else LIGHT_THEME_COLORS
+    return colors["chat_fg"], colors["chat_bg"]
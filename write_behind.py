@@ -0,0 +1,290 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict, deque
+
+
+def atomic_write_json(path, data, indent=2):
+    """Zapisuje JSON atomowo: plik tymczasowy, fsync, a następnie podmiana."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=indent, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class WriteBehindWriter:
+    """
+    Pojedynczy wątek zapisujący dane na dysk w tle.
+    Zadania są identyfikowane kluczem (np. ('conversation', id), 'config').
+    Jeśli zadanie o danym kluczu czeka jeszcze w kolejce, nowe zadanie je
+    zastępuje - kilka zapisów tej samej konwersacji daje jeden zapis na dysk.
+    """
+
+    def __init__(self, on_error=None, latency_window=200):
+        """
+        :param on_error: Funkcja wywoływana (w wątku zapisu) jako on_error(klucz, wyjątek).
+        :param latency_window: Liczba ostatnich zapisów branych do średniego czasu.
+        """
+        self.on_error = on_error
+        self._pending = OrderedDict()
+        self._cond = threading.Condition()
+        self._busy_key = None
+        self._closed = False
+
+        self.submitted = 0
+        self.written = 0
+        self.coalesced = 0
+        self.failed = 0
+        self._latencies = deque(maxlen=latency_window)
+        self._max_latency = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def submit(self, key, job):
+        """
+        Dodaje zadanie zapisu do kolejki i natychmiast wraca.
+        :param key: Klucz zadania - nowsze zadanie zastępuje czekające o tym samym kluczu.
+        :param job: Funkcja bez argumentów wykonująca zapis (na danych już skopiowanych).
+        """
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Wątek zapisu został zamknięty")
+            self.submitted += 1
+            if key in self._pending:
+                self.coalesced += 1
+                # Zachowaj pozycję w kolejce i czas pierwszego zgłoszenia
+                self._pending[key] = (job, self._pending[key][1])
+            else:
+                self._pending[key] = (job, time.perf_counter())
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                key, (job, _) = self._pending.popitem(last=False)
+                self._busy_key = key
+
+            started = time.perf_counter()
+            failed = False
+            try:
+                job()
+            except Exception as e:
+                failed = True
+                print(f"Błąd zapisu w tle ({key}): {e}")
+                if self.on_error:
+                    try:
+                        self.on_error(key, e)
+                    except Exception:
+                        pass
+            latency = time.perf_counter() - started
+
+            with self._cond:
+                self._busy_key = None
+                if failed:
+                    self.failed += 1
+                else:
+                    self.written += 1
+                self._latencies.append(latency)
+                self._max_latency = max(self._max_latency, latency)
+                self._cond.notify_all()
+
+    def is_pending(self, key):
+        """Czy zadanie o danym kluczu czeka w kolejce lub właśnie się wykonuje."""
+        with self._cond:
+            return key in self._pending or self._busy_key == key
+
+    def wait_for(self, key, timeout=None):
+        """Czeka, aż zadanie o danym kluczu zostanie zapisane."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: key not in self._pending and self._busy_key != key,
+                timeout
+            )
+
+    def flush(self, timeout=None):
+        """Czeka na opróżnienie kolejki. Zwraca False, jeśli minął timeout."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._pending and self._busy_key is None,
+                timeout
+            )
+
+    def shutdown(self, timeout=None):
+        """Zapisuje wszystko, co czeka w kolejce, i zatrzymuje wątek."""
+        with self._cond:
+            if self._closed:
+                return True
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def stats(self):
+        """Zwraca statystyki: głębokość kolejki i czasy zapisu w milisekundach."""
+        with self._cond:
+            latencies = list(self._latencies)
+            return {
+                "queue_depth": len(self._pending) + (1 if self._busy_key is not None else 0),
+                "submitted": self.submitted,
+                "written": self.written,
+                "coalesced": self.coalesced,
+                "failed": self.failed,
+                "last_latency_ms": latencies[-1] * 1000 if latencies else 0.0,
+                "avg_latency_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+                "max_latency_ms": self._max_latency * 1000,
+            }
+
+
+class ConversationWrites:
+    """
+    Zapisy konwersacji przez WriteBehindWriter z ich stanem trzymanym w pamięci,
+    dopóki nie trafią na dysk. Odczyt (load_tail) widzi stan po wszystkich
+    zleconych zapisach bez czekania na wątek zapisu. Na konwersację przypada
+    najwyżej jedna czekająca operacja: pełny zapis, dopisanie lub usunięcie.
+    Nowy pełny zapis lub usunięcie zastępuje czekającą operację, a dopisanie
+    jest do niej dołączane (nie ginie przy czekającym zapisie całości).
+    """
+
+    def __init__(self, writer, store, tracer=None):
+        """
+        :param writer: WriteBehindWriter wykonujący zapisy.
+        :param store: ConversationStore lub SQLiteConversationStore.
+        :param tracer: Opcjonalny Tracer - zapisy są mierzone jako "save_conversation.write".
+        """
+        self.writer = writer
+        self.store = store
+        self.tracer = tracer
+        self._pending = {}   # ID -> operacja czekająca w kolejce
+        self._running = {}   # ID -> operacja właśnie wykonywana
+        self._lock = threading.Lock()
+
+    # === Zlecanie ===
+    def save(self, conv_id, header, history, start=0, on_done=None):
+        """Zapis całej konwersacji (historii od indeksu `start`), jak store.save."""
+        op = {"kind": "save", "header": dict(header), "history": list(history), "start": start,
+              "callbacks": [on_done] if on_done else []}
+        self._submit(conv_id, op)
+
+    def append(self, conv_id, messages, header=None, on_done=None):
+        """Dopisanie wiadomości (i pól nagłówka) do zapisanej konwersacji, jak store.append."""
+        messages = list(messages)
+        header = dict(header or {})
+        callbacks = [on_done] if on_done else []
+        with self._lock:
+            pending = self._pending.get(conv_id)
+            if pending is not None and pending["kind"] == "delete":
+                return
+            if pending is None:
+                op = {"kind": "append", "messages": messages, "header": header, "callbacks": callbacks}
+            elif pending["kind"] == "save":
+                op = dict(pending, history=pending["history"] + messages,
+                          header=dict(pending["header"], **header), callbacks=pending["callbacks"] + callbacks)
+            else:
+                op = dict(pending, messages=pending["messages"] + messages,
+                          header=dict(pending["header"], **header), callbacks=pending["callbacks"] + callbacks)
+            self._pending[conv_id] = op
+        self._schedule(conv_id)
+
+    def delete(self, conv_id, on_done=None):
+        """Usunięcie konwersacji (zastępuje czekający zapis)."""
+        self._submit(conv_id, {"kind": "delete", "callbacks": [on_done] if on_done else []})
+
+    def _submit(self, conv_id, op):
+        with self._lock:
+            self._pending[conv_id] = op
+        self._schedule(conv_id)
+
+    def _schedule(self, conv_id):
+        # Zadanie wykonuje to, co czeka dla konwersacji w chwili startu
+        self.writer.submit(('conversation', conv_id), lambda: self._write(conv_id))
+
+    # === Wykonanie (wątek zapisu) ===
+    def _write(self, conv_id):
+        while True:
+            with self._lock:
+                op = self._pending.get(conv_id)
+            if op is None:
+                return
+            # Liczba wiadomości przed dopisaniem - odczyt rozpozna po niej, czy dopisanie już jest w pliku
+            base = self.store.message_count(conv_id) if op["kind"] == "append" else None
+            with self._lock:
+                if self._pending.get(conv_id) is op:
+                    del self._pending[conv_id]
+                    op["base"] = base
+                    self._running[conv_id] = op
+                    break
+        try:
+            if self.tracer is not None:
+                with self.tracer.span("save_conversation.write"):
+                    self._execute(conv_id, op)
+            else:
+                self._execute(conv_id, op)
+        finally:
+            with self._lock:
+                if self._running.get(conv_id) is op:
+                    del self._running[conv_id]
+        for callback in op["callbacks"]:
+            callback()
+
+    def _execute(self, conv_id, op):
+        if op["kind"] == "save":
+            self.store.save(conv_id, op["header"], op["history"], start=op["start"])
+        elif op["kind"] == "delete":
+            self.store.delete(conv_id)
+        elif self.store.get_metadata(conv_id) is not None:
+            # Konwersacja mogła zostać usunięta, zanim przyszło dopisanie
+            self.store.append(conv_id, op["messages"], op["header"])
+
+    # === Odczyt ===
+    def is_pending(self, conv_id):
+        """Czy konwersacja ma zapis, który jeszcze nie trafił na dysk."""
+        with self._lock:
+            return conv_id in self._pending or conv_id in self._running
+
+    def load_tail(self, conv_id, count):
+        """
+        Jak store.load_tail, ale z uwzględnieniem zleconych i trwających zapisów.
+        Przy czekającym pełnym zapisie nagłówek zawiera tylko pola tego zapisu.
+        :return: Krotka (nagłówek, wiadomości, indeks pierwszej z nich) lub None.
+        """
+        while True:
+            with self._lock:
+                pending = self._pending.get(conv_id)
+                running = self._running.get(conv_id)
+            if pending is not None and pending["kind"] != "append":
+                return self._state_of(pending, count)
+            if running is not None and running["kind"] != "append":
+                return self._with_append(self._state_of(running, count), pending, count)
+
+            loaded = self.store.load_tail(conv_id, count)
+            with self._lock:
+                if self._pending.get(conv_id) is not pending or self._running.get(conv_id) is not running:
+                    continue  # w trakcie odczytu zaczął się lub skończył zapis - od nowa
+            if running is not None and loaded is not None and loaded[2] + len(loaded[1]) == running["base"]:
+                loaded = self._with_append(loaded, running, count)
+            return self._with_append(loaded, pending, count)
+
+    @staticmethod
+    def _state_of(op, count):
+        if op["kind"] == "delete":
+            return None
+        history, start = op["history"], op["start"]
+        cut = max(0, len(history) - count)
+        return dict(op["header"]), history[cut:], start + cut
+
+    @staticmethod
+    def _with_append(loaded, op, count):
+        if loaded is None or op is None:
+            return loaded
+        header, history, start = loaded
+        history = history + op["messages"]
+        cut = max(0, len(history) - count)
+        return dict(header, **op["header"]), history[cut:], start + cut